@@ -19,7 +19,31 @@ Write-Host "Number of reducers: $NumReducers"
 # Define Hadoop job parameters
 $Mapper = "hadoop_mapper.py"
 $Reducer = "hadoop_reducer.py"
+# Modules imported by the mapper; jobs.py and routing.py are added below when they are used
+$Modules = "tokenizer.py"
+# Optional fused pass, e.g. unigram,bigram,docfreq,vocab (see jobs.py); one output file per job
+$Jobs = if ($env:WORDCOUNT_JOBS) { $env:WORDCOUNT_JOBS } else { "" }
 $JobName = "WordCount_$(Get-Date -Format 'yyyyMMddHHmmss')"
+# In-mapper combining window (distinct words buffered per flush, 0 disables combining)
+$CombineBuffer = if ($env:WORDCOUNT_COMBINE_BUFFER) { $env:WORDCOUNT_COMBINE_BUFFER } else { 100000 }
+# Tokenizer shared with the local engine: ascii-alpha, whitespace or unicode; stopwords 'english' or a comma-separated list
+$TokenizerMode = if ($env:WORDCOUNT_TOKENIZER) { $env:WORDCOUNT_TOKENIZER } else { "ascii-alpha" }
+$CaseFold = if ($env:WORDCOUNT_CASE_FOLD) { $env:WORDCOUNT_CASE_FOLD } else { 1 }
+$Stopwords = if ($env:WORDCOUNT_STOPWORDS) { $env:WORDCOUNT_STOPWORDS } else { "" }
+# Optional skew-aware partition plan from 'python partitioner.py plan INPUT --reducers N'
+$PartitionPlan = $env:WORDCOUNT_PARTITION_PLAN
+$GenericArgs = @()
+$StreamingArgs = @()
+if ($Jobs) {
+    $Modules = "$Modules,jobs.py"
+}
+if ($PartitionPlan) {
+    # Mapper keys become "label`tword": partition on the label only, sort on both fields
+    $Modules = "$Modules,routing.py,$PartitionPlan"
+    $GenericArgs = @("-D", "stream.num.map.output.key.fields=2", "-D", "mapreduce.partition.keypartitioner.options=-k1,1")
+    $StreamingArgs = @("-cmdenv", "WORDCOUNT_PARTITION_PLAN=$(Split-Path $PartitionPlan -Leaf)",
+                       "-partitioner", "org.apache.hadoop.mapred.lib.KeyFieldBasedPartitioner")
+}
 
 # Check if HADOOP_STREAMING_JAR environment variable is set
 if (-not $env:HADOOP_STREAMING_JAR) {
@@ -38,7 +62,14 @@ Write-Host "Submitting Hadoop streaming job..."
 & hadoop jar $env:HADOOP_STREAMING_JAR `
     -D mapred.job.name=$JobName `
     -D mapreduce.job.reduces=$NumReducers `
-    -files $Mapper,$Reducer `
+    @GenericArgs `
+    -files "$Mapper,$Reducer,$Modules" `
+    -cmdenv WORDCOUNT_COMBINE_BUFFER=$CombineBuffer `
+    -cmdenv WORDCOUNT_TOKENIZER=$TokenizerMode `
+    -cmdenv WORDCOUNT_CASE_FOLD=$CaseFold `
+    -cmdenv "WORDCOUNT_STOPWORDS=$Stopwords" `
+    -cmdenv "WORDCOUNT_JOBS=$Jobs" `
+    @StreamingArgs `
     -mapper $Mapper `
     -reducer $Reducer `
     -input $InputFile `
@@ -52,4 +83,12 @@ Write-Host "To view results: hdfs dfs -cat ${OutputDir}/part-*"
 # Optional: Merge and download results to local file
 Write-Host "Merging results to local file..."
 & hdfs dfs -getmerge $OutputDir output_file_hadoop.txt
+if ($PartitionPlan) {
+    # Salted words were spread over several reducers: sum their partial counts
+    & python partitioner.py merge $PartitionPlan output_file_hadoop.txt
+}
+if ($Jobs) {
+    # Write output_file_hadoop_<job>.txt for every job of the fused pass
+    & python jobs.py split $Jobs output_file_hadoop.txt
+}
 Write-Host "Results merged to output_file_hadoop.txt"
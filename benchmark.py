@@ -0,0 +1,159 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import platform
+import tempfile
+import subprocess
+from itertools import accumulate
+
+STAGE_PATTERN = re.compile(r'^(Splitting|Mapping|Shuffling|Reducing) completed in ([0-9.]+) seconds', re.MULTILINE)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def generate_vocabulary(vocab_size, rng):
+    # Distinct lowercase pseudo-words, 2-12 letters long
+    vocabulary = set()
+    while len(vocabulary) < vocab_size:
+        vocabulary.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 12))))
+    return sorted(vocabulary, key=lambda word: (len(word), word))
+
+def generate_zipf_corpus(filename, size_in_mb=10, vocab_size=50000, words_per_line=12, zipf_exponent=1.1, seed=42):
+    """
+    Write a synthetic corpus of roughly size_in_mb whose word frequencies follow
+    a Zipf distribution over vocab_size words. Returns the number of tokens written.
+    """
+    rng = random.Random(seed)
+    vocabulary = generate_vocabulary(vocab_size, rng)
+    cumulative_weights = list(accumulate(1.0 / rank ** zipf_exponent for rank in range(1, vocab_size + 1)))
+    target_bytes = int(size_in_mb * 1024 * 1024)
+    written_bytes = 0
+    total_tokens = 0
+    with open(filename, 'w', encoding='utf-8') as f:
+        while written_bytes < target_bytes:
+            # Generate a block of lines at a time to keep the sampling overhead low
+            words = rng.choices(vocabulary, cum_weights=cumulative_weights, k=words_per_line * 1000)
+            lines = [' '.join(words[i:i + words_per_line]) for i in range(0, len(words), words_per_line)]
+            block = '\n'.join(lines) + '\n'
+            f.write(block)
+            written_bytes += len(block)
+            total_tokens += len(words)
+    return total_tokens
+
+def run_measured(command, env=None, shell=False):
+    # Run a command to completion and return (stdout, wall seconds, peak RSS in MB).
+    # wait4's ru_maxrss is the peak RSS of the largest single process among the command and the
+    # descendants it waited for (e.g. one pool worker), not a total over the process tree.
+    start_time = time.perf_counter()
+    process = subprocess.Popen(command, env=env, shell=shell, cwd=SCRIPT_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read().decode('utf-8', errors='replace')
+    _, status, usage = os.wait4(process.pid, 0)
+    # Same exit code as Popen.returncode: negative signal number if the command was killed
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    wall_time = time.perf_counter() - start_time
+    if process.returncode != 0:
+        raise RuntimeError(f"{command} failed with exit code {process.returncode}:\n{output[-2000:]}")
+    return output, wall_time, usage.ru_maxrss / 1024
+
+def throughput(input_bytes, total_tokens, wall_time):
+    return {
+        'mb_per_second': round(input_bytes / (1024 * 1024) / wall_time, 3) if wall_time else None,
+        'tokens_per_second': round(total_tokens / wall_time) if wall_time else None,
+    }
+
+def benchmark_local(input_file, workers, total_tokens, extra_env=None):
+    """Run main.py with a pinned worker count and collect throughput and stage times."""
+    with tempfile.TemporaryDirectory() as output_dir:
+        env = dict(os.environ, INPUT_FILE=input_file, OUTPUT_FILE=os.path.join(output_dir, 'output.txt'), NUM_WORKERS=str(workers))
+        env.update(extra_env or {})
+        output, wall_time, peak_rss = run_measured([sys.executable, 'main.py'], env=env)
+    if 'Unexpected error' in output:
+        raise RuntimeError(f"main.py failed:\n{output[-2000:]}")
+    stages = {stage.lower(): float(seconds) for stage, seconds in STAGE_PATTERN.findall(output)}
+    result = {'engine': 'local', 'workers': workers, 'wall_seconds': round(wall_time, 3), 'peak_rss_mb': round(peak_rss, 1), 'stage_seconds': stages}
+    result.update(throughput(os.path.getsize(input_file), total_tokens, wall_time))
+    result.update({'env': extra_env or {}})
+    return result
+
+def benchmark_streaming(input_file, sort_parallel, total_tokens):
+    """
+    Run hadoop_mapper.py | sort | hadoop_reducer.py, the Hadoop Streaming path without a cluster.
+    The mapper and reducer are single processes; only sort runs with sort_parallel threads.
+    """
+    with tempfile.TemporaryDirectory() as output_dir:
+        command = (f'"{sys.executable}" hadoop_mapper.py < "{input_file}" '
+                   f'| LC_ALL=C sort --parallel={sort_parallel} -S 25% -T "{output_dir}" '
+                   f'| "{sys.executable}" hadoop_reducer.py > "{os.path.join(output_dir, "output.txt")}"')
+        _, wall_time, peak_rss = run_measured(command, shell=True)
+    result = {'engine': 'streaming', 'workers': 1, 'sort_parallel': sort_parallel, 'wall_seconds': round(wall_time, 3), 'peak_rss_mb': round(peak_rss, 1), 'stage_seconds': {}}
+    result.update(throughput(os.path.getsize(input_file), total_tokens, wall_time))
+    return result
+
+def benchmark_runner(input_file, workers, total_tokens):
+    """Run the streaming scripts through streaming_runner.py with `workers` mappers and reducers."""
+    with tempfile.TemporaryDirectory() as output_dir:
+        command = [sys.executable, 'streaming_runner.py', input_file, output_dir, '--mappers', str(workers), '--reducers', str(workers),
+                   '--split-size', str(max(os.path.getsize(input_file) // (4 * workers), 1024 * 1024))]
+        _, wall_time, peak_rss = run_measured(command)
+    result = {'engine': 'runner', 'workers': workers, 'wall_seconds': round(wall_time, 3), 'peak_rss_mb': round(peak_rss, 1), 'stage_seconds': {}}
+    result.update(throughput(os.path.getsize(input_file), total_tokens, wall_time))
+    return result
+
+def run_benchmarks(sizes_in_mb, worker_counts, vocab_size, words_per_line, engines, repeat=1, extra_env=None):
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        for size_in_mb in sizes_in_mb:
+            corpus = os.path.join(corpus_dir, f'zipf_{size_in_mb}mb.txt')
+            print(f"Generating {size_in_mb} MB Zipf corpus ({vocab_size} words)...", file=sys.stderr)
+            total_tokens = generate_zipf_corpus(corpus, size_in_mb, vocab_size, words_per_line)
+            for engine in engines:
+                for workers in worker_counts:
+                    for run in range(repeat):
+                        if engine == 'local':
+                            result = benchmark_local(corpus, workers, total_tokens, extra_env)
+                        elif engine == 'runner':
+                            result = benchmark_runner(corpus, workers, total_tokens)
+                        else:
+                            result = benchmark_streaming(corpus, workers, total_tokens)
+                        result.update({'size_mb': size_in_mb, 'vocab_size': vocab_size, 'tokens': total_tokens, 'run': run})
+                        parallelism = f"sort --parallel={workers}" if engine == 'streaming' else f"workers={workers}"
+                        print(f"{engine:9} {size_in_mb:>8} MB  {parallelism:<17} {result['wall_seconds']:8.2f} s  "
+                              f"{result['mb_per_second']:8.2f} MB/s  peak RSS {result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+                        report['results'].append(result)
+    return report
+
+def parse_env_overrides(pairs):
+    overrides = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition('=')
+        overrides[key] = value
+    return overrides
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the local MapReduce engine and the Hadoop streaming scripts on synthetic Zipf corpora.')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[10], help='corpus sizes in MB')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="worker counts to scale across (for the streaming engine: sort --parallel threads, its mapper and reducer are single processes)")
+    parser.add_argument('--vocab-size', type=int, default=50000)
+    parser.add_argument('--words-per-line', type=int, default=12)
+    parser.add_argument('--engines', nargs='+', choices=['local', 'streaming', 'runner'], default=['local', 'streaming'])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--env', action='append', metavar='KEY=VALUE', help='extra environment for main.py, e.g. --env MAP_ENGINE=bytes')
+    parser.add_argument('--output', default='bench_output.json', help="JSON report path, or '-' for stdout")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.workers, args.vocab_size, args.words_per_line, args.engines, args.repeat, parse_env_overrides(args.env))
+    if args.output == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}", file=sys.stderr)
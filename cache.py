@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import pickle
+import shutil
+import hashlib
+from records import MAGIC, RecordBlock, encode_records, check_block
+
+DEFAULT_CACHE_DIR = '.wordcount_cache'
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+def split_digest(split, config):
+    # Content hash of a byte range plus the map configuration that produced its partial
+    path, start, end = split
+    digest = hashlib.blake2b(config.encode('utf-8'), digest_size=16)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+def manifest_path(cache_dir, path, config):
+    key = hashlib.blake2b(f"{os.path.abspath(path)}\0{config}".encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, 'manifests', f'{key}.json')
+
+def partial_path(cache_dir, digest):
+    return os.path.join(cache_dir, 'partials', digest[:2], f'{digest}.partial')
+
+def cached_digests(cache_dir, path, splits, config):
+    """
+    Return the split digests recorded for path if its size and mtime are
+    unchanged since the last run (so nothing has to be re-hashed), else None.
+    """
+    try:
+        with open(manifest_path(cache_dir, path, config), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(path)
+    if manifest.get('size') != stat.st_size or manifest.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    if [tuple(split) for split in manifest.get('splits', [])] != [(start, end) for _, start, end in splits]:
+        return None
+    return manifest['digests']
+
+def save_manifest(cache_dir, path, splits, digests, config):
+    stat = os.stat(path)
+    manifest = {
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'splits': [(start, end) for _, start, end in splits],
+        'digests': digests,
+    }
+    write_atomic(manifest_path(cache_dir, path, config), json.dumps(manifest).encode('utf-8'))
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def has_partial(cache_dir, digest):
+    return os.path.exists(partial_path(cache_dir, digest))
+
+def load_partial(cache_dir, digest):
+    path = partial_path(cache_dir, digest)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Word count tables are stored as compressed record blocks, other outputs (NumPy tables) pickled
+        if data.startswith(MAGIC):
+            check_block(data)
+            output = RecordBlock(data)
+        else:
+            output = pickle.loads(data)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, IndexError):
+        # A corrupt or truncated partial (e.g. from a full disk) is a miss and gets mapped again
+        return None
+    # Touch on hit so eviction drops the least recently used partials first
+    os.utime(path)
+    return output
+
+def store_partial(cache_dir, digest, output):
+    if isinstance(output, RecordBlock):
+        data = output.data
+    elif isinstance(output, (dict, list)):
+        data = encode_records(output, compress=True)
+    else:
+        data = pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)
+    write_atomic(partial_path(cache_dir, digest), data)
+
+def cache_entries(cache_dir):
+    entries = []
+    for root, _, files in os.walk(os.path.join(cache_dir, 'partials')):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+def enforce_size_limit(cache_dir, max_bytes):
+    # Evict least recently used partials until the cache fits in max_bytes
+    entries = sorted(cache_entries(cache_dir))
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+    return evicted
+
+def clear_cache(cache_dir):
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    # Usage: python cache.py [stats|clear] [cache_dir]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    cache_dir = sys.argv[2] if len(sys.argv) > 2 else os.environ.get('CACHE_DIR', DEFAULT_CACHE_DIR)
+    if command == 'clear':
+        clear_cache(cache_dir)
+        print(f"Cleared cache {cache_dir}")
+    else:
+        entries = cache_entries(cache_dir)
+        print(f"Cache {cache_dir}: {len(entries)} partials, {sum(size for _, size, _ in entries) / (1024 * 1024):.2f} MB")
@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+import subprocess
+import socketserver
+from collections import deque, defaultdict
+from split_new import expand_inputs, plan_input_splits
+from mapping import split_mapper, bytes_split_mapper
+from shuffling import merge_counts, partition
+from records import RecordBlock
+from tokenizer import get_tokenizer
+
+DEFAULT_PORT = 7070
+# Agents with nothing to do ask the coordinator again after this long
+POLL_SECONDS = 0.05
+# Every message is a JSON header plus an optional binary payload (a record block), length-prefixed
+FRAME_HEADER = struct.Struct('!II')
+
+def send_message(sock, message, payload=b''):
+    header = json.dumps(message).encode('utf-8')
+    sock.sendall(FRAME_HEADER.pack(len(header), len(payload)) + header)
+    if payload:
+        sock.sendall(payload)
+
+def read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ConnectionError("Connection closed in the middle of a message.")
+    return data
+
+def recv_message(f):
+    # Returns (message, payload), or (None, b'') when the peer closed the connection
+    prefix = f.read(FRAME_HEADER.size)
+    if not prefix:
+        return None, b''
+    if len(prefix) != FRAME_HEADER.size:
+        raise ConnectionError("Connection closed in the middle of a message.")
+    header_size, payload_size = FRAME_HEADER.unpack(prefix)
+    message = json.loads(read_exact(f, header_size))
+    return message, read_exact(f, payload_size) if payload_size else b''
+
+def parse_address(address, default_port=DEFAULT_PORT):
+    host, _, port = address.rpartition(':')
+    return (host or '127.0.0.1', int(port)) if port.isdigit() else (address, default_port)
+
+class Coordinator:
+    """
+    Coordinator of a multi-node word count. Worker agents connect over TCP,
+    pull map tasks (byte-range splits of files every agent can read at the
+    same path), push each task's partitioned counts to the agent that owns
+    the partition, and finally send their reduced partitions back here.
+    Partition p is owned by agent p % num_agents.
+    """
+
+    def __init__(self, input_file, num_agents, num_reducers=None, split_size=4 * 1024 * 1024, engine='text',
+                 host='127.0.0.1', port=DEFAULT_PORT):
+        if num_agents < 1:
+            raise ValueError(f"num_agents must be at least 1, got {num_agents}.")
+        if engine not in ('text', 'bytes'):
+            raise ValueError(f"Unknown engine '{engine}', expected 'text' or 'bytes'.")
+        input_files = expand_inputs(input_file)
+        if not input_files:
+            raise FileNotFoundError(f"Input file '{input_file}' not found.")
+        self.splits = [(os.path.abspath(path), start, end) for path, start, end in plan_input_splits(input_files, split_size)]
+        self.num_agents = num_agents
+        self.num_reducers = num_reducers or num_agents
+        self.engine = engine
+        self.address = (host, port)
+        self.lock = threading.Lock()
+        self.agents = []
+        self.registered = threading.Event()
+        self.finished = threading.Event()
+        self.pending = deque(range(len(self.splits)))
+        self.in_flight = {}
+        self.done = set()
+        self.results = {}
+        self.exited = 0
+        self.error = None
+        self.stats = defaultdict(int)
+        self.server = None
+
+    def start(self):
+        """Start accepting agents in a background thread and return the bound (host, port)."""
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                coordinator.handle_agent(self.connection, self.rfile)
+
+        self.server = socketserver.ThreadingTCPServer(self.address, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.address = self.server.server_address
+        return self.address
+
+    def job_config(self):
+        owners = [self.agents[p % self.num_agents]['data'] for p in range(self.num_reducers)]
+        tokenizer = [os.environ.get('TOKENIZER', 'ascii-alpha'), os.environ.get('CASE_FOLD', '1') != '0', os.environ.get('STOPWORDS', '')]
+        return {'type': 'job', 'reducers': owners, 'engine': self.engine, 'tokenizer': tokenizer}
+
+    def handle_agent(self, connection, rfile):
+        agent = None
+        try:
+            while True:
+                message, payload = recv_message(rfile)
+                if message is None:
+                    break
+                kind = message['type']
+                if kind == 'hello':
+                    agent = self.register(message)
+                    if agent is None:
+                        # Turn away an agent beyond num_agents without disturbing the job
+                        send_message(connection, {'type': 'exit', 'error': "All agent slots are taken."})
+                        return
+                    if not self.registered.wait(message.get('timeout')):
+                        raise RuntimeError("Timed out waiting for the other agents.")
+                    send_message(connection, dict(self.job_config(), agent=agent['id']))
+                elif kind == 'next':
+                    send_message(connection, self.next_work(agent))
+                    if self.finished.is_set() and agent['exited']:
+                        break
+                elif kind == 'done':
+                    with self.lock:
+                        self.in_flight.pop(message['task'], None)
+                        self.done.add(message['task'])
+                        agent['tasks'] += 1
+                        self.stats['map_records'] += message['records']
+                        self.stats['pushed_bytes'] += message['pushed_bytes']
+                elif kind == 'result':
+                    with self.lock:
+                        self.results[message['partition']] = RecordBlock(payload)
+                        if len(self.results) == self.num_reducers:
+                            self.finished.set()
+                elif kind == 'error':
+                    self.fail(f"Agent {agent['id']} failed: {message['error']}")
+        except (OSError, ValueError, RuntimeError) as e:
+            self.fail(f"Agent {agent['id'] if agent else '?'} connection error: {e}")
+        if agent is not None and not agent['exited'] and not self.finished.is_set():
+            # A lost agent also loses the partitions it owns, so the job cannot complete
+            self.fail(f"Agent {agent['id']} disconnected before the job finished.")
+
+    def register(self, message):
+        # Returns None when all num_agents slots are taken
+        with self.lock:
+            if len(self.agents) >= self.num_agents:
+                return None
+            agent = {'id': len(self.agents), 'name': message.get('name'), 'data': message['data'], 'tasks': 0, 'exited': False, 'reduce_sent': False}
+            self.agents.append(agent)
+            if len(self.agents) == self.num_agents:
+                self.registered.set()
+            return agent
+
+    def next_work(self, agent):
+        with self.lock:
+            if self.error or self.finished.is_set():
+                agent['exited'] = True
+                self.exited += 1
+                return {'type': 'exit'}
+            if self.pending:
+                task = self.pending.popleft()
+                self.in_flight[task] = agent['id']
+                return {'type': 'map', 'task': task, 'split': self.splits[task]}
+            if len(self.done) == len(self.splits) and not agent['reduce_sent']:
+                agent['reduce_sent'] = True
+                return {'type': 'reduce', 'partitions': list(range(agent['id'], self.num_reducers, self.num_agents))}
+            return {'type': 'wait'}
+
+    def fail(self, error):
+        with self.lock:
+            if self.error is None and not self.finished.is_set():
+                self.error = error
+        self.finished.set()
+
+    def wait(self, timeout=None):
+        """Wait for the job and return the merged word -> count table."""
+        if not self.finished.wait(timeout):
+            self.fail("Timed out waiting for the job to finish.")
+        # Give agents a moment to pick up their exit message before the server goes away
+        deadline = time.monotonic() + 5
+        while self.exited < len(self.agents) and time.monotonic() < deadline:
+            time.sleep(POLL_SECONDS)
+        self.server.shutdown()
+        self.server.server_close()
+        if self.error:
+            raise RuntimeError(self.error)
+        word_counts = {}
+        for p in range(self.num_reducers):
+            # Partitions are disjoint, so merging is a plain update
+            word_counts.update(self.results[p].items())
+        return word_counts
+
+class WorkerAgent:
+    """
+    Worker agent: runs map tasks pulled from the coordinator, pushes each
+    partition of a task's output to its owning agent, and reduces the
+    partitions it owns. Pushed buckets are kept per task id, so a task that
+    runs twice is not counted twice.
+    """
+
+    def __init__(self, coordinator_address, name=None, timeout=None):
+        self.coordinator_address = coordinator_address
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.buckets = defaultdict(dict)
+        self.peers = {}
+        self.data_server = None
+        self.data_address = None
+
+    def start_data_server(self, host):
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    message, payload = recv_message(self.rfile)
+                    if message is None:
+                        return
+                    agent.store(message['partition'], message['task'], RecordBlock(payload))
+                    send_message(self.connection, {'type': 'ack'})
+
+        self.data_server = socketserver.ThreadingTCPServer((host, 0), Handler)
+        self.data_server.daemon_threads = True
+        threading.Thread(target=self.data_server.serve_forever, daemon=True).start()
+        self.data_address = list(self.data_server.server_address)
+
+    def store(self, partition_number, task, block):
+        with self.lock:
+            self.buckets[partition_number][task] = block
+
+    def push(self, owner, partition_number, task, block):
+        if owner == self.data_address:
+            self.store(partition_number, task, block)
+            return
+        peer = self.peers.get(tuple(owner))
+        if peer is None:
+            sock = socket.create_connection(tuple(owner))
+            peer = self.peers[tuple(owner)] = (sock, sock.makefile('rb'))
+        send_message(peer[0], {'type': 'push', 'partition': partition_number, 'task': task}, block.data)
+        reply, _ = recv_message(peer[1])
+        if reply is None:
+            raise ConnectionError(f"Agent at {owner[0]}:{owner[1]} closed the connection.")
+
+    def map_task(self, task, split, job, tokenizer):
+        split = tuple(split)
+        if job['engine'] == 'bytes':
+            output = bytes_split_mapper(split, tokenizer)
+        else:
+            output = split_mapper(split, True, tokenizer)
+        pushed_bytes = 0
+        for partition_number, bucket in enumerate(partition(output, len(job['reducers']))):
+            if bucket:
+                block = RecordBlock.encode(bucket)
+                self.push(job['reducers'][partition_number], partition_number, task, block)
+                pushed_bytes += len(block.data)
+        return {'type': 'done', 'task': task, 'records': len(output), 'pushed_bytes': pushed_bytes}
+
+    def reduce_partition(self, partition_number):
+        with self.lock:
+            blocks = list(self.buckets.pop(partition_number, {}).values())
+        return RecordBlock.encode(merge_counts(blocks))
+
+    def run(self):
+        """Work for the coordinator until it says the job is over."""
+        with socket.create_connection(self.coordinator_address) as sock:
+            rfile = sock.makefile('rb')
+            # Serve pushes on the interface that reaches the coordinator, so other agents can reach it too
+            self.start_data_server(sock.getsockname()[0])
+            try:
+                send_message(sock, {'type': 'hello', 'name': self.name, 'data': self.data_address, 'timeout': self.timeout})
+                job, _ = recv_message(rfile)
+                if job is None:
+                    raise ConnectionError("Coordinator closed the connection.")
+                if job['type'] == 'exit':
+                    raise RuntimeError(f"Coordinator turned the agent away: {job['error']}")
+                tokenizer = get_tokenizer(*job['tokenizer'])
+                while True:
+                    send_message(sock, {'type': 'next'})
+                    work, _ = recv_message(rfile)
+                    if work is None or work['type'] == 'exit':
+                        return
+                    if work['type'] == 'wait':
+                        time.sleep(POLL_SECONDS)
+                    elif work['type'] == 'map':
+                        try:
+                            send_message(sock, self.map_task(work['task'], work['split'], job, tokenizer))
+                        except (OSError, ValueError) as e:
+                            send_message(sock, {'type': 'error', 'error': f"task {work['task']}: {type(e).__name__}: {e}"})
+                    elif work['type'] == 'reduce':
+                        for partition_number in work['partitions']:
+                            block = self.reduce_partition(partition_number)
+                            send_message(sock, {'type': 'result', 'partition': partition_number}, block.data)
+            finally:
+                self.data_server.shutdown()
+                self.data_server.server_close()
+                for peer_sock, peer_file in self.peers.values():
+                    peer_file.close()
+                    peer_sock.close()
+
+def run_local_cluster(input_file, num_agents=2, num_reducers=None, split_size=4 * 1024 * 1024, engine='text', timeout=None):
+    """Run a job with num_agents agent processes on loopback; returns the coordinator and the word counts."""
+    coordinator = Coordinator(input_file, num_agents, num_reducers, split_size, engine, port=0)
+    host, port = coordinator.start()
+    script = os.path.abspath(__file__)
+    agents = [subprocess.Popen([sys.executable, script, 'agent', '--coordinator', f'{host}:{port}'], cwd=os.path.dirname(script))
+              for _ in range(num_agents)]
+    try:
+        word_counts = coordinator.wait(timeout)
+    finally:
+        for agent in agents:
+            try:
+                agent.wait(10)
+            except subprocess.TimeoutExpired:
+                agent.kill()
+    return coordinator, word_counts
+
+def write_counts(output_file, word_counts):
+    ranked_words = sorted(word_counts.items(), key=lambda x: x[1], reverse=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for word, count in ranked_words:
+            f.write(f"{word} {count}\n")
+    return ranked_words[:10]
+
+def print_summary(coordinator, word_counts, output_file, elapsed):
+    print(f"Cluster Details:\nAgents: {coordinator.num_agents}\nReducers: {coordinator.num_reducers}\nMap Tasks: {len(coordinator.splits)}")
+    for agent in coordinator.agents:
+        print(f"Agent {agent['id']} ({agent['name']}): {agent['tasks']} map tasks")
+    print(f"Pushed Bytes: {coordinator.stats['pushed_bytes']}\nDistinct Words: {len(word_counts)}")
+    top_10_words = write_counts(output_file, word_counts)
+    print("Top 10 Word Frequencies:")
+    for word, count in top_10_words:
+        print(f"{word}: {count}")
+    print(f"Job completed in {elapsed:.2f} seconds. Output written to {output_file}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a word count across several hosts with a coordinator and worker agents.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    coordinator_parser = subparsers.add_parser('coordinator', help='plan the job and wait for agents')
+    local_parser = subparsers.add_parser('local', help='run a coordinator and N agents on this machine (loopback)')
+    for subparser in (coordinator_parser, local_parser):
+        subparser.add_argument('input', help='input file, directory or glob (same path on every agent)')
+        subparser.add_argument('--agents', type=int, default=2, help='number of agents taking part in the job')
+        subparser.add_argument('--reducers', type=int, default=None, help='reduce partitions (default: one per agent)')
+        subparser.add_argument('--split-size', type=int, default=4 * 1024 * 1024)
+        subparser.add_argument('--engine', choices=['text', 'bytes'], default='text')
+        subparser.add_argument('--output', default='output_file.txt')
+        subparser.add_argument('--timeout', type=float, default=None, help='seconds before the job is abandoned')
+    coordinator_parser.add_argument('--host', default='127.0.0.1', help="interface to listen on, e.g. 0.0.0.0 for remote agents")
+    coordinator_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    agent_parser = subparsers.add_parser('agent', help='work for a coordinator')
+    agent_parser.add_argument('--coordinator', default=f'127.0.0.1:{DEFAULT_PORT}', help='coordinator host:port')
+    agent_parser.add_argument('--name', default=None)
+    agent_parser.add_argument('--timeout', type=float, default=None, help='seconds to wait for the other agents to join')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'agent':
+            WorkerAgent(parse_address(args.coordinator), args.name, args.timeout).run()
+        else:
+            start_time = time.perf_counter()
+            if args.command == 'local':
+                coordinator, word_counts = run_local_cluster(args.input, args.agents, args.reducers, args.split_size, args.engine, args.timeout)
+            else:
+                coordinator = Coordinator(args.input, args.agents, args.reducers, args.split_size, args.engine, args.host, args.port)
+                host, port = coordinator.start()
+                print(f"Coordinator listening on {host}:{port}, waiting for {args.agents} agents ({len(coordinator.splits)} map tasks)")
+                word_counts = coordinator.wait(args.timeout)
+            print_summary(coordinator, word_counts, args.output, time.perf_counter() - start_time)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
@@ -0,0 +1,159 @@
+import sys
+import zlib
+import heapq
+from array import array
+
+# Open-addressing index: -1 marks an empty slot; grown to keep the load factor under MAX_LOAD
+EMPTY = -1
+MAX_LOAD = 0.66
+MIN_SLOTS = 8
+
+class CountTable:
+    """
+    Compact word -> count table. Words are stored once, UTF-8 encoded, in a
+    single bytearray arena; entry i spans arena[offsets[i]:offsets[i + 1]]
+    and its count is counts[i]. A linear-probing index of entry numbers,
+    keyed by a stored crc32 of each word, replaces the dict.
+
+    Memory per key is the word's UTF-8 length plus about 30 bytes (8 offset,
+    8 count, 4 hash and 6-12 index bytes), against roughly 100 bytes for a
+    str key with an int value in a dict. Entries keep insertion order and the
+    table pickles as a handful of flat buffers.
+    """
+
+    def __init__(self, slots=MIN_SLOTS):
+        self.arena = bytearray()
+        self.offsets = array('q', [0])
+        self.counts = array('q')
+        self.hashes = array('I')
+        self.index = array('i', [EMPTY]) * slots
+
+    @classmethod
+    def from_counts(cls, word_counts):
+        # Build from a word -> count mapping or an iterable of (word, count) pairs
+        if isinstance(word_counts, CountTable):
+            return word_counts
+        table = cls()
+        table.update(word_counts)
+        return table
+
+    def __len__(self):
+        return len(self.counts)
+
+    def key(self, entry):
+        return self.arena[self.offsets[entry]:self.offsets[entry + 1]]
+
+    def find(self, key, key_hash):
+        # Index slot holding key, or the empty slot where it would be inserted
+        if self.index is None:
+            self.build_index(MIN_SLOTS)
+        index = self.index
+        mask = len(index) - 1
+        slot = key_hash & mask
+        while True:
+            entry = index[slot]
+            if entry == EMPTY:
+                return slot
+            if self.hashes[entry] == key_hash and self.arena[self.offsets[entry]:self.offsets[entry + 1]] == key:
+                return slot
+            slot = (slot + 1) & mask
+
+    def add_key(self, key, count=1, key_hash=None):
+        # key is the UTF-8 encoded word
+        if key_hash is None:
+            key_hash = zlib.crc32(key)
+        slot = self.find(key, key_hash)
+        entry = self.index[slot]
+        if entry != EMPTY:
+            self.counts[entry] += count
+            return
+        entry = len(self.counts)
+        self.index[slot] = entry
+        self.arena += key
+        self.offsets.append(len(self.arena))
+        self.counts.append(count)
+        self.hashes.append(key_hash)
+        if len(self.counts) > len(self.index) * MAX_LOAD:
+            self.grow()
+
+    def add(self, word, count=1):
+        self.add_key(word.encode('utf-8'), count)
+
+    def grow(self):
+        self.build_index(len(self.index) * 2)
+
+    def build_index(self, slots):
+        # (Re)insert every entry number using the stored hashes, with at least `slots` slots
+        while len(self.counts) > slots * MAX_LOAD:
+            slots *= 2
+        index = array('i', [EMPTY]) * slots
+        mask = len(index) - 1
+        for entry, key_hash in enumerate(self.hashes):
+            slot = key_hash & mask
+            while index[slot] != EMPTY:
+                slot = (slot + 1) & mask
+            index[slot] = entry
+        self.index = index
+
+    def update(self, word_counts):
+        if isinstance(word_counts, CountTable):
+            # Merge table to table without decoding words or recomputing hashes
+            for entry in range(len(word_counts)):
+                self.add_key(word_counts.key(entry), word_counts.counts[entry], word_counts.hashes[entry])
+            return
+        pairs = word_counts.items() if hasattr(word_counts, 'items') else word_counts
+        for word, count in pairs:
+            self.add_key(word.encode('utf-8'), count)
+
+    def get(self, word, default=None):
+        key = word.encode('utf-8')
+        # find() first: it rebuilds the index of an unpickled table
+        slot = self.find(key, zlib.crc32(key))
+        entry = self.index[slot]
+        return default if entry == EMPTY else self.counts[entry]
+
+    def __getitem__(self, word):
+        count = self.get(word)
+        if count is None:
+            raise KeyError(word)
+        return count
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def word(self, entry):
+        return self.key(entry).decode('utf-8')
+
+    def keys(self):
+        return (self.word(entry) for entry in range(len(self)))
+
+    def items(self):
+        # Words are decoded one at a time, so iterating never materializes the whole table
+        return ((self.word(entry), self.counts[entry]) for entry in range(len(self)))
+
+    def __iter__(self):
+        return self.keys()
+
+    def most_common(self, n):
+        # Ties keep insertion order, like Counter.most_common
+        ranked = heapq.nlargest(n, range(len(self)), key=self.counts.__getitem__)
+        return [(self.word(entry), self.counts[entry]) for entry in ranked]
+
+    def ranked_items(self):
+        # Items by descending count; only the entry numbers are sorted, words are decoded as they are written
+        ranked = array('q', sorted(range(len(self)), key=self.counts.__getitem__, reverse=True))
+        return ((self.word(entry), self.counts[entry]) for entry in ranked)
+
+    def __getstate__(self):
+        # The index is not pickled; it is rebuilt from the hashes on first lookup
+        state = self.__dict__.copy()
+        state['index'] = None
+        return state
+
+    def nbytes(self):
+        return sum(sys.getsizeof(buffer) for buffer in (self.arena, self.offsets, self.counts, self.hashes, self.index or b''))
+
+if __name__ == '__main__':
+    table = CountTable.from_counts({'hello': 2, 'world': 1})
+    table.update([('hello', 1), ('mapreduce', 1)])
+    print(list(table.items()), table.most_common(1), f"{table.nbytes() / len(table):.0f} bytes per key")
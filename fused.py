@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import os
+import time
+from multiprocessing import Pool
+from split_new import expand_inputs, plan_input_splits, is_compressed
+from mapping import read_compressed_batches, decode_split, read_split
+from shuffling import merge_counts, partition
+from reduce import reduce_partition
+from tokenizer import tokenizer_from_env
+from jobs import TOTALS, map_documents, write_outputs
+
+# Local engine of a fused pass (JOBS in main.py); the job definitions in jobs.py are shared with hadoop_mapper.py
+
+def fused_split_mapper(split, aggregations, num_reducers=1, tokenizer=None):
+    """
+    Map one split for all aggregations at once: the split is read and
+    tokenized a single time, and every aggregation counts into its table.
+    With num_reducers > 1, each table is partitioned for the reducers.
+    """
+    tokenizer = tokenizer or tokenizer_from_env()
+    if is_compressed(split[0]):
+        texts = (decode_split(batch, split) for batch in read_compressed_batches(split[0]))
+    else:
+        texts = [read_split(split)]
+    tables = {}
+    for text in texts:
+        map_documents(aggregations, tokenizer.tokenize_lines(text), tables)
+    if num_reducers > 1:
+        return {table: partition(counts, num_reducers) for table, counts in tables.items()}
+    return tables
+
+def reduce_tables(pool, mapper_outputs, tables, num_reducers=1):
+    # Merge every table's map outputs; partitions are disjoint, so partitioned tables are reduced in parallel
+    if num_reducers == 1:
+        return {table: merge_counts(output.get(table, {}) for output in mapper_outputs) for table in tables}
+    reduce_inputs = [[output[table][i] for output in mapper_outputs if table in output] for table in tables for i in range(num_reducers)]
+    reduced = {table: {} for table in tables}
+    for index, reduced_partition in enumerate(pool.map(reduce_partition, reduce_inputs)):
+        reduced[tables[index // num_reducers]].update(reduced_partition)
+    return reduced
+
+def run_fused_job(input_file, aggregations, output_file='output_file.txt', split_size=4 * 1024 * 1024, num_processes=None, num_reducers=1):
+    """
+    Run several aggregations over the input in one map/shuffle/reduce pass.
+    Returns {job name: output file}.
+    """
+    input_files = expand_inputs(input_file)
+    if not input_files:
+        raise FileNotFoundError(f"Input file '{input_file}' not found.")
+    splits = plan_input_splits(input_files, split_size)
+    tables = sorted({aggregation.table for aggregation in aggregations}) + [TOTALS]
+    num_processes = num_processes or min(os.cpu_count() or 4, max(len(splits), 1))
+    print(f"Fused Job Details:\nJobs: {', '.join(aggregation.name for aggregation in aggregations)}\nTables: {', '.join(tables)}\nMap Tasks: {len(splits)}")
+    with Pool(processes=num_processes) as pool:
+        start_time = time.time()
+        mapper_outputs = pool.starmap(fused_split_mapper, [(split, aggregations, num_reducers) for split in splits])
+        print(f"Mapping completed in {time.time() - start_time:.2f} seconds with {num_processes} parallel mapper processes.")
+        start_time = time.time()
+        reduced = reduce_tables(pool, mapper_outputs, tables, num_reducers)
+        del mapper_outputs
+        print(f"Reducing completed in {time.time() - start_time:.2f} seconds with {num_reducers} reducer{'s' if num_reducers > 1 else ''} per table.")
+    output_files = write_outputs(aggregations, reduced, output_file)
+    for aggregation in aggregations:
+        print(f"Wrote {len(reduced.get(aggregation.table, {}))} {aggregation.table} keys for {aggregation.name} to {output_files[aggregation.name]}")
+    return output_files
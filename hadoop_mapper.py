@@ -1,29 +1,106 @@
 #!/usr/bin/env python3
 # filepath: d:\EDU\MapReduce-WordCount-Python-main\hadoop_mapper.py
 
+import os
 import sys
-import re
+from collections import Counter
+
+# Hadoop ships tokenizer.py (-files) into the task's working directory, plus routing.py with a
+# partition plan and jobs.py with a fused pass; those are only imported when their variable is set
+sys.path.append(os.getcwd())
+from tokenizer import tokenizer_from_env, decode_text
+
+# In-mapper combining window: partial counts are flushed once this many distinct
+# words are buffered (0 emits one "word\t1" record per token)
+DEFAULT_COMBINE_BUFFER = 100000
+# Bytes of input read per batch
+READ_BATCH_SIZE = 1024 * 1024
+
+def emit_counts(word_counts, output, partitioner=None, salt=0):
+    if partitioner:
+        # "label\tword\tcount": KeyFieldBasedPartitioner routes on the label, the reducer drops it
+        output.write(b''.join(b'%s\t%s\t%d\n' % (partitioner.route(word, salt), word, count) for word, count in word_counts.items()))
+    else:
+        output.write(b''.join(b'%s\t%d\n' % (word, count) for word, count in word_counts.items()))
+
+def emit_raw_counts(raw_counts, tokenizer, output, partitioner=None, salt=0):
+    # Decode and normalize only the distinct raw tokens of the window, like the local bytes engine
+    word_counts = tokenizer.normalize_raw_counts(raw_counts)
+    emit_counts({word.encode('utf-8'): count for word, count in word_counts.items()}, output, partitioner, salt)
+
+def emit_tables(tagged_records, output, partitioner=None, salt=0):
+    # Fused jobs: one "table:key\tcount" record per key of every table
+    emit_counts({key.encode('utf-8'): count for key, count in tagged_records}, output, partitioner, salt)
 
 def main():
     """
     Hadoop Streaming mapper function for word count.
-    Reads lines from stdin and outputs (word, 1) pairs.
+    Reads lines from stdin and outputs (word, count) pairs, combining counts
+    in memory so each distinct word is emitted once per buffer window.
     """
-    # Regular expression to split words and remove punctuation
-    word_pattern = re.compile(r'[A-Za-z]+')
-    
-    # Process each line from standard input
-    for line in sys.stdin:
-        # Remove leading/trailing whitespace and convert to lowercase
-        line = line.strip().lower()
-        
-        # Find all words in the line
-        words = word_pattern.findall(line)
-        
-        # Emit intermediate key-value pairs
-        for word in words:
+    # Same tokenizer as the local engine, configured by WORDCOUNT_TOKENIZER, WORDCOUNT_CASE_FOLD
+    # and WORDCOUNT_STOPWORDS (default: lowercased runs of ASCII letters)
+    tokenizer = tokenizer_from_env('WORDCOUNT_')
+    combine_buffer = int(os.environ.get('WORDCOUNT_COMBINE_BUFFER', DEFAULT_COMBINE_BUFFER))
+    # Skew-aware partition plan written by 'partitioner.py plan' (see run_hadoop.sh)
+    plan_file = os.environ.get('WORDCOUNT_PARTITION_PLAN')
+    partitioner = None
+    if plan_file:
+        from routing import PlanRouter
+        partitioner = PlanRouter.load(plan_file)
+    # Salted words rotate over their partitions with every flush, starting from a per-task offset
+    salt = os.getpid()
+    # Fused pass (see jobs.py): WORDCOUNT_JOBS lists the aggregations computed from one tokenization
+    # of each line; the combining window then counts the keys of all tables
+    jobs_spec = os.environ.get('WORDCOUNT_JOBS')
+    aggregations = None
+    if jobs_spec:
+        from jobs import parse_jobs, map_documents, tagged_records
+        aggregations = parse_jobs(jobs_spec)
+    tables = {}
+
+    # Binary stdin/stdout with large batches instead of one text print per token
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    raw_counts = Counter()
+
+    while True:
+        lines = stdin.readlines(READ_BATCH_SIZE)
+        if not lines:
+            break
+
+        # Normalize and tokenize the whole batch at once
+        batch = b''.join(lines)
+
+        if aggregations:
+            # Every line is a document; WORDCOUNT_COMBINE_BUFFER=0 flushes after each batch. Lines that
+            # are not valid UTF-8 are read as Latin-1, like in the splits of the local fused pass
+            map_documents(aggregations, tokenizer.tokenize_lines(decode_text(batch)), tables)
+            if sum(map(len, tables.values())) >= combine_buffer:
+                emit_tables(tagged_records(tables), stdout, partitioner, salt)
+                tables.clear()
+                salt += 1
+        elif combine_buffer:
+            # Raw tokens are normalized and stopwords dropped when the window is flushed
+            # (Unicode mode needs decoded text, so its tokens are normalized right away)
+            raw_counts.update(tokenizer.scan_bytes(batch) if tokenizer.bytes_native else tokenizer.tokenize_bytes(batch, filter_stopwords=False))
+            if len(raw_counts) >= combine_buffer:
+                emit_raw_counts(raw_counts, tokenizer, stdout, partitioner, salt)
+                raw_counts.clear()
+                salt += 1
+        elif partitioner:
+            # Format output as: label\tword\t1
+            stdout.write(b''.join(b'%s\t%s\t1\n' % (partitioner.route(word, salt + offset), word)
+                                  for offset, word in enumerate(tokenizer.tokenize_bytes(batch))))
+            salt += 1
+        else:
             # Format output as: word\t1
-            print(f"{word}\t1")
+            stdout.write(b''.join(word + b'\t1\n' for word in tokenizer.tokenize_bytes(batch)))
+
+    emit_raw_counts(raw_counts, tokenizer, stdout, partitioner, salt)
+    if aggregations:
+        emit_tables(tagged_records(tables), stdout, partitioner, salt)
+    stdout.flush()
 
 if __name__ == "__main__":
     main()
@@ -3,20 +3,26 @@
 
 import sys
 
+# Number of output records collected before each write to stdout
+WRITE_BATCH_SIZE = 10000
+
 def main():
     """
     Hadoop Streaming reducer function for word count.
     Reads (word, count) pairs from stdin, aggregates by word, and outputs totals.
+    Records routed by a partition plan carry a "label\t" prefix, which is dropped.
     """
     current_word = None
     current_count = 0
+    output = []
+    stdout = sys.stdout.buffer
 
     # Process each line from standard input
     # Input is sorted by key (word) from Hadoop shuffle phase
-    for line in sys.stdin:
+    for line in sys.stdin.buffer:
         # Parse the input from mapper
-        line = line.strip()
-        word, count = line.split('\t', 1)
+        word, _, count = line.strip().rpartition(b'\t')
+        word = word[word.find(b'\t') + 1:]
         
         try:
             count = int(count)
@@ -31,7 +37,10 @@ def main():
             # We've encountered a new word
             # Output the previous word's result (except for the first word)
             if current_word:
-                print(f"{current_word}\t{current_count}")
+                output.append(b'%s\t%d\n' % (current_word, current_count))
+                if len(output) >= WRITE_BATCH_SIZE:
+                    stdout.write(b''.join(output))
+                    output.clear()
                 
             # Reset for the new word
             current_word = word
@@ -39,7 +48,9 @@ def main():
     
     # Output the final word's count
     if current_word:
-        print(f"{current_word}\t{current_count}")
+        output.append(b'%s\t%d\n' % (current_word, current_count))
+    stdout.write(b''.join(output))
+    stdout.flush()
 
 if __name__ == "__main__":
     main()
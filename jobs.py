@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import argparse
+from abc import ABC, abstractmethod
+from itertools import chain
+from collections import Counter
+
+NGRAM_NAMES = {'unigram': 1, 'bigram': 2, 'trigram': 3}
+# Job-level totals, reduced like any other table
+TOTALS = 'totals'
+
+class Aggregation(ABC):
+    """
+    One job of a fused pass. Every aggregation maps the tokenized documents
+    of a split (one list of tokens per line) into a count table, and writes
+    its reduced table to its own output file. Aggregations with the same
+    table name share that table, so it is only built once.
+    """
+    name = None
+    table = None
+
+    @abstractmethod
+    def map_documents(self, documents, counts):
+        pass
+
+    def write_output(self, output_file, counts, totals):
+        # Ranked by count, in the same "key count" format as main.py
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for key, count in sorted(counts.items(), key=lambda x: x[1], reverse=True):
+                f.write(f"{key} {count}\n")
+
+class NGramCount(Aggregation):
+    """Counts of n consecutive words within a line; n=1 is the plain word count."""
+
+    def __init__(self, n):
+        self.n = n
+        self.name = next((name for name, size in NGRAM_NAMES.items() if size == n), f'{n}gram')
+        self.table = f'{n}gram'
+
+    def map_documents(self, documents, counts):
+        if self.n == 1:
+            counts.update(chain.from_iterable(documents))
+            return
+        counts.update(chain.from_iterable(map(' '.join, zip(*(tokens[i:] for i in range(self.n)))) for tokens in documents))
+
+class DocumentFrequency(Aggregation):
+    """Number of documents (lines) each word occurs in."""
+    name = 'docfreq'
+    table = 'docfreq'
+
+    def map_documents(self, documents, counts):
+        counts.update(chain.from_iterable(map(set, documents)))
+
+class VocabularyStats(Aggregation):
+    """Corpus statistics, computed from the word counts and the job totals."""
+    name = 'vocab'
+    table = '1gram'
+
+    def map_documents(self, documents, counts):
+        counts.update(chain.from_iterable(documents))
+
+    def write_output(self, output_file, counts, totals):
+        tokens = totals.get('tokens', 0)
+        documents = totals.get('documents', 0)
+        stats = [('documents', documents), ('tokens', tokens), ('distinct_words', len(counts)),
+                 ('hapax_legomena', sum(1 for count in counts.values() if count == 1)),
+                 ('type_token_ratio', f"{len(counts) / tokens if tokens else 0:.6f}"),
+                 ('mean_document_length', f"{tokens / documents if documents else 0:.2f}")]
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for name, value in stats:
+                f.write(f"{name} {value}\n")
+
+def parse_jobs(spec):
+    """
+    Aggregations from a comma-separated list: unigram, bigram, trigram,
+    <N>gram, docfreq and vocab.
+    """
+    aggregations = {}
+    for name in (name.strip() for name in spec.split(',')):
+        if not name or name in aggregations:
+            continue
+        match = re.fullmatch(r'([1-9][0-9]*)gram', name)
+        if name in NGRAM_NAMES or match:
+            aggregation = NGramCount(NGRAM_NAMES.get(name) or int(match.group(1)))
+        elif name == 'docfreq':
+            aggregation = DocumentFrequency()
+        elif name == 'vocab':
+            aggregation = VocabularyStats()
+        else:
+            raise ValueError(f"Unknown job '{name}', expected unigram, bigram, trigram, <N>gram, docfreq or vocab.")
+        aggregations[aggregation.name] = aggregation
+    if not aggregations:
+        raise ValueError("No jobs given.")
+    return list(aggregations.values())
+
+def job_output_file(output_file, name):
+    # output_file.txt -> output_file_bigram.txt
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_{name}{ext or '.txt'}"
+
+def map_documents(aggregations, documents, tables):
+    # Run every table's aggregation once over the documents, and count the job totals
+    mapped = set()
+    for aggregation in aggregations:
+        if aggregation.table not in mapped:
+            aggregation.map_documents(documents, tables.setdefault(aggregation.table, Counter()))
+            mapped.add(aggregation.table)
+    totals = tables.setdefault(TOTALS, Counter())
+    totals['documents'] += sum(1 for tokens in documents if tokens)
+    totals['tokens'] += sum(map(len, documents))
+    return tables
+
+def write_outputs(aggregations, reduced, output_file):
+    output_files = {}
+    for aggregation in aggregations:
+        output_files[aggregation.name] = job_output_file(output_file, aggregation.name)
+        aggregation.write_output(output_files[aggregation.name], reduced.get(aggregation.table, {}), reduced.get(TOTALS, {}))
+    return output_files
+
+def tagged_records(tables):
+    # Records of a fused hadoop_mapper.py: "table:key" keys, summed by hadoop_reducer.py like words
+    for table, counts in tables.items():
+        for key, count in counts.items():
+            yield f"{table}:{key}", count
+
+def read_tagged_output(lines):
+    # Tables back from the "table:key\tcount" lines of a fused streaming job's output
+    tables = {}
+    for line in lines:
+        tagged_key, _, count = line.rstrip('\r\n').rpartition('\t')
+        table, _, key = tagged_key.partition(':')
+        if key:
+            counts = tables.setdefault(table, Counter())
+            counts[key] += int(count)
+    return tables
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the per-job output files of a fused streaming job (WORDCOUNT_JOBS).')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    split_parser = subparsers.add_parser('split', help='split a merged fused job output into one file per job')
+    split_parser.add_argument('jobs', help='the WORDCOUNT_JOBS list of the job, e.g. unigram,bigram,docfreq,vocab')
+    split_parser.add_argument('merged_output', help='merged reducer output, e.g. output_file_hadoop.txt')
+    split_parser.add_argument('--output', default=None, help='base name of the job output files (default: merged_output)')
+    args = parser.parse_args()
+
+    aggregations = parse_jobs(args.jobs)
+    with open(args.merged_output, 'r', encoding='utf-8') as f:
+        reduced = read_tagged_output(f)
+    for name, output_file in write_outputs(aggregations, reduced, args.output or args.merged_output).items():
+        print(f"Wrote {name} to {output_file}", file=sys.stderr)
@@ -1,107 +1,592 @@
 # filepath: d:\EDU\MapReduce-WordCount-Python-main\main.py
-import time
 import os
+import shutil
+import tempfile
+import threading
+from itertools import groupby, islice
 # Using the improved version with better error handling
-from split_new import split_file  
-from mapping import mapper
-from shuffling import shuffle
-from reduce import reducer
-from multiprocessing import Pool
+from split_new import expand_inputs, plan_input_splits
+from mapping import mapper, combining_mapper, read_split, split_mapper, bytes_split_mapper
+from shuffling import shuffle, merge_counts, merge_tables, partition, SpillingShuffle
+from reduce import reducer, reduce_partition, write_partition, stream_reducer, write_sorted_stream
+from cache import cached_digests, save_manifest, split_digest, has_partial, load_partial, store_partial, enforce_size_limit, clear_cache, DEFAULT_CACHE_MAX_BYTES
+from topk import top_k, SpaceSaving, count_min_summary, merge_count_min_summaries
+from metrics import JobMetrics, init_worker, instrumented_map_execution, trace
+from counttable import CountTable
+from records import RecordBlock, SharedRecordBlock, RecordFile, released, require_shared_memory
+from scheduler import TaskScheduler
+from partitioner import SkewAwarePartitioner, sample_word_counts, DEFAULT_SAMPLE_BYTES
+from jobs import parse_jobs
+from fused import run_fused_job
+from tokenizer import tokenizer_from_env
+from vectorized import require_numpy, vectorized_split_mapper, reduce_word_id_tables
+from multiprocessing import Pool, SimpleQueue
 
 def trace_mapper_execution(chunk_name, line_offset, line):
-    process_id = os.getpid()
-    print(f"Process ID {process_id} is mapping data from {chunk_name}.")
+    trace(f"is mapping data from {chunk_name}.")
     return mapper(line_offset, line)
 
+def trace_combining_mapper_execution(chunk_name, line_offset, line):
+    trace(f"is mapping data from {chunk_name}.")
+    return combining_mapper(line_offset, line)
+
+def trace_split_mapper_execution(split, combine):
+    path, start, end = split
+    trace(f"is mapping data from {path} [{start}:{end}].")
+    return split_mapper(split, combine)
+
+def trace_bytes_mapper_execution(split):
+    path, start, end = split
+    trace(f"is mapping bytes from {path} [{start}:{end}].")
+    return bytes_split_mapper(split)
+
+def trace_vectorized_mapper_execution(split, engine, combine):
+    path, start, end = split
+    trace(f"is mapping word ids from {path} [{start}:{end}].")
+    return vectorized_split_mapper(split, engine, combine)
+
+def partitioned_map_execution(map_function, args, num_reducers, block_type=None, compress=False, partitioner=None, salt=0, partition_dir=None):
+    # Partition on the map side, so each reducer only receives its own bucket
+    partitions = partition(map_function(*args), num_reducers, partitioner, salt)
+    if partition_dir:
+        return [RecordFile.encode(bucket, partition_dir, compress=compress) for bucket in partitions]
+    if block_type:
+        return [block_type.encode(bucket, compress=compress) for bucket in partitions]
+    return partitions
+
+def summary_map_execution(map_function, args, heavy_hitters, capacity):
+    # Approximate top-K: each map task returns a bounded summary instead of its full table
+    word_counts = merge_counts([map_function(*args)])
+    if heavy_hitters == 'space-saving':
+        return SpaceSaving.from_counts(word_counts, capacity)
+    return count_min_summary(word_counts, capacity)
+
+def top_k_partition(partials, k, salted_words=frozenset()):
+    # Reduce one partition and return only its k most frequent words, plus the partial totals
+    # of salted words, which are only complete after the final merge
+    reduced = reduce_partition(partials)
+    salted_counts = {word: reduced.pop(word) for word in reduced.keys() & salted_words}
+    return top_k(reduced.items(), k), salted_counts
+
+def merge_salted_counts(salted_counts):
+    # Final merge step for salted words: sum the partial totals from every partition
+    totals = {}
+    for counts in salted_counts:
+        for word, count in counts.items():
+            totals[word] = totals.get(word, 0) + count
+    return totals
+
+def cached_map_execution(map_function, args, cache_dir, digest):
+    # Serve the split from the persistent cache, mapping and storing it only on a miss
+    output = load_partial(cache_dir, digest)
+    if output is None:
+        output = map_function(*args)
+        store_partial(cache_dir, digest, output)
+    return output
+
+def compact_map_execution(map_function, args):
+    # Hand the map output back as a CountTable: a few flat buffers to pickle instead of a dict
+    return CountTable.from_counts(map_function(*args))
+
+def encoded_map_execution(map_function, args, block_type, compress):
+    # Hand the map output back as one record block (or shared memory descriptor) instead of a pickled dict or list
+    output = map_function(*args)
+    if isinstance(output, block_type):
+        return output
+    return block_type.encode(output, compress=compress)
+
+def call_map_execution(map_function, args):
+    return map_function(*args)
+
+def star_call_map_execution(task):
+    return call_map_execution(*task)
+
+def line_tasks(splits):
+    # Line-mode map tasks, reading one split at a time
+    for split in splits:
+        for line_offset, line in enumerate(read_split(split).splitlines()):
+            yield split[0], line_offset, line.strip()
+
+def wrapped_tasks(map_function, mapper_inputs, *extra):
+    # Lazily turn each task's args into (map_function, args, *extra) for a wrapping map function
+    for args in mapper_inputs:
+        yield (map_function, args) + extra
+
+def bounded_tasks(tasks, in_flight, stopped):
+    # Take a slot before reading the next task, so no more than the window is read ahead
+    tasks = iter(tasks)
+    while True:
+        in_flight.acquire()
+        if stopped.is_set():
+            return
+        task = next(tasks, None)
+        if task is None:
+            return
+        yield task
+
+def pipelined_map(pool, map_function, mapper_inputs, depth=None, chunksize=1):
+    """
+    Yield map outputs in completion order. The pool's task-feeder thread pulls
+    tasks (reading line-mode input) from a generator that blocks while `depth`
+    tasks are read but not yet consumed here, so reading, mapping and merging
+    overlap and memory is bounded by the window instead of the input size.
+    """
+    tasks = wrapped_tasks(map_function, mapper_inputs)
+    in_flight = threading.Semaphore(depth) if depth else None
+    stopped = threading.Event()
+    if in_flight:
+        tasks = bounded_tasks(tasks, in_flight, stopped)
+    try:
+        for output in pool.imap_unordered(star_call_map_execution, tasks, chunksize):
+            yield output
+            if in_flight:
+                in_flight.release()
+    finally:
+        # Wake the feeder thread if it is waiting for a slot, so the pool can shut down after an error
+        if in_flight:
+            stopped.set()
+            in_flight.release()
+
+def observe_outputs(outputs, observed):
+    # Pass map outputs through, counting them and sampling the first non-empty one
+    for output in outputs:
+        observed['tasks'] += 1
+        if output and not observed['sample']:
+            observed['sample'] = sample_pairs(output)
+        yield output
+
+def merge_map_outputs(mapper_outputs, count_backend, compact, use_combiner):
+    # Shuffle map outputs into one table in a single pass, so they can also be merged as they arrive
+    if count_backend == 'numpy':
+        return reduce_word_id_tables(mapper_outputs)
+    if compact:
+        return merge_tables(mapper_outputs)
+    return merge_counts(mapper_outputs) if use_combiner else shuffle(mapper_outputs)
+
+def sample_pairs(mapper_output, limit=5):
+    if hasattr(mapper_output, 'items'):
+        return list(mapper_output.items())[:limit]
+    return mapper_output[:limit]
+
 def main():
+    partition_dir = None
+    shuffler = None
     try:
         # Input and output file paths - allow override via environment variables for testing
         input_file = os.environ.get('INPUT_FILE', 'input_file.txt')
         output_file = os.environ.get('OUTPUT_FILE', 'output_file.txt')
+        # In-mapper combining is on by default, COMBINER=0 emits raw (word, 1) pairs
+        use_combiner = os.environ.get('COMBINER', '1') != '0'
+        # Map task granularity: 'chunk' hands whole splits to workers, 'line' submits one task per line
+        map_task_mode = os.environ.get('MAP_TASK_MODE', 'chunk')
+        map_task_size = int(os.environ.get('MAP_TASK_SIZE', 4 * 1024 * 1024))
+        if map_task_mode not in ('chunk', 'line'):
+            raise ValueError(f"Unknown MAP_TASK_MODE '{map_task_mode}', expected 'chunk' or 'line'.")
+        # Map engine for chunk mode: 'text' tokenizes the decoded split, 'bytes' memory-maps the split,
+        # scans the raw bytes and decodes and normalizes only the distinct tokens
+        map_engine = os.environ.get('MAP_ENGINE', 'text')
+        if map_engine not in ('text', 'bytes'):
+            raise ValueError(f"Unknown MAP_ENGINE '{map_engine}', expected 'text' or 'bytes'.")
+        # Tokenization shared with hadoop_mapper.py: TOKENIZER (ascii-alpha, whitespace or unicode),
+        # CASE_FOLD and STOPWORDS; map workers build the same tokenizer from the environment
+        tokenizer = tokenizer_from_env()
+        # Counting backend: 'numpy' maps words to per-task ids and sums them with array operations
+        count_backend = os.environ.get('COUNT_BACKEND', 'python')
+        if count_backend not in ('python', 'numpy'):
+            raise ValueError(f"Unknown COUNT_BACKEND '{count_backend}', expected 'python' or 'numpy'.")
+        # Count table for the Python backend: 'compact' keeps words in one UTF-8 arena with array-backed
+        # counts (see counttable.py) through map output, shuffle, reduce and output writing
+        count_table = os.environ.get('COUNT_TABLE', 'dict')
+        if count_table not in ('dict', 'compact'):
+            raise ValueError(f"Unknown COUNT_TABLE '{count_table}', expected 'dict' or 'compact'.")
+        compact = count_table == 'compact'
+        # Reducer parallelism, mirroring mapreduce.job.reduces in run_hadoop.sh. With OUTPUT_DIR set,
+        # each reducer writes its own part-NNNNN file instead of merging into OUTPUT_FILE
+        num_reducers = int(os.environ.get('NUM_REDUCERS', 1))
+        output_dir = os.environ.get('OUTPUT_DIR')
+        if num_reducers < 1:
+            raise ValueError(f"NUM_REDUCERS must be at least 1, got {num_reducers}.")
+        partitioned = num_reducers > 1 or bool(output_dir)
+        # Byte budget for buffered shuffle data; beyond it sorted runs are spilled to disk
+        memory_budget = int(os.environ.get('SHUFFLE_MEMORY_BUDGET', 0)) or None
+        # Top-K mode: only the K most frequent words are kept and written. HEAVY_HITTERS selects an
+        # approximate variant ('space-saving' or 'count-min') that never builds the full table
+        top_k_words = int(os.environ.get('TOP_K', 0)) or None
+        heavy_hitters = os.environ.get('HEAVY_HITTERS') or None
+        if heavy_hitters not in (None, 'space-saving', 'count-min'):
+            raise ValueError(f"Unknown HEAVY_HITTERS '{heavy_hitters}', expected 'space-saving' or 'count-min'.")
+        if heavy_hitters and not top_k_words:
+            raise ValueError("HEAVY_HITTERS requires TOP_K to be set.")
+        if memory_budget and partitioned and (top_k_words or not output_dir):
+            # Only reducers writing part files spill; the others reduce their whole partition in memory
+            raise ValueError("SHUFFLE_MEMORY_BUDGET with NUM_REDUCERS/OUTPUT_DIR requires OUTPUT_DIR and is not supported with TOP_K.")
+        # Persistent per-split cache of map outputs, enabled by setting CACHE_DIR
+        cache_dir = os.environ.get('CACHE_DIR') or None
+        cache_max_bytes = int(os.environ.get('CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES))
+        if cache_dir and map_task_mode != 'chunk':
+            raise ValueError("CACHE_DIR is only supported with MAP_TASK_MODE=chunk.")
+        if cache_dir and os.environ.get('CACHE_CLEAR', '0') != '0':
+            clear_cache(cache_dir)
+            print(f"Cleared cache {cache_dir}")
+        heavy_hitters_capacity = int(os.environ.get('HEAVY_HITTERS_CAPACITY', 0)) or max(10 * (top_k_words or 0), 1000)
+        # Structured metrics: METRICS_FILE (.json or .prom) enables per-task instrumentation,
+        # PROFILE ('cprofile' or 'tracemalloc') additionally profiles every map task
+        metrics_file = os.environ.get('METRICS_FILE') or None
+        profile = os.environ.get('PROFILE') or None
+        profile_dir = os.environ.get('PROFILE_DIR', 'profiles')
+        if profile not in (None, 'cprofile', 'tracemalloc'):
+            raise ValueError(f"Unknown PROFILE '{profile}', expected 'cprofile' or 'tracemalloc'.")
+        instrumented = bool(metrics_file or profile)
+        # Streaming pipeline: PIPELINE_DEPTH bounds how many map tasks may be read but not yet merged
+        pipeline_depth = int(os.environ.get('PIPELINE_DEPTH', 0)) or None
+        if pipeline_depth and (partitioned or heavy_hitters):
+            raise ValueError("PIPELINE_DEPTH is not supported with NUM_REDUCERS/OUTPUT_DIR or HEAVY_HITTERS.")
+        if count_backend == 'numpy':
+            require_numpy()
+            if map_task_mode != 'chunk' or partitioned or memory_budget or heavy_hitters:
+                raise ValueError("COUNT_BACKEND=numpy supports chunk mode with a single in-memory reducer only (no NUM_REDUCERS/OUTPUT_DIR, SHUFFLE_MEMORY_BUDGET or HEAVY_HITTERS).")
+        if compact and (count_backend == 'numpy' or partitioned or heavy_hitters):
+            raise ValueError("COUNT_TABLE=compact is not supported with COUNT_BACKEND=numpy, NUM_REDUCERS/OUTPUT_DIR or HEAVY_HITTERS.")
+        # Map output format sent from workers to the parent and reducers: 'pickle' (Python objects),
+        # 'binary' (record blocks, see records.py) or 'shared-memory' (record blocks left in shared
+        # memory segments, only their names are sent); INTERMEDIATE_COMPRESSION=1 zlib-compresses
+        # record blocks and spill runs
+        intermediate_format = os.environ.get('INTERMEDIATE_FORMAT', 'pickle')
+        block_types = {'pickle': None, 'binary': RecordBlock, 'shared-memory': SharedRecordBlock}
+        if intermediate_format not in block_types:
+            raise ValueError(f"Unknown INTERMEDIATE_FORMAT '{intermediate_format}', expected 'pickle', 'binary' or 'shared-memory'.")
+        intermediate_compression = os.environ.get('INTERMEDIATE_COMPRESSION', '0') != '0'
+        block_type = block_types[intermediate_format]
+        if block_type and (count_backend == 'numpy' or compact or heavy_hitters):
+            raise ValueError(f"INTERMEDIATE_FORMAT={intermediate_format} is not supported with COUNT_BACKEND=numpy, COUNT_TABLE=compact or HEAVY_HITTERS.")
+        if block_type is SharedRecordBlock:
+            if os.name == 'nt':
+                # Windows frees a segment when its last handle closes, before the parent could attach
+                raise ValueError("INTERMEDIATE_FORMAT=shared-memory is not supported on Windows.")
+            require_shared_memory()
+        # Reducer partitioning: 'hash' (crc32 of the word) or 'skew', which samples PARTITION_SAMPLE_BYTES
+        # of the input, balances heavy words across reducers and salts words too big for one reducer
+        partitioner_mode = os.environ.get('PARTITIONER', 'hash')
+        if partitioner_mode not in ('hash', 'skew'):
+            raise ValueError(f"Unknown PARTITIONER '{partitioner_mode}', expected 'hash' or 'skew'.")
+        partition_sample_bytes = int(os.environ.get('PARTITION_SAMPLE_BYTES', DEFAULT_SAMPLE_BYTES))
+        if partitioner_mode == 'skew' and (not partitioned or heavy_hitters):
+            raise ValueError("PARTITIONER=skew requires NUM_REDUCERS/OUTPUT_DIR and is not supported with HEAVY_HITTERS.")
+        # Map task scheduling: 'static' hands tasks to Pool.starmap, 'dynamic' uses the TaskScheduler
+        # (idle workers pull small tasks, speculative copies of stragglers, TASK_RETRIES retries per task)
+        map_scheduler = os.environ.get('MAP_SCHEDULER', 'static')
+        if map_scheduler not in ('static', 'dynamic'):
+            raise ValueError(f"Unknown MAP_SCHEDULER '{map_scheduler}', expected 'static' or 'dynamic'.")
+        speculation_factor = float(os.environ.get('SPECULATION_FACTOR', 2.0))
+        task_retries = int(os.environ.get('TASK_RETRIES', 2))
+        if map_scheduler == 'dynamic' and (map_task_mode != 'chunk' or pipeline_depth):
+            raise ValueError("MAP_SCHEDULER=dynamic supports chunk mode without PIPELINE_DEPTH only.")
+        # Fused pass: JOBS lists several aggregations (unigram, bigram, trigram, <N>gram, docfreq, vocab)
+        # computed from one read and tokenization of the input, each written to OUTPUT_FILE_<job>
+        jobs_spec = os.environ.get('JOBS')
+        if jobs_spec:
+            if (map_task_mode != 'chunk' or count_backend == 'numpy' or compact or output_dir or memory_budget or top_k_words or cache_dir
+                    or pipeline_depth or block_type or partitioner_mode != 'hash' or map_scheduler != 'static' or instrumented):
+                raise ValueError("JOBS supports chunk mode with NUM_REDUCERS and NUM_WORKERS only.")
+            run_fused_job(input_file, parse_jobs(jobs_spec), output_file, map_task_size, int(os.environ.get('NUM_WORKERS', 0)) or None, num_reducers)
+            return
+        job_metrics = JobMetrics()
         
-        # Check if input file exists
-        if not os.path.exists(input_file):
+        # INPUT_FILE may be a single file, a directory or a glob pattern
+        input_files = expand_inputs(input_file)
+        if not input_files:
             raise FileNotFoundError(f"Input file '{input_file}' not found.")
             
         # Split stage
-        start_time = time.time()
-        chunks = split_file(input_file)
-        file_size = os.path.getsize(input_file)
-        technique = "File Size based" if file_size > 128 * 1024 * 1024 else "Word Count based"
-        total_chunks = len(chunks)
-        print(f"Splitting Details:\nFile size: {file_size / (1024 * 1024):.2f} MB\nSplitting Technique: {technique}\nTotal Chunks: {total_chunks}\nChunk Files: {chunks}\nSplitting completed in {time.time() - start_time:.2f} seconds.")
+        job_metrics.begin('split')
+        # Splits are newline-aligned byte ranges of the input; no chunk files are written
+        file_size = sum(os.path.getsize(path) for path in input_files)
+        if map_scheduler == 'dynamic' and 'MAP_TASK_SIZE' not in os.environ:
+            # Many small tasks (about 8 per CPU, at least 256 KB each), so no single task dominates the tail
+            map_task_size = min(map_task_size, max(file_size // (8 * (os.cpu_count() or 4)), 256 * 1024))
+        splits = plan_input_splits(input_files, map_task_size)
+        total_chunks = len(splits)
+        print(f"Splitting Details:\nInput Files: {len(input_files)}\nFile size: {file_size / (1024 * 1024):.2f} MB\nSplitting Technique: Byte range (newline aligned, {map_task_size} bytes)\nTotal Chunks: {total_chunks}\nChunk Ranges: {[(os.path.basename(path), start, end) for path, start, end in splits[:10]]}{' ...' if total_chunks > 10 else ''}\nSplitting completed in {job_metrics.end('split', splits=total_chunks, bytes_in=file_size):.2f} seconds.")
         
+        partitioner = None
+        salted_words = frozenset()
+        if partitioner_mode == 'skew':
+            # Combined map outputs cost one record per word and map task, raw outputs one per token
+            sample_counts, _ = sample_word_counts(input_file, partition_sample_bytes, tokenizer, map_task_size)
+            partitioner = SkewAwarePartitioner.from_sample(sample_counts, num_reducers, len(splits) if use_combiner and map_task_mode == 'chunk' else None)
+            salted_words = frozenset(partitioner.salted)
+            print(f"Partitioner Details:\nHeavy Words: {len(partitioner.assignments)}\nSalted Words: {sorted(salted_words)[:10]}\nEstimated Partition Records: {partitioner.estimated_loads} (skew {partitioner.skew():.2f}x)")
+
         # Map stage
-        start_time = time.time()
+        job_metrics.begin('map')
         mapper_inputs = []
-        for chunk in chunks:
-            try:
-                with open(chunk, 'r', encoding='utf-8') as f:
-                    for line_offset, line in enumerate(f):
-                        mapper_inputs.append((chunk, line_offset, line.strip()))
-            except UnicodeDecodeError:
-                print(f"Warning: Encoding issue in {chunk}, trying with 'latin-1' encoding")
-                with open(chunk, 'r', encoding='latin-1') as f:
-                    for line_offset, line in enumerate(f):
-                        mapper_inputs.append((chunk, line_offset, line.strip()))
+        if map_task_mode == 'chunk':
+            # Workers read their own byte range; only (path, start, end) is sent over IPC
+            if count_backend == 'numpy':
+                for split in splits:
+                    mapper_inputs.append((split, map_engine, use_combiner))
+                map_function = trace_vectorized_mapper_execution
+            elif map_engine == 'bytes':
+                for split in splits:
+                    mapper_inputs.append((split,))
+                map_function = trace_bytes_mapper_execution
+            else:
+                for split in splits:
+                    mapper_inputs.append((split, use_combiner))
+                map_function = trace_split_mapper_execution
+        else:
+            # Pipelined line mode reads the input lazily, as the pool asks for more tasks
+            mapper_inputs = line_tasks(splits) if pipeline_depth else list(line_tasks(splits))
+            map_function = trace_combining_mapper_execution if use_combiner else trace_mapper_execution
         
         # Configure the number of processes in the pool based on the number of chunks
-        num_processes = min(os.cpu_count() or 4, 4 if len(chunks) <= 8 else 8)
-        print(f"Starting mapping phase with {num_processes} parallel mapper processes.")
+        num_tasks = len(mapper_inputs) if isinstance(mapper_inputs, list) else None
+        num_processes = min(os.cpu_count() or 4, 4 if len(splits) <= 8 else 8, max(num_tasks or len(splits), 1))
+        # NUM_WORKERS pins the pool size, e.g. for scaling benchmarks
+        num_processes = int(os.environ.get('NUM_WORKERS', 0)) or num_processes
+        print(f"Starting mapping phase with {num_processes} parallel mapper processes ({num_tasks if num_tasks is not None else 'streamed'} map tasks, mode: {map_task_mode}).")
+        # Line tasks are tiny, so the pipeline hands them to workers in batches (never more than the window)
+        pipeline_chunksize = max(1, (pipeline_depth or 0) // (2 * num_processes)) if map_task_mode == 'line' else 1
 
-        with Pool(processes=num_processes) as pool:
-            mapper_outputs = pool.starmap(trace_mapper_execution, mapper_inputs)
-        sample_mapper_output = mapper_outputs[0][:5] if mapper_outputs and mapper_outputs[0] else []
-        print(f"Mapping Details:\nSample Key-Value Pairs: {sample_mapper_output}\nMapping completed in {time.time() - start_time:.2f} seconds.")
-        
-        # Shuffle stage
-        start_time = time.time()
-        shuffled_data = shuffle(mapper_outputs)
-        print(f"Shuffling completed in {time.time() - start_time:.2f} seconds.")
-
-        # Reduce stage
-        start_time = time.time()
-        reduced_data = reducer(shuffled_data)
-        sample_reduced_output = dict(list(reduced_data.items())[:5]) if reduced_data else {}
-        print(f"Reducing Details:\nSample Word Frequencies: {sample_reduced_output}\nReducing completed in {time.time() - start_time:.2f} seconds.")
-
-        # Write output
-        try:
+        task_queue = SimpleQueue() if instrumented else None
+        if instrumented:
+            job_metrics.start_collecting(task_queue)
+        if partitioned and (output_dir or top_k_words) and not heavy_hitters and block_type is not SharedRecordBlock:
+            # The parent never needs the whole vocabulary here, so map workers write their buckets to
+            # record files and only the file names pass through the parent to the reducers
+            partition_dir = tempfile.mkdtemp(prefix='partitions_')
+        if block_type is SharedRecordBlock:
+            # Start the resource tracker before the pool forks, so segments created by workers are
+            # tracked by the parent's tracker and not unlinked when a worker exits
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+        with Pool(processes=num_processes, initializer=init_worker, initargs=(task_queue,)) as pool:
+            if cache_dir and map_task_mode == 'chunk':
+                # Unchanged files reuse their recorded split digests; changed or new files are re-hashed
+                # in the pool, so appended data only maps the splits whose content is new
+                cache_config = f"{map_engine}:{int(use_combiner)}:{tokenizer.signature()}" + (':numpy' if count_backend == 'numpy' else '')
+                digests = []
+                for path, file_splits in groupby(splits, key=lambda split: split[0]):
+                    file_splits = list(file_splits)
+                    file_digests = cached_digests(cache_dir, path, file_splits, cache_config)
+                    if file_digests is None:
+                        file_digests = pool.starmap(split_digest, [(split, cache_config) for split in file_splits])
+                        save_manifest(cache_dir, path, file_splits, file_digests, cache_config)
+                    digests.extend(file_digests)
+                cache_hits = sum(1 for digest in digests if has_partial(cache_dir, digest))
+                print(f"Cache Details:\nDirectory: {cache_dir}\nHits: {cache_hits}/{len(splits)} splits")
+                job_metrics.counters['cache_hits'] = cache_hits
+                mapper_inputs = [(map_function, args, cache_dir, digest) for args, digest in zip(mapper_inputs, digests)]
+                map_function = cached_map_execution
+
+            if compact:
+                mapper_inputs = wrapped_tasks(map_function, mapper_inputs)
+                map_function = compact_map_execution
+
+            if block_type and not partitioned:
+                mapper_inputs = wrapped_tasks(map_function, mapper_inputs, block_type, intermediate_compression)
+                map_function = encoded_map_execution
+
+            if instrumented:
+                mapper_inputs = wrapped_tasks(map_function, mapper_inputs, profile, profile_dir)
+                map_function = instrumented_map_execution
+
+            scheduler = TaskScheduler(pool, num_processes, task_retries, speculation_factor) if map_scheduler == 'dynamic' else None
+            map_starmap = scheduler.starmap if scheduler else pool.starmap
+            if heavy_hitters:
+                summary_inputs = [(map_function, args, heavy_hitters, heavy_hitters_capacity) for args in mapper_inputs]
+                task_summaries = map_starmap(summary_map_execution, summary_inputs)
+                sample_mapper_output = []
+            elif partitioned:
+                # With a record format each bucket is encoded separately and reducers read it directly
+                # The task number salts the partition of salted words
+                partitioned_inputs = [(map_function, args, num_reducers, block_type, intermediate_compression, partitioner, task_number, partition_dir)
+                                      for task_number, args in enumerate(mapper_inputs)]
+                mapper_outputs = map_starmap(partitioned_map_execution, partitioned_inputs)
+                sample_mapper_output = next((sample_pairs(bucket) for output in mapper_outputs for bucket in output if bucket), [])
+            elif memory_budget:
+                # Feed map outputs to the spilling shuffle as they complete instead of keeping them all
+                shuffler = SpillingShuffle(memory_budget, compress=intermediate_compression)
+                observed = {'tasks': 0, 'sample': []}
+                if scheduler:
+                    outputs = (output for _, output in scheduler.completed(map_function, mapper_inputs))
+                else:
+                    outputs = pipelined_map(pool, map_function, mapper_inputs, pipeline_depth, pipeline_chunksize)
+                for output in released(observe_outputs(outputs, observed)):
+                    shuffler.add(output)
+                sample_mapper_output = observed['sample']
+                num_tasks = observed['tasks']
+            elif pipeline_depth:
+                # Merge map outputs into the shuffle table as they arrive instead of after the last task
+                observed = {'tasks': 0, 'sample': []}
+                shuffled_data = merge_map_outputs(released(observe_outputs(pipelined_map(pool, map_function, mapper_inputs, pipeline_depth, pipeline_chunksize), observed)),
+                                                  count_backend, compact, use_combiner)
+                sample_mapper_output = observed['sample']
+                num_tasks = observed['tasks']
+            else:
+                mapper_outputs = map_starmap(map_function, mapper_inputs)
+                sample_mapper_output = sample_pairs(mapper_outputs[0]) if mapper_outputs and mapper_outputs[0] else []
+            if scheduler:
+                job_metrics.counters.update(scheduler.stats)
+                print(f"Scheduling Details:\nAttempts: {scheduler.stats['attempts']}\nRetried Tasks: {scheduler.stats['retried_tasks']}\nSpeculative Tasks: {scheduler.stats['speculative_tasks']} ({scheduler.stats['speculative_wins']} won)")
+            print(f"Mapping Details:\nTokenizer: {tokenizer.mode} (case folding {'on' if tokenizer.case_fold else 'off'}, {len(tokenizer.stopwords)} stopwords)\nSample Key-Value Pairs: {sample_mapper_output}\nMapping completed in {job_metrics.end('map', tasks=num_tasks, workers=num_processes):.2f} seconds.")
+
+            if partitioned and not heavy_hitters:
+                # Shuffle stage: reducer i receives bucket i of every map output
+                job_metrics.begin('shuffle')
+                partitions = [[output[i] for output in mapper_outputs] for i in range(num_reducers)]
+                del mapper_outputs
+                partition_records = [sum(len(bucket) for bucket in bucket_list) for bucket_list in partitions]
+                mean_records = sum(partition_records) / num_reducers
+                print(f"Partition Records: {partition_records} (skew {max(partition_records) / mean_records if mean_records else 1:.2f}x)")
+                print(f"Shuffling completed in {job_metrics.end('shuffle', partitions=num_reducers):.2f} seconds ({num_reducers} partitions).")
+
+                # Reduce stage: one reducer task per partition, run in parallel
+                job_metrics.begin('reduce')
+                if top_k_words:
+                    partition_tops = pool.starmap(top_k_partition, [(bucket, top_k_words, salted_words) for bucket in partitions])
+                    # Partitions are disjoint apart from salted words, so the global top K is among the
+                    # per-partition top Ks and the merged salted words
+                    salted_totals = merge_salted_counts(salted_counts for _, salted_counts in partition_tops)
+                    top_words = top_k([pair for partition_top, _ in partition_tops for pair in partition_top] + list(salted_totals.items()), top_k_words)
+                elif output_dir:
+                    os.makedirs(output_dir, exist_ok=True)
+                    summaries = pool.starmap(write_partition, [(i, bucket, output_dir, 10, memory_budget, salted_words) for i, bucket in enumerate(partitions)])
+                    if salted_words:
+                        # Salted words are written, merged, to one extra part file after the reducers' parts
+                        salted_file = os.path.join(output_dir, f'part-{num_reducers:05d}')
+                        salted_totals = merge_salted_counts(summary[3] for summary in summaries)
+                        word_total, top_words = write_sorted_stream(salted_file, sorted(salted_totals.items()))
+                        summaries.append((salted_file, word_total, top_words, {}))
+                    reduced_data = None
+                else:
+                    reduced_data = {}
+                    for reduced_partition in pool.map(reduce_partition, partitions):
+                        for word in reduced_partition.keys() & salted_words:
+                            reduced_partition[word] += reduced_data.get(word, 0)
+                        reduced_data.update(reduced_partition)
+                print(f"Reducing completed in {job_metrics.end('reduce', reducers=num_reducers):.2f} seconds with {num_reducers} parallel reducers.")
+        job_metrics.stop_collecting()
+
+        if heavy_hitters:
+            # Merge the bounded per-task summaries; reported counts are upper-bound estimates
+            job_metrics.begin('merge')
+            if heavy_hitters == 'space-saving':
+                merged_summary = task_summaries[0] if task_summaries else SpaceSaving(heavy_hitters_capacity)
+                for summary in task_summaries[1:]:
+                    merged_summary = merged_summary.merge(summary)
+                top_words = merged_summary.top(top_k_words)
+            else:
+                top_words = merge_count_min_summaries(task_summaries, top_k_words)
+            print(f"Heavy Hitters Details:\nMethod: {heavy_hitters}\nCapacity: {heavy_hitters_capacity}\nMerging completed in {job_metrics.end('merge'):.2f} seconds.")
+        elif top_k_words and memory_budget and not partitioned:
+            # Top K straight off the merged spill runs, without materializing the reduced table
+            job_metrics.begin('reduce')
+            try:
+                top_words = top_k(stream_reducer(shuffler.sorted_stream()), top_k_words)
+                job_metrics.counters.update(shuffler.metrics())
+            finally:
+                shuffler.close()
+            print(f"Reducing completed in {job_metrics.end('reduce'):.2f} seconds.")
+        elif memory_budget and not partitioned:
+            # Reduce stage: k-way merge of the spilled runs, streamed straight to the output file
+            # (sorted by word, since a count-sorted file would need the whole vocabulary in memory)
+            job_metrics.begin('reduce')
+            try:
+                word_total, top_10_words = write_sorted_stream(output_file, stream_reducer(shuffler.sorted_stream()), separator=' ')
+                shuffle_metrics = shuffler.metrics()
+            finally:
+                shuffler.close()
+            job_metrics.counters.update(shuffle_metrics)
+            print(f"Shuffling Details:\nSpills: {shuffle_metrics['spills']}\nSpilled Bytes: {shuffle_metrics['spilled_bytes']}\nMerge Passes: {shuffle_metrics['merge_passes']}")
+            print(f"Reducing Details:\nDistinct Words: {word_total}\nReducing completed in {job_metrics.end('reduce', distinct_words=word_total):.2f} seconds.")
+            summaries = [(output_file, word_total, top_10_words, {})]
+            reduced_data = None
+        elif count_backend == 'numpy':
+            # Shuffle and reduce in one step: vocabularies are merged once, counts summed as arrays
+            job_metrics.begin('reduce')
+            if not pipeline_depth:
+                reduced_data = merge_map_outputs(mapper_outputs, count_backend, compact, use_combiner)
+                del mapper_outputs
+            else:
+                reduced_data = shuffled_data
+            sample_reduced_output = dict(list(reduced_data.items())[:5]) if reduced_data else {}
+            print(f"Reducing Details:\nBackend: numpy\nSample Word Frequencies: {sample_reduced_output}\nReducing completed in {job_metrics.end('reduce', distinct_words=len(reduced_data)):.2f} seconds.")
+        elif not partitioned:
+            # Shuffle stage
+            job_metrics.begin('shuffle')
+            # Combined outputs merge directly into totals instead of lists of 1s
+            if not pipeline_depth:
+                shuffled_data = merge_map_outputs(released(mapper_outputs), count_backend, compact, use_combiner)
+                del mapper_outputs
+            print(f"Shuffling completed in {job_metrics.end('shuffle'):.2f} seconds{' (merged while mapping)' if pipeline_depth else ''}.")
+
+            # Reduce stage
+            job_metrics.begin('reduce')
+            reduced_data = reducer(shuffled_data)
+            sample_reduced_output = dict(islice(reduced_data.items(), 5))
+            print(f"Reducing Details:\nSample Word Frequencies: {sample_reduced_output}\nReducing completed in {job_metrics.end('reduce', distinct_words=len(reduced_data)):.2f} seconds.")
+
+        if top_k_words:
+            if not partitioned and not memory_budget and not heavy_hitters:
+                top_words = top_k(reduced_data.items(), top_k_words)
             with open(output_file, 'w', encoding='utf-8') as f:
-                for word, count in sorted(reduced_data.items(), key=lambda x: x[1], reverse=True):
+                for word, count in top_words:
                     f.write(f"{word} {count}\n")
-        except IOError as e:
-            print(f"Error writing to output file: {e}")
-            raise
-
-        # Cleanup
-        for chunk in chunks:
+            print(f"Wrote the top {len(top_words)} words to {output_file}")
+            top_10_words = top_words[:10]
+        elif reduced_data is None:
+            # Partitions are disjoint, so the global top 10 is among the per-partition top 10s
+            for part_file, word_total, _, _ in summaries:
+                print(f"Wrote {word_total} words to {part_file}")
+            top_10_words = sorted((pair for summary in summaries for pair in summary[2]), key=lambda x: x[1], reverse=True)[:10]
+            output_file = output_dir or output_file
+        else:
+            # Write output
+            if isinstance(reduced_data, CountTable):
+                ranked_words = reduced_data.ranked_items()
+                top_10_words = reduced_data.most_common(10)
+            else:
+                ranked_words = sorted(reduced_data.items(), key=lambda x: x[1], reverse=True)
+                top_10_words = ranked_words[:10]
             try:
-                if os.path.exists(chunk):
-                    os.remove(chunk)
-            except OSError as e:
-                print(f"Warning: Could not remove chunk {chunk}: {e}")
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    for word, count in ranked_words:
+                        f.write(f"{word} {count}\n")
+            except IOError as e:
+                print(f"Error writing to output file: {e}")
+                raise
+
+        if cache_dir:
+            evicted = enforce_size_limit(cache_dir, cache_max_bytes)
+            if evicted:
+                print(f"Evicted {evicted} cached partials to stay within {cache_max_bytes} bytes")
 
         # Display top 10 word frequencies
-        top_10_words = sorted(reduced_data.items(), key=lambda x: x[1], reverse=True)[:10]
         print("Top 10 Word Frequencies:")
         for word, count in top_10_words:
             print(f"{word}: {count}")
 
+        if instrumented:
+            task_summary = job_metrics.task_summary()
+            if task_summary:
+                print(f"Task Metrics:\nMap Tasks: {task_summary['count']}\nMean Task Time: {task_summary['wall_seconds_mean']:.3f} seconds\nSlowest Task: {task_summary['wall_seconds_max']:.3f} seconds (skew {task_summary['skew'] or 0:.2f}x)\nIPC Bytes: {task_summary['ipc_bytes_total']}")
+        if metrics_file:
+            job_metrics.export(metrics_file)
+            print(f"Metrics written to {metrics_file}")
+
         print("Orchestration Summary:\nAll stages completed successfully. Output written to", output_file)
     
     except FileNotFoundError as e:
         print(f"Error: {e}")
     except Exception as e:
         print(f"Unexpected error: {e}")
-        # Cleanup on error
-        if 'chunks' in locals():
-            for chunk in chunks:
-                if os.path.exists(chunk):
-                    try:
-                        os.remove(chunk)
-                    except:
-                        pass
+    finally:
+        # Spill runs and partition files must not outlive a failed map or reduce stage
+        if shuffler:
+            shuffler.close()
+        if partition_dir:
+            shutil.rmtree(partition_dir, ignore_errors=True)
 
 if __name__ == '__main__':
     main()
@@ -1,11 +1,97 @@
-def mapper(key, value):
+import os
+import bz2
+import gzip
+import lzma
+import mmap
+from collections import Counter
+from split_new import detect_wide_encoding, is_compressed
+from tokenizer import tokenizer_from_env, decode_lines
+
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+def mapper(key, value, tokenizer=None):
+    # Workers build their tokenizer from the TOKENIZER/CASE_FOLD/STOPWORDS environment
+    tokenizer = tokenizer or tokenizer_from_env()
     word_counts = []
-    words = value.split()
+    words = tokenizer.tokenize(value)
     for word in words:
         word_counts.append((word, 1))
     return word_counts
 
+def combining_mapper(key, value, tokenizer=None):
+    # In-mapper combiner: one (word, partial count) entry per distinct word
+    # instead of one (word, 1) tuple per token.
+    return (tokenizer or tokenizer_from_env()).count(value)
+
+def read_compressed_batches(path, batch_size=1024 * 1024):
+    # Stream-decompress inside the worker, yielding line-aligned batches of bytes
+    with COMPRESSED_OPENERS[os.path.splitext(path)[1]](path, 'rb') as f:
+        while True:
+            lines = f.readlines(batch_size)
+            if not lines:
+                break
+            yield b''.join(lines)
+
+def decode_split(data, split):
+    path, start, end = split
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        print(f"Warning: Encoding issue in {path} [{start}:{end}], decoding invalid lines as 'latin-1'")
+        return decode_lines(data)
+
+def read_split(split):
+    path, start, end = split
+    if is_compressed(path):
+        return ''.join(decode_split(batch, split) for batch in read_compressed_batches(path))
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    encoding = detect_wide_encoding(path)
+    if encoding:
+        return data.decode(encoding)
+    return decode_split(data, split)
+
+def split_mapper(split, combine=True, tokenizer=None):
+    # Map one byte-range split, reading it directly from the original file
+    tokenizer = tokenizer or tokenizer_from_env()
+    if is_compressed(split[0]):
+        # Decompressed batch by batch so the whole file is never held in memory
+        word_counts = Counter() if combine else []
+        for batch in read_compressed_batches(split[0]):
+            if combine:
+                word_counts.update(tokenizer.tokenize(decode_split(batch, split), filter_stopwords=False))
+            else:
+                word_counts.extend((word, 1) for word in tokenizer.tokenize(decode_split(batch, split)))
+        return tokenizer.remove_stopwords(word_counts) if combine else word_counts
+    text = read_split(split)
+    if combine:
+        return tokenizer.count(text)
+    return mapper(split[1], text, tokenizer)
+
+def bytes_split_mapper(split, tokenizer=None):
+    """
+    Map one split on raw bytes: memory-map the file, scan the byte range with
+    the tokenizer's precompiled pattern and decode and normalize only the
+    distinct tokens.
+    """
+    tokenizer = tokenizer or tokenizer_from_env()
+    path, start, end = split
+    if detect_wide_encoding(path) or not tokenizer.bytes_native:
+        # Not ASCII-compatible (or Unicode tokenizing), so tokenize decoded text instead
+        return tokenizer.count(read_split(split))
+    raw_counts = Counter()
+    if is_compressed(path):
+        for batch in read_compressed_batches(path):
+            raw_counts.update(tokenizer.scan_bytes(batch))
+    elif end > start:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                raw_counts.update(tokenizer.scan_bytes(mm, start, end))
+    return tokenizer.normalize_raw_counts(raw_counts)
+
 if __name__ == '__main__':
     key = 0  
     value = "hello world hello mapreduce"  # Example value (line content)
     print(mapper(key, value))
+    print(combining_mapper(key, value))
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import pickle
+import threading
+import cProfile
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Unix only: peak RSS is not reported on Windows
+    resource = None
+
+# Worker-side state, set up by init_worker in every pool process
+_task_queue = None
+_task_counter = 0
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def init_worker(task_queue):
+    global _task_queue
+    _task_queue = task_queue
+
+def trace(message):
+    """
+    Sampled task tracing: each worker prints its first task and then every
+    TRACE_EVERY-th one (0 disables tracing), instead of a line per record.
+    """
+    global _task_counter
+    _task_counter += 1
+    trace_every = int(os.environ.get('TRACE_EVERY', 100))
+    if trace_every and (_task_counter == 1 or _task_counter % trace_every == 0):
+        print(f"Process ID {os.getpid()} [task {_task_counter}] {message}")
+
+def split_bytes(args):
+    # Wrapping map functions (cache, compact, record blocks) pass the task's own args as (map_function, args, ...)
+    while len(args) > 1 and callable(args[0]) and isinstance(args[1], tuple):
+        args = args[1]
+    # Input size of a map task whose first argument is a (path, start, end) split
+    if args and isinstance(args[0], tuple) and len(args[0]) == 3:
+        _, start, end = args[0]
+        return end - start
+    # Line-mode task (path, line_offset, line): only the line is input, measured in UTF-8 bytes
+    if args and isinstance(args[-1], str):
+        return len(args[-1].encode('utf-8'))
+    return 0
+
+def instrumented_map_execution(map_function, args, profile=None, profile_dir=None):
+    """Run one map task and report its wall/CPU time, sizes and memory to the parent."""
+    profiler = None
+    if profile == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == 'tracemalloc':
+        tracemalloc.start()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    output = map_function(*args)
+    task_metrics = {
+        'pid': os.getpid(),
+        'wall_seconds': time.perf_counter() - start_wall,
+        'cpu_seconds': time.process_time() - start_cpu,
+        'bytes_in': split_bytes(args),
+        'records_out': len(output) if hasattr(output, '__len__') else None,
+        'ipc_bytes': len(pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        profile_file = os.path.join(profile_dir, f'map-{os.getpid()}-{_task_counter}-{time.time_ns()}.prof')
+        profiler.dump_stats(profile_file)
+        task_metrics['profile_file'] = profile_file
+    elif profile == 'tracemalloc':
+        task_metrics['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if _task_queue is not None:
+        _task_queue.put(task_metrics)
+    return output
+
+class JobMetrics:
+    """
+    Metrics for one pipeline run: per-stage wall/CPU time and counters, plus
+    per-task metrics sent back by the workers. Exported as JSON or in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.tasks = []
+        self.counters = {}
+        self._open_stages = {}
+        self._collector = None
+
+    def begin(self, stage):
+        self._open_stages[stage] = (time.perf_counter(), time.process_time())
+
+    def end(self, stage, **counters):
+        start_wall, start_cpu = self._open_stages.pop(stage)
+        metrics = self.stages.setdefault(stage, {'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+        metrics['wall_seconds'] += time.perf_counter() - start_wall
+        metrics['cpu_seconds'] += time.process_time() - start_cpu
+        metrics.update(counters)
+        return metrics['wall_seconds']
+
+    def start_collecting(self, task_queue):
+        # Drain task metrics while the job runs so workers never block on a full pipe
+        def collect():
+            while True:
+                task_metrics = task_queue.get()
+                if task_metrics is None:
+                    break
+                self.tasks.append(task_metrics)
+        self._task_queue = task_queue
+        self._collector = threading.Thread(target=collect, daemon=True)
+        self._collector.start()
+
+    def stop_collecting(self):
+        # Every worker put its metrics before returning its result, so they precede the sentinel
+        if self._collector is not None:
+            self._task_queue.put(None)
+            self._collector.join()
+            self._collector = None
+
+    def task_summary(self):
+        if not self.tasks:
+            return {}
+        wall_times = [task['wall_seconds'] for task in self.tasks]
+        mean_wall = sum(wall_times) / len(wall_times)
+        workers = {}
+        for task in self.tasks:
+            worker = workers.setdefault(task['pid'], {'tasks': 0, 'wall_seconds': 0.0, 'peak_rss_mb': None})
+            worker['tasks'] += 1
+            worker['wall_seconds'] += task['wall_seconds']
+            if task['peak_rss_mb'] is not None:
+                worker['peak_rss_mb'] = max(worker['peak_rss_mb'] or 0.0, task['peak_rss_mb'])
+        return {
+            'count': len(self.tasks),
+            'wall_seconds_mean': mean_wall,
+            'wall_seconds_max': max(wall_times),
+            # Skew: how much longer the slowest task ran than the average one
+            'skew': max(wall_times) / mean_wall if mean_wall else None,
+            'cpu_seconds_total': sum(task['cpu_seconds'] for task in self.tasks),
+            'bytes_in_total': sum(task['bytes_in'] for task in self.tasks),
+            'records_out_total': sum(task['records_out'] or 0 for task in self.tasks),
+            'ipc_bytes_total': sum(task['ipc_bytes'] for task in self.tasks),
+            'workers': {str(pid): worker for pid, worker in workers.items()},
+        }
+
+    def as_dict(self):
+        return {
+            'stages': self.stages,
+            'counters': self.counters,
+            'map_tasks': self.task_summary(),
+            'tasks': self.tasks,
+            'parent_peak_rss_mb': peak_rss_mb(),
+        }
+
+    def to_prometheus(self, prefix='wordcount'):
+        # Samples are grouped per metric family, as the exposition format requires
+        families = {}
+        def metric(name, value, help_text, labels=None):
+            if value is None:
+                return
+            label_text = '{' + ','.join(f'{key}="{val}"' for key, val in labels.items()) + '}' if labels else ''
+            families.setdefault(f'{prefix}_{name}', (help_text, []))[1].append(f'{prefix}_{name}{label_text} {value}')
+        for stage, values in self.stages.items():
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    metric(f'stage_{key}', value, f'Per-stage {key}', {'stage': stage})
+        for key, value in self.counters.items():
+            metric(key, value, f'Pipeline counter {key}')
+        summary = self.task_summary()
+        for key, value in summary.items():
+            if isinstance(value, (int, float)):
+                metric(f'map_task_{key}', value, f'Map task {key}')
+        for pid, worker in summary.get('workers', {}).items():
+            for key, value in worker.items():
+                metric(f'worker_{key}', value, f'Per-worker {key}', {'pid': pid})
+        metric('parent_peak_rss_mb', peak_rss_mb(), 'Peak RSS of the parent process')
+        lines = []
+        for name, (help_text, samples) in families.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def export(self, metrics_file):
+        # .prom files get the Prometheus text format, anything else JSON
+        with open(metrics_file, 'w', encoding='utf-8') as f:
+            if metrics_file.endswith('.prom'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.as_dict(), f, indent=2)
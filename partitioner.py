@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import math
+import argparse
+from collections import Counter
+from split_new import expand_inputs, plan_input_splits, is_compressed
+from mapping import read_compressed_batches, decode_split
+from tokenizer import tokenizer_from_env
+from routing import default_partition
+
+# Input bytes tokenized to estimate key frequencies, spread evenly over the splits
+DEFAULT_SAMPLE_BYTES = 8 * 1024 * 1024
+# Keys planned individually: the most voluminous ones, as long as each is at least
+# 1/HEAVY_DIVISOR of a partition's fair share
+MAX_HEAVY_KEYS = 1000
+HEAVY_DIVISOR = 100
+# Keys above this fraction of a partition's fair share are salted over several partitions
+SALT_FRACTION = 0.5
+
+def sample_word_counts(input_file, sample_bytes=DEFAULT_SAMPLE_BYTES, tokenizer=None, split_size=64 * 1024 * 1024):
+    """
+    Token counts over a sample of the input: the first lines of every split,
+    sample_bytes in total, scaled up to the size of the whole input.
+    """
+    tokenizer = tokenizer or tokenizer_from_env()
+    input_files = expand_inputs(input_file)
+    if not input_files:
+        raise FileNotFoundError(f"Input file '{input_file}' not found.")
+    splits = plan_input_splits(input_files, split_size)
+    per_split = max(sample_bytes // max(len(splits), 1), 4096)
+    sample = Counter()
+    sampled_bytes = 0
+    for split in splits:
+        path, start, end = split
+        if is_compressed(path):
+            data = next(read_compressed_batches(path, per_split), b'')
+        else:
+            with open(path, 'rb') as f:
+                f.seek(start)
+                data = f.read(min(per_split, end - start))
+        if len(data) == per_split:
+            # Drop the partial last line
+            data = data[:data.rfind(b'\n') + 1]
+        sampled_bytes += len(data)
+        sample.update(tokenizer.tokenize(decode_split(data, split)))
+    total_bytes = sum(os.path.getsize(path) for path in input_files)
+    scale = total_bytes / sampled_bytes if sampled_bytes else 1
+    return Counter({word: round(sample_count * scale) for word, sample_count in sample.items()}), len(splits)
+
+class SkewAwarePartitioner:
+    """
+    Partitioner planned from sampled key volumes. Heavy keys are assigned one
+    by one, largest first, to the partition with the least estimated volume
+    (the rest of the keys are hash partitioned and counted in those loads).
+    Keys too large for any single partition are salted: their records are
+    spread over several partitions and summed again by a final merge.
+    """
+
+    def __init__(self, num_partitions, assignments=None, salted=None, estimated_loads=None):
+        self.num_partitions = num_partitions
+        self.assignments = assignments or {}
+        self.salted = salted or {}
+        self.estimated_loads = estimated_loads or [0] * num_partitions
+
+    @classmethod
+    def from_sample(cls, word_counts, num_partitions, num_map_tasks=None):
+        """
+        Plan partitions from estimated word counts. With num_map_tasks the map
+        outputs are assumed combined, so a word costs at most one record per
+        map task; otherwise it costs one record per occurrence.
+        """
+        volumes = {word: min(word_count, num_map_tasks) if num_map_tasks else word_count for word, word_count in word_counts.items()}
+        fair_share = sum(volumes.values()) / num_partitions
+        ranked = sorted(volumes.items(), key=lambda item: item[1], reverse=True)
+        heavy = [(word, volume) for word, volume in ranked[:MAX_HEAVY_KEYS] if volume * HEAVY_DIVISOR >= fair_share]
+        heavy_words = {word for word, _ in heavy}
+        loads = [0] * num_partitions
+        for word, volume in volumes.items():
+            if word not in heavy_words:
+                loads[default_partition(word, num_partitions)] += volume
+        assignments = {}
+        salted = {}
+        for word, volume in heavy:
+            ways = min(num_partitions, math.ceil(volume / (fair_share * SALT_FRACTION)))
+            if ways > 1:
+                targets = sorted(range(num_partitions), key=loads.__getitem__)[:ways]
+                for partition_number in targets:
+                    loads[partition_number] += volume / ways
+                salted[word] = sorted(targets)
+            else:
+                partition_number = min(range(num_partitions), key=loads.__getitem__)
+                loads[partition_number] += volume
+                assignments[word] = partition_number
+        return cls(num_partitions, assignments, salted, [round(load) for load in loads])
+
+    def partition_for(self, word, salt=0):
+        partition_number = self.assignments.get(word)
+        if partition_number is not None:
+            return partition_number
+        targets = self.salted.get(word)
+        if targets:
+            return targets[salt % len(targets)]
+        return default_partition(word, self.num_partitions)
+
+    def skew(self):
+        # Largest estimated partition volume over the mean
+        mean = sum(self.estimated_loads) / self.num_partitions
+        return max(self.estimated_loads) / mean if mean else 1.0
+
+    def to_json(self):
+        return json.dumps({'num_partitions': self.num_partitions, 'assignments': self.assignments,
+                           'salted': self.salted, 'estimated_loads': self.estimated_loads})
+
+    @classmethod
+    def load(cls, plan_file):
+        with open(plan_file, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+        return cls(plan['num_partitions'], plan['assignments'], plan['salted'], plan['estimated_loads'])
+
+def merge_salted(lines, salted_words):
+    """
+    Final merge of a streaming job's output: salted words appear once per
+    partition they were spread over and are summed; other lines pass through.
+    The merged salted words come last.
+    """
+    totals = Counter()
+    for line in lines:
+        word, _, word_count = line.rstrip('\r\n').rpartition('\t')
+        if word in salted_words:
+            totals[word] += int(word_count)
+        else:
+            yield line if line.endswith('\n') else line + '\n'
+    for word in sorted(totals):
+        yield f"{word}\t{totals[word]}\n"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plan skew-aware reducer partitions from a sample of the input, and merge salted keys afterwards.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    plan_parser = subparsers.add_parser('plan', help='sample the input and write a partition plan (JSON)')
+    plan_parser.add_argument('input', help='input file, directory or glob (a local copy or sample of the job input)')
+    plan_parser.add_argument('--reducers', type=int, required=True, help='mapreduce.job.reduces of the job')
+    plan_parser.add_argument('--sample-bytes', type=int, default=DEFAULT_SAMPLE_BYTES)
+    plan_parser.add_argument('--uncombined', action='store_true', help='plan for one record per token (WORDCOUNT_COMBINE_BUFFER=0)')
+    plan_parser.add_argument('--output', default='partition_plan.json')
+    merge_parser = subparsers.add_parser('merge', help='sum the salted words of a merged job output in place')
+    merge_parser.add_argument('plan')
+    merge_parser.add_argument('output_file')
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        # Streaming mappers combine per flush window, roughly one window per 64 MB split
+        word_counts, num_splits = sample_word_counts(args.input, args.sample_bytes, tokenizer_from_env('WORDCOUNT_'))
+        partitioner = SkewAwarePartitioner.from_sample(word_counts, args.reducers, None if args.uncombined else num_splits)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(partitioner.to_json())
+        print(f"Wrote {args.output}: {len(partitioner.assignments)} heavy keys, {len(partitioner.salted)} salted, estimated skew {partitioner.skew():.2f}x")
+    else:
+        salted_words = set(SkewAwarePartitioner.load(args.plan).salted)
+        temp_file = f'{args.output_file}.{os.getpid()}.tmp'
+        with open(args.output_file, 'r', encoding='utf-8') as source, open(temp_file, 'w', encoding='utf-8') as target:
+            target.writelines(merge_salted(source, salted_words))
+        os.replace(temp_file, args.output_file)
+        print(f"Merged {len(salted_words)} salted words in {args.output_file}", file=sys.stderr)
@@ -0,0 +1,291 @@
+import os
+import sys
+import zlib
+import tempfile
+from array import array
+from itertools import accumulate
+
+# multiprocessing.shared_memory is new in Python 3.8: only INTERMEDIATE_FORMAT=shared-memory needs it
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+# Block layout: MAGIC, flags byte, varint record count, varint body size, then the body
+# (zlib-compressed when COMPRESSED is set): varint key-column width, varint count-column width,
+# the key byte lengths, the counts, and all keys concatenated as UTF-8.
+MAGIC = b'WCR1'
+SORTED = 1
+COMPRESSED = 2
+# Fixed-width little-endian integer columns; each block uses the narrowest width that fits
+WIDTH_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+# Records per block in run files, so a merge holds one block per run in memory
+RUN_BLOCK_RECORDS = 8192
+
+def encode_varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_varint(buffer, position=0):
+    # Returns (value, position after the varint)
+    value = shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def column_width(largest):
+    for width in (1, 2, 4, 8):
+        if largest < 1 << (8 * width):
+            return width
+    raise ValueError(f"Count {largest} does not fit in 64 bits.")
+
+def pack_column(values):
+    width = column_width(max(values, default=0))
+    column = array(WIDTH_CODES[width], values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return width, column.tobytes()
+
+def unpack_column(view, width, count):
+    column = array(WIDTH_CODES[width])
+    column.frombytes(view[:width * count])
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+def encode_records(pairs, sort=False, compress=False, level=1):
+    """
+    Encode (word, count) pairs, or a word -> count mapping, as one record
+    block. Keys are length-prefixed UTF-8; with sort=True the records are in
+    word order (which is also UTF-8 byte order), as spill runs need.
+    """
+    if isinstance(pairs, dict) and not sort:
+        words, counts = list(pairs), list(pairs.values())
+    else:
+        pairs = pairs.items() if hasattr(pairs, 'items') else pairs
+        pairs = sorted(pairs) if sort else list(pairs)
+        words = [word for word, _ in pairs]
+        counts = [count for _, count in pairs]
+    text = ''.join(words)
+    if text.isascii():
+        keys = text.encode('ascii')
+        key_lengths = list(map(len, words))
+    else:
+        encoded = [word.encode('utf-8') for word in words]
+        keys = b''.join(encoded)
+        key_lengths = list(map(len, encoded))
+    length_width, length_column = pack_column(key_lengths)
+    count_width, count_column = pack_column(counts)
+    body = b''.join((encode_varint(length_width), encode_varint(count_width), length_column, count_column, keys))
+    flags = (SORTED if sort else 0) | (COMPRESSED if compress else 0)
+    header = MAGIC + bytes([flags]) + encode_varint(len(words)) + encode_varint(len(body))
+    return header + (zlib.compress(body, level) if compress else body)
+
+def read_header(data):
+    # Returns (flags, record count, body size, body offset)
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a word count record block.")
+    flags = data[len(MAGIC)]
+    num_records, position = decode_varint(data, len(MAGIC) + 1)
+    body_size, position = decode_varint(data, position)
+    return flags, num_records, body_size, position
+
+def decode_records(data):
+    """
+    Iterate over the (word, count) pairs of a record block. An uncompressed
+    block is read in place through a memoryview: the integer columns are
+    copied into arrays and the keys decoded straight from the buffer.
+    """
+    view = memoryview(data)
+    flags, num_records, _, position = read_header(view)
+    body = memoryview(zlib.decompress(view[position:])) if flags & COMPRESSED else view[position:]
+    length_width, position = decode_varint(body)
+    count_width, position = decode_varint(body, position)
+    key_lengths = unpack_column(body[position:], length_width, num_records)
+    position += length_width * num_records
+    counts = unpack_column(body[position:], count_width, num_records)
+    keys = body[position + count_width * num_records:]
+    offsets = [0, *accumulate(key_lengths)]
+    text = str(keys, 'utf-8')
+    if len(text) == len(keys):
+        # All ASCII: character offsets are byte offsets, so slice the one decoded string
+        words = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+    else:
+        words = [str(keys[start:end], 'utf-8') for start, end in zip(offsets, offsets[1:])]
+    return zip(words, counts.tolist())
+
+def check_block(data):
+    # Raise ValueError unless data holds one complete record block (zlib also checks a compressed body)
+    flags, _, body_size, position = read_header(data)
+    try:
+        body_length = len(zlib.decompress(data[position:])) if flags & COMPRESSED else len(data) - position
+    except zlib.error as e:
+        raise ValueError(f"Corrupt record block: {e}")
+    if body_length != body_size:
+        raise ValueError("Truncated record block.")
+
+class RecordBlock:
+    """
+    Map output in the binary record format. It pickles as its encoded bytes,
+    so worker -> parent transfer sends one flat buffer instead of a pickled
+    dict, and is decoded when the parent reads its items().
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def encode(cls, pairs, sort=False, compress=False):
+        return cls(encode_records(pairs, sort, compress))
+
+    def items(self):
+        return decode_records(self.data)
+
+    def __len__(self):
+        return read_header(self.data)[1]
+
+    def __reduce__(self):
+        return RecordBlock, (self.data,)
+
+def require_shared_memory():
+    if shared_memory is None:
+        raise ImportError("INTERMEDIATE_FORMAT=shared-memory requires Python 3.8 or higher.")
+
+class SharedRecordBlock:
+    """
+    Descriptor of a record block written into a shared memory segment by a
+    map worker. Only the segment name and sizes are pickled; the reader
+    decodes the block straight from the mapped segment. The segment lives
+    until release() is called, normally by the process that merges it.
+    """
+    __slots__ = ('name', 'size', 'num_records')
+
+    def __init__(self, name, size, num_records):
+        self.name = name
+        self.size = size
+        self.num_records = num_records
+
+    @classmethod
+    def encode(cls, pairs, sort=False, compress=False):
+        data = pairs.data if isinstance(pairs, RecordBlock) else encode_records(pairs, sort, compress)
+        segment = shared_memory.SharedMemory(create=True, size=len(data))
+        try:
+            segment.buf[:len(data)] = data
+            return cls(segment.name, len(data), read_header(data)[1])
+        finally:
+            segment.close()
+
+    def items(self):
+        segment = shared_memory.SharedMemory(self.name)
+        try:
+            # decode_records builds its word and count lists before returning, so no view outlives the segment
+            return decode_records(segment.buf[:self.size])
+        finally:
+            segment.close()
+
+    def __len__(self):
+        return self.num_records
+
+    def __reduce__(self):
+        return SharedRecordBlock, (self.name, self.size, self.num_records)
+
+    def release(self):
+        try:
+            segment = shared_memory.SharedMemory(self.name)
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
+
+class RecordFile:
+    """
+    Descriptor of a record block written to a file by a map worker. Like a
+    SharedRecordBlock, only the path and record count are pickled, so a
+    partition travels from the map worker to its reducer through the file
+    system and never through the parent. The file lives until release().
+    """
+    __slots__ = ('path', 'num_records')
+
+    def __init__(self, path, num_records):
+        self.path = path
+        self.num_records = num_records
+
+    @classmethod
+    def encode(cls, pairs, directory, sort=False, compress=False):
+        data = pairs.data if isinstance(pairs, RecordBlock) else encode_records(pairs, sort, compress)
+        fd, path = tempfile.mkstemp(suffix='.rec', dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return cls(path, read_header(data)[1])
+
+    def items(self):
+        with open(self.path, 'rb') as f:
+            return decode_records(f.read())
+
+    def __len__(self):
+        return self.num_records
+
+    def __reduce__(self):
+        return RecordFile, (self.path, self.num_records)
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def released(outputs):
+    # Pass outputs through, releasing each shared block or record file once the consumer moves on to the next one
+    for output in outputs:
+        try:
+            yield output
+        finally:
+            if isinstance(output, (SharedRecordBlock, RecordFile)):
+                output.release()
+
+def write_blocks(f, sorted_pairs, compress=False, block_records=RUN_BLOCK_RECORDS):
+    # Write a sorted stream as varint-length-prefixed blocks of at most block_records records
+    pairs = iter(sorted_pairs)
+    while True:
+        block_pairs = []
+        for pair in pairs:
+            block_pairs.append(pair)
+            if len(block_pairs) == block_records:
+                break
+        if not block_pairs:
+            return
+        block = encode_records(block_pairs, compress=compress)
+        f.write(encode_varint(len(block)))
+        f.write(block)
+
+def read_blocks(f):
+    # Stream the pairs of a file written by write_blocks, one block in memory at a time
+    while True:
+        size = shift = 0
+        while True:
+            byte = f.read(1)
+            if not byte:
+                if shift:
+                    raise ValueError("Truncated record file.")
+                return
+            size |= (byte[0] & 0x7f) << shift
+            if byte[0] < 0x80:
+                break
+            shift += 7
+        block = f.read(size)
+        if len(block) != size:
+            raise ValueError("Truncated record file.")
+        yield from decode_records(block)
+
+if __name__ == '__main__':
+    block = encode_records({'hello': 2, 'world': 1, 'café': 300}, sort=True)
+    print(len(block), 'bytes:', list(decode_records(block)))
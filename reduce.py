@@ -1,9 +1,72 @@
+import os
+import heapq
+from shuffling import merge_counts, combine_sorted, SpillingShuffle
+from counttable import CountTable
+from records import released
+
 def reducer(shuffled_data):
+    if isinstance(shuffled_data, CountTable):
+        # Compact tables already hold one total per word
+        return shuffled_data
     reduced = {}
     for word, counts in shuffled_data.items():
-        reduced[word] = sum(counts)
+        # Merged (combined) data already holds one total per word
+        reduced[word] = counts if isinstance(counts, int) else sum(counts)
     return reduced
 
+def stream_reducer(sorted_pairs):
+    # Reduce a key-sorted (word, count) stream one word at a time, like hadoop_reducer.py
+    return combine_sorted(sorted_pairs)
+
+def reduce_partition(partials):
+    # Reduce one hash partition: the bucket of every map output for this reducer
+    return reducer(merge_counts(released(partials)))
+
+def hold_back_salted(reduced_pairs, salted_words, salted_counts):
+    # Salted words are spread over several partitions; their partial totals go to the final merge
+    for word, count in reduced_pairs:
+        if word in salted_words:
+            salted_counts[word] = count
+        else:
+            yield word, count
+
+def write_partition(partition_number, partials, output_dir, top_n=10, memory_budget=None, salted_words=frozenset()):
+    # Reduce one partition into output_dir/part-NNNNN (sorted by word, like Hadoop)
+    # and return only a small summary (plus the partial totals of salted words) to the parent
+    part_file = os.path.join(output_dir, f'part-{partition_number:05d}')
+    salted_counts = {}
+    if memory_budget:
+        shuffler = SpillingShuffle(memory_budget)
+        try:
+            for partial in released(partials):
+                shuffler.add(partial)
+            reduced_pairs = hold_back_salted(stream_reducer(shuffler.sorted_stream()), salted_words, salted_counts)
+            word_total, top_words = write_sorted_stream(part_file, reduced_pairs, top_n)
+        finally:
+            shuffler.close()
+        return part_file, word_total, top_words, salted_counts
+    reduced = reduce_partition(partials)
+    for word in reduced.keys() & salted_words:
+        salted_counts[word] = reduced.pop(word)
+    with open(part_file, 'w', encoding='utf-8') as f:
+        for word in sorted(reduced):
+            f.write(f"{word}\t{reduced[word]}\n")
+    return part_file, len(reduced), heapq.nlargest(top_n, reduced.items(), key=lambda x: x[1]), salted_counts
+
+def write_sorted_stream(output_file, reduced_pairs, top_n=10, separator='\t'):
+    # Write a reduced stream as it is produced, keeping only the top_n words in memory
+    word_total = 0
+    top_words = []
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for word, count in reduced_pairs:
+            f.write(f"{word}{separator}{count}\n")
+            word_total += 1
+            if len(top_words) < top_n:
+                heapq.heappush(top_words, (count, word))
+            elif count > top_words[0][0]:
+                heapq.heapreplace(top_words, (count, word))
+    return word_total, [(word, count) for count, word in sorted(top_words, reverse=True)]
+
 if __name__ == '__main__':
     shuffled_data = {'word1': [1, 1], 'word2': [1], 'word3': [1]}
     print(reducer(shuffled_data))
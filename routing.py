@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import json
+import zlib
+from itertools import count
+
+def default_partition(word, num_partitions):
+    # Same crc32 hash partitioning as shuffling.partition_for, for str or bytes keys
+    return zlib.crc32(word.encode('utf-8') if isinstance(word, str) else word) % num_partitions
+
+def key_field_partition(field, num_partitions):
+    # Hadoop's KeyFieldBasedPartitioner: Java-style 31 * h + b hash of the key field bytes
+    key_hash = 0
+    for byte in field:
+        key_hash = (31 * key_hash + (byte - 256 if byte > 127 else byte)) & 0xffffffff
+    return (key_hash & 0x7fffffff) % num_partitions
+
+def routing_labels(num_partitions):
+    # Shortest numeric labels that KeyFieldBasedPartitioner sends to partition 0, 1, ..., N-1
+    labels = [None] * num_partitions
+    missing = num_partitions
+    for candidate in count():
+        label = str(candidate).encode('ascii')
+        partition_number = key_field_partition(label, num_partitions)
+        if labels[partition_number] is None:
+            labels[partition_number] = label
+            missing -= 1
+            if not missing:
+                return labels
+
+class PlanRouter:
+    """
+    Routing side of a partition plan written by 'partitioner.py plan', for
+    hadoop_mapper.py. Only needs this module, so streaming jobs ship it
+    without the local engine.
+    """
+
+    def __init__(self, num_partitions, assignments=None, salted=None):
+        self.num_partitions = num_partitions
+        self.labels = routing_labels(num_partitions)
+        self.assignments = {word.encode('utf-8'): p for word, p in (assignments or {}).items()}
+        self.salted = {word.encode('utf-8'): targets for word, targets in (salted or {}).items()}
+
+    def route(self, word, salt=0):
+        # Routing label for a UTF-8 encoded word emitted by hadoop_mapper.py
+        partition_number = self.assignments.get(word)
+        if partition_number is None:
+            targets = self.salted.get(word)
+            partition_number = targets[salt % len(targets)] if targets else default_partition(word, self.num_partitions)
+        return self.labels[partition_number]
+
+    @classmethod
+    def load(cls, plan_file):
+        with open(plan_file, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+        return cls(plan['num_partitions'], plan['assignments'], plan['salted'])
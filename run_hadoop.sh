@@ -27,6 +27,31 @@ fi
 MAPPER="hadoop_mapper.py"
 REDUCER="hadoop_reducer.py"
 JOB_NAME="WordCount_$(date +%Y%m%d%H%M%S)"
+# In-mapper combining window (distinct words buffered per flush, 0 disables combining)
+COMBINE_BUFFER=${WORDCOUNT_COMBINE_BUFFER:-100000}
+# Tokenizer shared with the local engine (see tokenizer.py): ascii-alpha, whitespace or unicode
+TOKENIZER_MODE=${WORDCOUNT_TOKENIZER:-ascii-alpha}
+CASE_FOLD=${WORDCOUNT_CASE_FOLD:-1}
+# Stopwords: 'english', or a comma-separated list
+STOPWORDS=${WORDCOUNT_STOPWORDS:-}
+# Modules imported by the mapper; jobs.py and routing.py are added below when they are used
+MODULES="tokenizer.py"
+# Optional fused pass, e.g. unigram,bigram,docfreq,vocab (see jobs.py); one output file per job
+JOBS=${WORDCOUNT_JOBS:-}
+# Optional skew-aware partition plan from 'python3 partitioner.py plan INPUT --reducers N'
+PARTITION_PLAN=${WORDCOUNT_PARTITION_PLAN:-}
+GENERIC_ARGS=()
+STREAMING_ARGS=()
+if [ -n "$JOBS" ]; then
+    MODULES="$MODULES,jobs.py"
+fi
+if [ -n "$PARTITION_PLAN" ]; then
+    # Mapper keys become "label\tword": partition on the label only, sort on both fields
+    MODULES="$MODULES,routing.py,$PARTITION_PLAN"
+    GENERIC_ARGS=(-D stream.num.map.output.key.fields=2 -D mapreduce.partition.keypartitioner.options=-k1,1)
+    STREAMING_ARGS=(-cmdenv "WORDCOUNT_PARTITION_PLAN=$(basename "$PARTITION_PLAN")"
+                    -partitioner org.apache.hadoop.mapred.lib.KeyFieldBasedPartitioner)
+fi
 
 # Ensure the scripts are executable
 chmod +x $MAPPER $REDUCER
@@ -38,7 +63,14 @@ hdfs dfs -rm -r -f $OUTPUT_DIR
 hadoop jar $HADOOP_STREAMING_JAR \
     -D mapred.job.name=$JOB_NAME \
     -D mapreduce.job.reduces=$NUM_REDUCERS \
-    -files $MAPPER,$REDUCER \
+    "${GENERIC_ARGS[@]}" \
+    -files $MAPPER,$REDUCER,$MODULES \
+    -cmdenv WORDCOUNT_COMBINE_BUFFER=$COMBINE_BUFFER \
+    -cmdenv WORDCOUNT_TOKENIZER=$TOKENIZER_MODE \
+    -cmdenv WORDCOUNT_CASE_FOLD=$CASE_FOLD \
+    -cmdenv "WORDCOUNT_STOPWORDS=$STOPWORDS" \
+    -cmdenv "WORDCOUNT_JOBS=$JOBS" \
+    "${STREAMING_ARGS[@]}" \
     -mapper "$MAPPER" \
     -reducer "$REDUCER" \
     -input $INPUT_FILE \
@@ -51,4 +83,12 @@ echo "To view results: hdfs dfs -cat ${OUTPUT_DIR}/part-*"
 
 # Optional: Merge and download results to local file
 hdfs dfs -getmerge $OUTPUT_DIR output_file_hadoop.txt
+if [ -n "$PARTITION_PLAN" ]; then
+    # Salted words were spread over several reducers: sum their partial counts
+    python3 partitioner.py merge "$PARTITION_PLAN" output_file_hadoop.txt
+fi
+if [ -n "$JOBS" ]; then
+    # Write output_file_hadoop_<job>.txt for every job of the fused pass
+    python3 jobs.py split "$JOBS" output_file_hadoop.txt
+fi
 echo "Results merged to output_file_hadoop.txt"
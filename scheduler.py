@@ -0,0 +1,133 @@
+import time
+import queue
+import threading
+from statistics import median
+from collections import deque
+from records import SharedRecordBlock, RecordFile
+
+# Tasks finishing faster than this are never worth a speculative copy
+MIN_SPECULATION_SECONDS = 0.5
+POLL_SECONDS = 0.05
+
+def discard_output(output):
+    # Free the shared memory segments or record files of a result that lost to another attempt
+    for block in output if isinstance(output, list) else [output]:
+        if isinstance(block, (SharedRecordBlock, RecordFile)):
+            block.release()
+
+class TaskScheduler:
+    """
+    Dynamic map task scheduling on a multiprocessing Pool.
+
+    At most one task per worker is outstanding, so a worker that becomes idle
+    immediately pulls the next pending task: fast workers take over the work
+    a slow one would have had under static starmap chunking. Once nothing is
+    pending, tasks running longer than speculation_factor times the median
+    task time get a speculative copy on an idle worker, and the first attempt
+    to finish wins. A failed task is retried up to max_retries times before
+    its error fails the job.
+    """
+
+    def __init__(self, pool, num_workers, max_retries=2, speculation_factor=2.0, min_speculation_seconds=MIN_SPECULATION_SECONDS):
+        self.pool = pool
+        self.num_workers = num_workers
+        self.max_retries = max_retries
+        self.speculation_factor = speculation_factor
+        self.min_speculation_seconds = min_speculation_seconds
+        self.stats = {'attempts': 0, 'retried_tasks': 0, 'speculative_tasks': 0, 'speculative_wins': 0, 'wasted_attempts': 0}
+
+    def starmap(self, function, task_args):
+        """Like Pool.starmap: return the outputs in task order."""
+        # Task arguments may be a generator, e.g. from main.wrapped_tasks
+        task_args = list(task_args)
+        outputs = [None] * len(task_args)
+        for index, output in self.completed(function, task_args):
+            outputs[index] = output
+        return outputs
+
+    def completed(self, function, task_args):
+        """Yield (task index, output) pairs as tasks finish."""
+        task_args = list(task_args)
+        completions = queue.Queue()
+        pending = deque(range(len(task_args)))
+        attempts = [0] * len(task_args)
+        # (task, attempt) -> start time, for every attempt still occupying a worker
+        running = {}
+        durations = []
+        done = set()
+        # Set once nothing drains completions any more; attempts still running, such as a straggler
+        # that lost to its speculative copy, then discard their own output when they finish
+        abandoned = False
+        abandon_lock = threading.Lock()
+
+        def complete(index, attempt, succeeded, value):
+            with abandon_lock:
+                if not abandoned:
+                    completions.put((index, attempt, succeeded, value))
+                    return
+            if succeeded:
+                discard_output(value)
+
+        def launch(index):
+            attempt = attempts[index]
+            attempts[index] += 1
+            self.stats['attempts'] += 1
+            running[index, attempt] = time.monotonic()
+            self.pool.apply_async(function, task_args[index],
+                                  callback=lambda output: complete(index, attempt, True, output),
+                                  error_callback=lambda error: complete(index, attempt, False, error))
+
+        try:
+            while len(done) < len(task_args):
+                while pending and len(running) < self.num_workers:
+                    launch(pending.popleft())
+                if not pending:
+                    self.speculate(launch, running, durations, done, attempts)
+                try:
+                    index, attempt, succeeded, value = completions.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                start_time = running.pop((index, attempt))
+                if index in done:
+                    # A slower duplicate of a finished task
+                    self.stats['wasted_attempts'] += 1
+                    if succeeded:
+                        discard_output(value)
+                elif succeeded:
+                    done.add(index)
+                    durations.append(time.monotonic() - start_time)
+                    if attempt > 0 and any(task == index for task, _ in running):
+                        self.stats['speculative_wins'] += 1
+                    yield index, value
+                elif any(task == index for task, _ in running):
+                    # Another attempt of this task is still running and may succeed
+                    self.stats['wasted_attempts'] += 1
+                elif attempts[index] <= self.max_retries:
+                    print(f"Retrying map task {index} after error: {value}")
+                    self.stats['retried_tasks'] += 1
+                    pending.appendleft(index)
+                else:
+                    raise value
+        finally:
+            with abandon_lock:
+                abandoned = True
+            while not completions.empty():
+                _, _, succeeded, value = completions.get_nowait()
+                if succeeded:
+                    discard_output(value)
+
+    def speculate(self, launch, running, durations, done, attempts):
+        # Duplicate the slowest stragglers onto idle workers, one copy per task at a time
+        if not self.speculation_factor or not durations or len(running) >= self.num_workers:
+            return
+        threshold = max(self.speculation_factor * median(durations), self.min_speculation_seconds)
+        now = time.monotonic()
+        newest_start = {}
+        for (index, _), start_time in running.items():
+            newest_start[index] = max(start_time, newest_start.get(index, start_time))
+        for index, start_time in sorted(newest_start.items(), key=lambda item: item[1]):
+            if len(running) >= self.num_workers:
+                return
+            if index not in done and now - start_time > threshold and attempts[index] <= self.max_retries:
+                self.stats['speculative_tasks'] += 1
+                launch(index)
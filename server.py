@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from split_new import expand_inputs, plan_input_splits
+from mapping import split_mapper, bytes_split_mapper
+from shuffling import merge_counts
+from topk import top_k
+from metrics import init_worker
+
+DEFAULT_SOCKET = '/tmp/wordcount.sock'
+# Jobs smaller than this are mapped in the job thread, skipping the pool round trip
+INLINE_BYTES = 256 * 1024
+
+def map_split(split, engine):
+    if engine == 'bytes':
+        return bytes_split_mapper(split)
+    return split_mapper(split, True)
+
+def map_split_task(args):
+    return map_split(*args)
+
+def init_server_worker():
+    # Ctrl-C stops the server, which then shuts the pool down; workers must not die first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker(None)
+
+class WordCountServer:
+    """
+    Long-running word count service: one warm worker pool shared by all jobs,
+    at most max_jobs jobs running at once and up to max_queued more waiting.
+    Jobs are submitted through submit()/count(), or over a Unix socket with serve().
+    """
+
+    def __init__(self, num_workers=None, max_jobs=2, max_queued=100, split_size=4 * 1024 * 1024):
+        self.num_workers = num_workers or os.cpu_count() or 4
+        self.split_size = split_size
+        self.pool = Pool(processes=self.num_workers, initializer=init_server_worker)
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='wordcount-job')
+        # Running plus queued jobs; submit() refuses new jobs instead of queueing without bound
+        self.slots = threading.BoundedSemaphore(max_jobs + max_queued)
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'running': 0}
+        self.socket_server = None
+
+    def run_job(self, input_file, top_k_words=None, engine='text'):
+        with self.lock:
+            self.stats['running'] += 1
+        start_time = time.perf_counter()
+        try:
+            input_files = expand_inputs(input_file)
+            if not input_files:
+                raise FileNotFoundError(f"Input file '{input_file}' not found.")
+            splits = plan_input_splits(input_files, self.split_size)
+            if sum(end - start for _, start, end in splits) < INLINE_BYTES:
+                word_counts = merge_counts(map_split(split, engine) for split in splits)
+            else:
+                word_counts = merge_counts(self.pool.imap_unordered(map_split_task, [(split, engine) for split in splits]))
+            result = {'distinct_words': len(word_counts), 'total_words': sum(word_counts.values())}
+            if top_k_words:
+                result['top'] = top_k(word_counts.items(), top_k_words)
+            else:
+                result['counts'] = dict(word_counts)
+            result['seconds'] = time.perf_counter() - start_time
+            with self.lock:
+                self.stats['completed'] += 1
+            return result
+        except Exception:
+            with self.lock:
+                self.stats['failed'] += 1
+            raise
+        finally:
+            with self.lock:
+                self.stats['running'] -= 1
+            self.slots.release()
+
+    def submit(self, input_file, top_k_words=None, engine='text'):
+        """Queue a job and return a Future of its result dict."""
+        if engine not in ('text', 'bytes'):
+            raise ValueError(f"Unknown engine '{engine}', expected 'text' or 'bytes'.")
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.stats['rejected'] += 1
+            raise RuntimeError("Job queue is full, try again later.")
+        with self.lock:
+            self.stats['submitted'] += 1
+        return self.executor.submit(self.run_job, input_file, top_k_words, engine)
+
+    def count(self, input_file, top_k_words=None, engine='text'):
+        return self.submit(input_file, top_k_words, engine).result()
+
+    def serve(self, socket_path=DEFAULT_SOCKET):
+        """Accept newline-delimited JSON requests on a Unix socket until shutdown()."""
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    self.wfile.write((json.dumps(server.handle_request(line)) + '\n').encode('utf-8'))
+
+        self.socket_server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        self.socket_server.daemon_threads = True
+        print(f"Word count server listening on {socket_path} ({self.num_workers} workers)")
+        try:
+            self.socket_server.serve_forever()
+        finally:
+            self.socket_server.server_close()
+            self.socket_server = None
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    def handle_request(self, line):
+        try:
+            request = json.loads(line)
+            if request.get('command') == 'stats':
+                with self.lock:
+                    return {'ok': True, 'stats': dict(self.stats)}
+            result = self.count(request['input'], request.get('top_k'), request.get('engine', 'text'))
+            return dict(result, ok=True)
+        except Exception as e:
+            return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+    def shutdown(self):
+        if self.socket_server is not None:
+            self.socket_server.shutdown()
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+def request(payload, socket_path=DEFAULT_SOCKET):
+    """Send one request to a running server and return its decoded response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(payload) + '\n').encode('utf-8'))
+        with client.makefile('rb') as f:
+            return json.loads(f.readline())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run word count jobs on a persistent worker pool.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='start the server')
+    serve_parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    serve_parser.add_argument('--max-jobs', type=int, default=2, help='jobs running at once')
+    serve_parser.add_argument('--max-queued', type=int, default=100, help='jobs waiting before new ones are refused')
+    submit_parser = subparsers.add_parser('submit', help='count the words of an input on a running server')
+    submit_parser.add_argument('input', help='input file, directory or glob')
+    submit_parser.add_argument('--top-k', type=int, default=10, help='number of words to return (0 returns all counts)')
+    submit_parser.add_argument('--engine', choices=['text', 'bytes'], default='text')
+    subparsers.add_parser('stats', help='show job statistics of a running server')
+    for subparser in subparsers.choices.values():
+        subparser.add_argument('--socket', default=DEFAULT_SOCKET)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        # SIGTERM stops the server like Ctrl-C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        with WordCountServer(args.workers, args.max_jobs, args.max_queued) as server:
+            try:
+                server.serve(args.socket)
+            except KeyboardInterrupt:
+                pass
+    elif args.command == 'stats':
+        print(json.dumps(request({'command': 'stats'}, args.socket), indent=2))
+    else:
+        # The server resolves paths from its own working directory
+        response = request({'input': os.path.abspath(args.input), 'top_k': args.top_k or None, 'engine': args.engine}, args.socket)
+        if not response['ok']:
+            print(f"Error: {response['error']}")
+            sys.exit(1)
+        for word, count in response.get('top', response.get('counts', {}).items()):
+            print(f"{word} {count}")
+        print(f"{response['distinct_words']} distinct words, {response['total_words']} total, {response['seconds'] * 1000:.1f} ms")
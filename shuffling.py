@@ -1,12 +1,169 @@
-from collections import defaultdict
+import os
+import sys
+import zlib
+import heapq
+import shutil
+import tempfile
+from itertools import groupby
+from collections import defaultdict, Counter
+from counttable import CountTable
+from records import read_blocks, write_blocks
 
 def shuffle(mapper_outputs):
     shuffled = defaultdict(list)
     for output in mapper_outputs:
-        for word, count in output:
+        # Combined outputs are word -> partial count tables, plain outputs are (word, 1) lists
+        pairs = output.items() if hasattr(output, 'items') else output
+        for word, count in pairs:
             shuffled[word].append(count)
     return shuffled
 
+def merge_counts(mapper_outputs):
+    # Merge combined mapper outputs straight into one word -> total table,
+    # so memory scales with the vocabulary instead of the token count.
+    merged = Counter()
+    for output in mapper_outputs:
+        if isinstance(output, dict):
+            merged.update(output)
+        else:
+            # Lists of pairs, and record blocks whose items() are decoded pairs
+            pairs = output.items() if hasattr(output, 'items') else output
+            for word, count in pairs:
+                merged[word] += count
+    return merged
+
+def merge_tables(mapper_outputs):
+    # Like merge_counts, but into one compact CountTable instead of a Counter.
+    # The first map output is merged into in place when it already is a CountTable
+    merged = None
+    for output in mapper_outputs:
+        if merged is None:
+            merged = output if isinstance(output, CountTable) else CountTable.from_counts(output)
+        else:
+            merged.update(output)
+    if merged is None:
+        return CountTable()
+    return merged
+
+def partition_for(word, num_partitions):
+    # crc32 is stable across worker processes, unlike the salted built-in hash()
+    return zlib.crc32(word.encode('utf-8')) % num_partitions
+
+def partition(mapper_output, num_partitions, partitioner=None, salt=0):
+    # Hash-partition one map output into num_partitions buckets, one per reducer. A skew-aware
+    # partitioner (see partitioner.py) places heavy words itself and spreads salted words by salt
+    if hasattr(mapper_output, 'items'):
+        partitions = [Counter() for _ in range(num_partitions)]
+        for word, count in mapper_output.items():
+            target = partitioner.partition_for(word, salt) if partitioner else partition_for(word, num_partitions)
+            partitions[target][word] += count
+    else:
+        partitions = [[] for _ in range(num_partitions)]
+        for offset, (word, count) in enumerate(mapper_output):
+            target = partitioner.partition_for(word, salt + offset) if partitioner else partition_for(word, num_partitions)
+            partitions[target].append((word, count))
+    return partitions
+
+# Approximate bytes per buffered entry on top of the word itself (dict slot + int)
+ENTRY_OVERHEAD = 100
+
+def read_run(run_file):
+    # Stream (word, count) pairs back from a sorted run file, one record block at a time
+    with open(run_file, 'rb') as f:
+        yield from read_blocks(f)
+
+def write_run(run_file, sorted_pairs, compress=False):
+    # Run files are sequences of binary record blocks (see records.py)
+    with open(run_file, 'wb') as f:
+        write_blocks(f, sorted_pairs, compress)
+
+def combine_sorted(sorted_pairs):
+    # Sum the counts of adjacent equal words in a sorted stream
+    for word, group in groupby(sorted_pairs, key=lambda x: x[0]):
+        yield word, sum(count for _, count in group)
+
+class SpillingShuffle:
+    """
+    Shuffle with bounded memory: partial counts are buffered until the buffer
+    passes memory_budget bytes, then sorted and spilled to a run file. Reading
+    back does a streaming k-way merge over the runs, producing the sorted
+    word<TAB>count stream that hadoop_reducer.py expects. With compress=True
+    the run blocks are zlib-compressed.
+    """
+
+    def __init__(self, memory_budget, spill_dir=None, merge_fan_in=64, compress=False):
+        self.memory_budget = memory_budget
+        self.merge_fan_in = merge_fan_in
+        self.compress = compress
+        self.spill_dir = tempfile.mkdtemp(prefix='shuffle_', dir=spill_dir)
+        self.buffer = Counter()
+        self.buffer_bytes = 0
+        self.runs = []
+        self.run_counter = 0
+        self.spills = 0
+        self.spilled_bytes = 0
+        self.merge_passes = 0
+
+    def add(self, mapper_output):
+        pairs = mapper_output.items() if hasattr(mapper_output, 'items') else mapper_output
+        for word, count in pairs:
+            if word not in self.buffer:
+                self.buffer_bytes += sys.getsizeof(word) + ENTRY_OVERHEAD
+            self.buffer[word] += count
+            if self.buffer_bytes > self.memory_budget:
+                self.spill()
+
+    def new_run_file(self):
+        self.run_counter += 1
+        return os.path.join(self.spill_dir, f'run_{self.run_counter:05d}.rec')
+
+    def spill(self):
+        if not self.buffer:
+            return
+        run_file = self.new_run_file()
+        write_run(run_file, sorted(self.buffer.items()), self.compress)
+        self.runs.append(run_file)
+        self.spills += 1
+        self.spilled_bytes += os.path.getsize(run_file)
+        self.buffer = Counter()
+        self.buffer_bytes = 0
+
+    def merge_runs(self, run_files):
+        return heapq.merge(*(read_run(run_file) for run_file in run_files))
+
+    def sorted_stream(self):
+        # Sorted (word, partial count) stream; equal words are adjacent
+        if not self.runs:
+            return iter(sorted(self.buffer.items()))
+        self.spill()
+        # Intermediate passes keep the number of open run files at merge_fan_in
+        while len(self.runs) > self.merge_fan_in:
+            self.merge_passes += 1
+            merged_runs = []
+            for i in range(0, len(self.runs), self.merge_fan_in):
+                group = self.runs[i:i + self.merge_fan_in]
+                run_file = self.new_run_file()
+                write_run(run_file, combine_sorted(self.merge_runs(group)), self.compress)
+                for old_run in group:
+                    os.remove(old_run)
+                merged_runs.append(run_file)
+            self.runs = merged_runs
+        self.merge_passes += 1
+        return self.merge_runs(self.runs)
+
+    def metrics(self):
+        return {
+            'spills': self.spills,
+            'spilled_bytes': self.spilled_bytes,
+            'runs': len(self.runs),
+            'merge_passes': self.merge_passes,
+        }
+
+    def close(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
 if __name__ == '__main__':
     mapper_outputs = [[('word1', 1), ('word2', 1)], [('word1', 1), ('word3', 1)]]
     print(shuffle(mapper_outputs))
+    print(merge_counts([{'word1': 2, 'word2': 1}, {'word1': 1, 'word3': 1}]))
+    print(partition({'word1': 2, 'word2': 1, 'word3': 1}, 2))
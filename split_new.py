@@ -1,6 +1,8 @@
 # filepath: d:\EDU\MapReduce-WordCount-Python-main\split.py
 import os
+import glob
 import math
+import codecs
 from multiprocessing import Pool
 
 def split_file(input_file, chunk_size=128 * 1024 * 1024, word_chunk_size=1000):
@@ -16,6 +18,8 @@ def split_file(input_file, chunk_size=128 * 1024 * 1024, word_chunk_size=1000):
                         chunk_data = f.read(chunk_size)
                         if not chunk_data:
                             break
+                        # Finish the current line so no word is cut at the chunk boundary
+                        chunk_data += f.readline()
                         chunk_file = f'chunk_{chunk_number}.txt'
                         with open(chunk_file, 'w', encoding='utf-8') as chunk:
                             chunk.write(chunk_data)
@@ -29,6 +33,8 @@ def split_file(input_file, chunk_size=128 * 1024 * 1024, word_chunk_size=1000):
                         chunk_data = f.read(chunk_size)
                         if not chunk_data:
                             break
+                        # Finish the current line so no word is cut at the chunk boundary
+                        chunk_data += f.readline()
                         chunk_file = f'chunk_{chunk_number}.txt'
                         with open(chunk_file, 'w', encoding='latin-1') as chunk:
                             chunk.write(chunk_data)
@@ -62,6 +68,79 @@ def split_file(input_file, chunk_size=128 * 1024 * 1024, word_chunk_size=1000):
         print(f"Error in split_file: {e}")
         return []
 
+# Compressed inputs are not splittable: each one becomes a single split that the
+# worker decompresses as a stream
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz')
+
+def is_compressed(input_file):
+    return input_file.endswith(COMPRESSED_EXTENSIONS)
+
+def expand_inputs(input_pattern):
+    # Resolve a file, a directory (walked recursively) or a glob pattern to a sorted list of files
+    if os.path.isdir(input_pattern):
+        paths = [os.path.join(root, name) for root, _, files in os.walk(input_pattern) for name in files]
+    elif os.path.isfile(input_pattern):
+        paths = [input_pattern]
+    else:
+        paths = glob.glob(input_pattern, recursive=True)
+    return sorted(path for path in paths if os.path.isfile(path) and not os.path.basename(path).startswith('.'))
+
+# Encodings whose newlines are not single '\n' bytes, detected by their byte order mark
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+def detect_wide_encoding(input_file):
+    # Return the encoding of a UTF-16/UTF-32 file, or None for ASCII-compatible files
+    with open(input_file, 'rb') as f:
+        head = f.read(4)
+    for bom, encoding in BOM_ENCODINGS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+def find_line_start(f, offset, file_size, block_size=64 * 1024):
+    # Return the first line start at or after offset
+    if offset <= 0:
+        return 0
+    f.seek(offset - 1)
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return file_size
+        newline = block.find(b'\n')
+        if newline != -1:
+            return f.tell() - len(block) + newline + 1
+
+def plan_splits(input_file, split_size=128 * 1024 * 1024):
+    """
+    Plan newline-aligned byte ranges over input_file, like Hadoop InputSplits.
+    Returns a list of (path, start, end) tuples; nothing is copied or written.
+    """
+    file_size = os.path.getsize(input_file)
+    splits = []
+    if is_compressed(input_file) or detect_wide_encoding(input_file):
+        # Compressed streams cannot be entered mid-way, and byte offsets cannot be
+        # newline-aligned safely in wide encodings
+        return [(input_file, 0, file_size)] if file_size else []
+    with open(input_file, 'rb') as f:
+        start = 0
+        while start < file_size:
+            end = find_line_start(f, start + split_size, file_size)
+            splits.append((input_file, start, end))
+            start = end
+    return splits
+
+def plan_input_splits(input_files, split_size=128 * 1024 * 1024):
+    # Splits for every input file; large plain files get several, compressed files one each
+    splits = []
+    for input_file in input_files:
+        splits.extend(plan_splits(input_file, split_size))
+    return splits
+
 if __name__ == '__main__':
     input_file = 'input_file.txt'
-    split_file(input_file)
+    print(plan_splits(input_file, 4096))
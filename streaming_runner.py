@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import os
+import sys
+import zlib
+import heapq
+import shlex
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from functools import partial
+from multiprocessing import Pool
+from split_new import expand_inputs, plan_input_splits, is_compressed
+from mapping import read_compressed_batches
+from routing import key_field_partition
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MAPPER = f'"{sys.executable}" "{os.path.join(SCRIPT_DIR, "hadoop_mapper.py")}"'
+DEFAULT_REDUCER = f'"{sys.executable}" "{os.path.join(SCRIPT_DIR, "hadoop_reducer.py")}"'
+
+def record_key(line, key_fields=1):
+    # Streaming keys are the text before the first tab (the whole line if there is none),
+    # or the first key_fields fields like stream.num.map.output.key.fields
+    if key_fields == 1:
+        return line.split(b'\t', 1)[0].rstrip(b'\r\n')
+    return b'\t'.join(line.rstrip(b'\r\n').split(b'\t', key_fields)[:key_fields])
+
+def partition_for_key(key, num_partitions):
+    # Same crc32 partitioning as shuffling.partition_for, applied to the raw key bytes
+    return zlib.crc32(key) % num_partitions
+
+def partition_for_line(line, num_partitions, key_fields=1, partitioner='hash'):
+    if partitioner == 'keyfield':
+        # KeyFieldBasedPartitioner with -k1,1: only the first field decides the partition
+        return key_field_partition(record_key(line), num_partitions)
+    return partition_for_key(record_key(line, key_fields), num_partitions)
+
+def read_split_blocks(split, block_size=1024 * 1024):
+    path, start, end = split
+    if is_compressed(path):
+        yield from read_compressed_batches(path, block_size)
+        return
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+def feed_process(process, blocks):
+    try:
+        for block in blocks:
+            process.stdin.write(block)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+def spill_partitions(buffers, task_dir, spill_number, key_fields=1):
+    # Sort every partition buffer by key and write it as one run file
+    run_files = {}
+    for partition_number, lines in enumerate(buffers):
+        if not lines:
+            continue
+        lines.sort(key=partial(record_key, key_fields=key_fields))
+        run_file = os.path.join(task_dir, f'part-{partition_number:05d}-run-{spill_number:05d}')
+        with open(run_file, 'wb') as f:
+            f.writelines(lines)
+        run_files[partition_number] = run_file
+        lines.clear()
+    return run_files
+
+def run_map_task(task_number, split, mapper_command, num_reducers, work_dir, sort_buffer_bytes, key_fields=1, partitioner='hash'):
+    """
+    Run the mapper script over one input split, partition its output by key
+    and spill key-sorted runs per partition, like Hadoop's map-side sort.
+    Returns {partition: [run files]}.
+    """
+    task_dir = os.path.join(work_dir, f'map-{task_number:05d}')
+    os.makedirs(task_dir, exist_ok=True)
+    process = subprocess.Popen(shlex.split(mapper_command), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    writer = threading.Thread(target=feed_process, args=(process, read_split_blocks(split)), daemon=True)
+    writer.start()
+
+    buffers = [[] for _ in range(num_reducers)]
+    buffered_bytes = 0
+    spill_number = 0
+    runs = {}
+    for line in process.stdout:
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        buffers[partition_for_line(line, num_reducers, key_fields, partitioner)].append(line)
+        buffered_bytes += len(line)
+        if buffered_bytes >= sort_buffer_bytes:
+            for partition_number, run_file in spill_partitions(buffers, task_dir, spill_number, key_fields).items():
+                runs.setdefault(partition_number, []).append(run_file)
+            spill_number += 1
+            buffered_bytes = 0
+    for partition_number, run_file in spill_partitions(buffers, task_dir, spill_number, key_fields).items():
+        runs.setdefault(partition_number, []).append(run_file)
+
+    writer.join()
+    if process.wait() != 0:
+        raise RuntimeError(f"Mapper exited with code {process.returncode} on split {split}")
+    return runs
+
+def merge_run_files(run_files, key_fields=1):
+    # Streaming k-way merge of key-sorted run files
+    files = [open(run_file, 'rb') for run_file in run_files]
+    try:
+        yield from heapq.merge(*files, key=partial(record_key, key_fields=key_fields))
+    finally:
+        for f in files:
+            f.close()
+
+def reduce_runs(run_files, work_dir, partition_number, merge_fan_in, key_fields=1):
+    # Merge runs in passes until at most merge_fan_in files remain open at once
+    merge_pass = 0
+    while len(run_files) > merge_fan_in:
+        merged = []
+        for i in range(0, len(run_files), merge_fan_in):
+            merged_file = os.path.join(work_dir, f'merge-{partition_number:05d}-{merge_pass}-{i // merge_fan_in:05d}')
+            with open(merged_file, 'wb') as f:
+                f.writelines(merge_run_files(run_files[i:i + merge_fan_in], key_fields))
+            merged.append(merged_file)
+        run_files = merged
+        merge_pass += 1
+    return merge_run_files(run_files, key_fields)
+
+def batch_lines(lines, batch_size=1024 * 1024):
+    batch = []
+    batch_bytes = 0
+    for line in lines:
+        batch.append(line)
+        batch_bytes += len(line)
+        if batch_bytes >= batch_size:
+            yield b''.join(batch)
+            batch.clear()
+            batch_bytes = 0
+    if batch:
+        yield b''.join(batch)
+
+def run_reduce_task(partition_number, run_files, reducer_command, output_dir, work_dir, merge_fan_in, key_fields=1):
+    """Merge all sorted runs of one partition into the reducer script, writing part-NNNNN."""
+    part_file = os.path.join(output_dir, f'part-{partition_number:05d}')
+    with open(part_file, 'wb') as output:
+        process = subprocess.Popen(shlex.split(reducer_command), stdin=subprocess.PIPE, stdout=output)
+        merged_lines = reduce_runs(sorted(run_files), work_dir, partition_number, merge_fan_in, key_fields)
+        feed_process(process, batch_lines(merged_lines))
+        if process.wait() != 0:
+            raise RuntimeError(f"Reducer exited with code {process.returncode} on partition {partition_number}")
+    return part_file
+
+def run_streaming_job(input_pattern, output_dir, mapper_command=DEFAULT_MAPPER, reducer_command=DEFAULT_REDUCER,
+                      num_mappers=None, num_reducers=1, split_size=64 * 1024 * 1024,
+                      sort_buffer_bytes=64 * 1024 * 1024, merge_fan_in=64, work_dir=None, key_fields=1, partitioner='hash'):
+    """
+    Run a Hadoop Streaming mapper/reducer pair locally: M parallel mapper
+    processes over input splits, a partitioned external sort shuffle, and R
+    parallel reducers writing output_dir/part-NNNNN. Returns the part files.
+    key_fields and partitioner='keyfield' mirror stream.num.map.output.key.fields
+    and KeyFieldBasedPartitioner -k1,1, as used with a skew-aware partition plan.
+    """
+    if partitioner not in ('hash', 'keyfield'):
+        raise ValueError(f"Unknown partitioner '{partitioner}', expected 'hash' or 'keyfield'.")
+    input_files = expand_inputs(input_pattern)
+    if not input_files:
+        raise FileNotFoundError(f"Input file '{input_pattern}' not found.")
+    splits = plan_input_splits(input_files, split_size)
+    num_mappers = num_mappers or os.cpu_count() or 4
+    os.makedirs(output_dir, exist_ok=True)
+    job_dir = tempfile.mkdtemp(prefix='streaming_', dir=work_dir)
+    try:
+        map_inputs = [(i, split, mapper_command, num_reducers, job_dir, sort_buffer_bytes, key_fields, partitioner) for i, split in enumerate(splits)]
+        partition_runs = {}
+        with Pool(processes=num_mappers) as pool:
+            for runs in pool.starmap(run_map_task, map_inputs, chunksize=1):
+                for partition_number, run_files in runs.items():
+                    partition_runs.setdefault(partition_number, []).extend(run_files)
+
+        reduce_inputs = [(r, partition_runs.get(r, []), reducer_command, output_dir, job_dir, merge_fan_in, key_fields) for r in range(num_reducers)]
+        with Pool(processes=num_reducers) as pool:
+            return pool.starmap(run_reduce_task, reduce_inputs, chunksize=1)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a Hadoop Streaming job locally with parallel mappers, a sort-based shuffle and parallel reducers.')
+    parser.add_argument('input', help='input file, directory or glob')
+    parser.add_argument('output_dir')
+    parser.add_argument('--mapper', default=DEFAULT_MAPPER, help='mapper command (default: hadoop_mapper.py)')
+    parser.add_argument('--reducer', default=DEFAULT_REDUCER, help='reducer command (default: hadoop_reducer.py)')
+    parser.add_argument('--mappers', type=int, default=None, help='parallel mapper processes (default: CPU count)')
+    parser.add_argument('--reducers', type=int, default=1, help='reducers / partitions, like mapreduce.job.reduces')
+    parser.add_argument('--split-size', type=int, default=64 * 1024 * 1024, help='input split size in bytes')
+    parser.add_argument('--sort-buffer', type=int, default=64 * 1024 * 1024, help='map-side sort buffer in bytes before spilling')
+    parser.add_argument('--work-dir', default=None, help='directory for intermediate run files (default: system temp)')
+    parser.add_argument('--key-fields', type=int, default=1, help='leading tab-separated fields that form the sort key (stream.num.map.output.key.fields)')
+    parser.add_argument('--partitioner', choices=('hash', 'keyfield'), default='hash',
+                        help="'keyfield' partitions on the first field like KeyFieldBasedPartitioner -k1,1")
+    args = parser.parse_args()
+
+    part_files = run_streaming_job(args.input, args.output_dir, args.mapper, args.reducer, args.mappers, args.reducers,
+                                   args.split_size, args.sort_buffer, work_dir=args.work_dir,
+                                   key_fields=args.key_fields, partitioner=args.partitioner)
+    print(f"Job completed. Output written to {len(part_files)} part files in {args.output_dir}")
@@ -1,6 +1,20 @@
 # filepath: d:\EDU\MapReduce-WordCount-Python-main\test.py
+import io
 import os
+import re
+import json
+import contextlib
 import time
+import pickle
+import random
+import tempfile
+from multiprocessing import Pool
+
+def print_section(title):
+    """Print a section header"""
+    print("\n" + "="*80)
+    print(f" {title} ".center(80, "="))
+    print("="*80 + "\n")
 
 def generate_test_file(filename="test_input.txt", size_in_kb=100):
     """Generate a test input file of approximately the specified size."""
@@ -68,5 +82,695 @@ def run_test():
     else:
         print("\nTest failed! No output file was generated.")
 
+def generate_vocabulary_file(filename, num_words=60000, vocabulary_size=20000, seed=0):
+    # Many distinct words, so a small shuffle memory budget spills many runs
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9))) for _ in range(vocabulary_size)]
+    with open(filename, 'w', encoding='utf-8') as f:
+        for start in range(0, num_words, 12):
+            f.write(' '.join(rng.choice(vocabulary) for _ in range(12)) + '\n')
+
+def run_main(**env):
+    """Run main.main() with the given environment variables, restoring them afterwards; returns its output"""
+    import main
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            main.main()
+        return output.getvalue()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def read_counts(output_file):
+    # "word count" lines, in any order
+    if not os.path.exists(output_file):
+        return None
+    with open(output_file, 'r', encoding='utf-8') as f:
+        return {word: int(count) for word, count in (line.split() for line in f)}
+
+def test_spilling_shuffle():
+    """A tiny SHUFFLE_MEMORY_BUDGET spills and merges runs and matches the in-memory output"""
+    print_section("TESTING SPILLING SHUFFLE")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'input.txt')
+        generate_vocabulary_file(input_file)
+        in_memory_file = os.path.join(temp_dir, 'in_memory.txt')
+        spilled_file = os.path.join(temp_dir, 'spilled.txt')
+        metrics_file = os.path.join(temp_dir, 'metrics.json')
+        shuffle_dirs = {name for name in os.listdir(tempfile.gettempdir()) if name.startswith('shuffle_')}
+        run_main(INPUT_FILE=input_file, OUTPUT_FILE=in_memory_file, MAP_TASK_SIZE='65536')
+        run_main(INPUT_FILE=input_file, OUTPUT_FILE=spilled_file, MAP_TASK_SIZE='65536',
+                 SHUFFLE_MEMORY_BUDGET='4096', METRICS_FILE=metrics_file)
+        expected_counts = read_counts(in_memory_file)
+        spilled_counts = read_counts(spilled_file)
+        # Partitioned reducers only spill when they write part files
+        unsupported = run_main(INPUT_FILE=input_file, OUTPUT_FILE=spilled_file, NUM_REDUCERS='2', SHUFFLE_MEMORY_BUDGET='4096')
+        counters = {}
+        if os.path.exists(metrics_file):
+            with open(metrics_file, 'r', encoding='utf-8') as f:
+                counters = json.load(f)['counters']
+    print(f"Shuffle counters: {counters}")
+    
+    if not expected_counts or spilled_counts != expected_counts:
+        print("Spilled output differs from the in-memory output")
+        return False
+    if counters.get('spills', 0) <= 64 or counters.get('merge_passes', 0) < 2:
+        print("Expected more spill runs than the merge fan-in, and an intermediate merge pass")
+        return False
+    if {name for name in os.listdir(tempfile.gettempdir()) if name.startswith('shuffle_')} - shuffle_dirs:
+        print("Spill directory left behind")
+        return False
+    if 'SHUFFLE_MEMORY_BUDGET with NUM_REDUCERS/OUTPUT_DIR requires OUTPUT_DIR' not in unsupported:
+        print("SHUFFLE_MEMORY_BUDGET was accepted with NUM_REDUCERS but without OUTPUT_DIR")
+        return False
+    return True
+
+def cache_hits(output):
+    # (hits, splits) from the "Hits: H/N splits" line of a CACHE_DIR run
+    match = re.search(r'Hits: (\d+)/(\d+) splits', output)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+def test_result_cache():
+    """CACHE_DIR reruns hit every split, an append only misses the changed splits, a corrupt partial is a miss"""
+    print_section("TESTING RESULT CACHE")
+    from split_new import plan_input_splits
+    from cache import partial_path
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'input.txt')
+        output_file = os.path.join(temp_dir, 'output.txt')
+        expected_file = os.path.join(temp_dir, 'expected.txt')
+        env = dict(INPUT_FILE=input_file, OUTPUT_FILE=output_file, CACHE_DIR=os.path.join(temp_dir, 'cache'), MAP_TASK_SIZE='16384')
+        generate_vocabulary_file(input_file, num_words=30000)
+        old_splits = plan_input_splits([input_file], 16384)
+        
+        first_run = cache_hits(run_main(**env))
+        rerun = cache_hits(run_main(**env))
+        print(f"First run: {first_run}, rerun: {rerun}")
+        if first_run != (0, len(old_splits)) or rerun != (len(old_splits), len(old_splits)):
+            print("Expected no hits on the first run and only hits on the rerun")
+            return False
+        
+        # Appending leaves the splits before the old end of file unchanged
+        with open(input_file, 'a', encoding='utf-8') as f:
+            f.write('appended words for the last split\n' * 2000)
+        new_splits = plan_input_splits([input_file], 16384)
+        unchanged = len(set(new_splits) & set(old_splits))
+        appended = cache_hits(run_main(**env))
+        run_main(INPUT_FILE=input_file, OUTPUT_FILE=expected_file, MAP_TASK_SIZE='16384')
+        print(f"After append: {appended}, unchanged splits: {unchanged}")
+        if appended != (unchanged, len(new_splits)) or not 0 < unchanged < len(new_splits):
+            print("Expected hits for exactly the unchanged splits")
+            return False
+        if read_counts(output_file) != read_counts(expected_file):
+            print("Cached output differs from an uncached run")
+            return False
+        
+        # A truncated partial is mapped again and stored anew
+        digest = next(name[:-len('.partial')] for _, _, names in os.walk(env['CACHE_DIR']) for name in names if name.endswith('.partial'))
+        path = partial_path(env['CACHE_DIR'], digest)
+        size = os.path.getsize(path)
+        with open(path, 'r+b') as f:
+            f.truncate(size // 2)
+        run_main(**env)
+        if read_counts(output_file) != read_counts(expected_file) or os.path.getsize(path) != size:
+            print("A truncated partial was not treated as a miss")
+            return False
+    return True
+
+def test_count_table():
+    """CountTable probing, growth, pickling without its index and table-to-table merges, against Counter"""
+    print_section("TESTING COUNT TABLE")
+    from collections import Counter
+    from counttable import CountTable, EMPTY, MIN_SLOTS, MAX_LOAD
+    
+    rng = random.Random(1)
+    words = [''.join(rng.choice('abcdéfghß') for _ in range(rng.randint(1, 6))) for _ in range(5000)]
+    expected = Counter(words)
+    table = CountTable()
+    for word in words:
+        table.add(word)
+    print(f"{len(table)} keys, {len(table.index)} index slots, {table.nbytes() / len(table):.0f} bytes per key")
+    if dict(table.items()) != expected or len(table) != len(expected):
+        print("Table differs from Counter")
+        return False
+    if len(table.index) <= MIN_SLOTS or len(table) > len(table.index) * MAX_LOAD:
+        print("Index did not grow to keep the load factor")
+        return False
+    if table.most_common(10) != expected.most_common(10) or list(table) != list(expected):
+        print("Ranking or insertion order differs from Counter")
+        return False
+    counts = [count for _, count in table.ranked_items()]
+    if counts != sorted(counts, reverse=True):
+        print("ranked_items is not ordered by count")
+        return False
+    
+    # Colliding hashes must probe past each other
+    colliding = CountTable()
+    for key in (b'first', b'second', b'third'):
+        colliding.add_key(key, 1, key_hash=7)
+    colliding.add_key(b'second', 2, key_hash=7)
+    entries = [colliding.index[colliding.find(key, 7)] for key in (b'first', b'second', b'third', b'fourth')]
+    lookups = [None if entry == EMPTY else colliding.counts[entry] for entry in entries]
+    if lookups != [1, 3, 1, None]:
+        print(f"Linear probing over colliding hashes failed: {lookups}")
+        return False
+    
+    # The index is left out of the pickle and rebuilt on the first lookup
+    restored = pickle.loads(pickle.dumps(table))
+    if table.__getstate__()['index'] is not None or restored.index is not None:
+        print("The index was pickled")
+        return False
+    if restored[words[0]] != expected[words[0]] or 'not a word' in restored or restored.index is None:
+        print("Lookup after unpickling failed")
+        return False
+    if dict(restored.items()) != expected:
+        print("Unpickled table differs from Counter")
+        return False
+    
+    # update(CountTable) merges without decoding, including into an unpickled table
+    other_words = words[::3] + ['zzz', 'ÿ']
+    restored.update(CountTable.from_counts(Counter(other_words)))
+    restored.update({'zzz': 2})
+    expected.update(other_words)
+    expected.update({'zzz': 2})
+    if dict(restored.items()) != expected:
+        print("Merged table differs from Counter")
+        return False
+    return True
+
+def test_record_blocks():
+    """Record block round-trips across column widths, non-ASCII keys and compression, and block file framing"""
+    print_section("TESTING RECORD BLOCKS")
+    from records import (encode_records, decode_records, read_header, decode_varint, check_block, write_blocks, read_blocks,
+                         RecordBlock, SORTED, COMPRESSED)
+    
+    cases = {
+        'empty': [],
+        'one-byte columns': [('a', 1), ('bb', 255)],
+        'two-byte counts': [('word', 256), ('other', 65535)],
+        'four-byte counts': [('word', 65536), ('other', 2 ** 32 - 1)],
+        'eight-byte counts': [('word', 2 ** 32), ('other', 2 ** 64 - 1)],
+        'two-byte key lengths': [('x' * 300, 1), ('y', 2)],
+        'non-ASCII keys': [('café', 3), ('naïve', 1), ('日本語', 7), ('straße', 2), ('ascii', 5)],
+    }
+    widths = {'one-byte columns': 1, 'two-byte counts': 2, 'four-byte counts': 4, 'eight-byte counts': 8}
+    for name, pairs in cases.items():
+        for sort in (False, True):
+            for compress in (False, True):
+                data = encode_records(pairs, sort=sort, compress=compress)
+                check_block(data)
+                flags, num_records, _, position = read_header(data)
+                expected = sorted(pairs) if sort else pairs
+                if list(decode_records(data)) != expected or num_records != len(pairs):
+                    print(f"Round-trip failed: {name}, sort={sort}, compress={compress}")
+                    return False
+                if bool(flags & SORTED) != sort or bool(flags & COMPRESSED) != compress:
+                    print(f"Wrong flags: {name}, sort={sort}, compress={compress}")
+                    return False
+                if name in widths and not compress:
+                    _, body_position = decode_varint(data, position)
+                    if decode_varint(data, body_position)[0] != widths[name]:
+                        print(f"Count column is not {widths[name]} bytes wide: {name}")
+                        return False
+    block = RecordBlock.encode(dict(cases['non-ASCII keys']), compress=True)
+    restored = pickle.loads(pickle.dumps(block))
+    if list(restored.items()) != cases['non-ASCII keys'] or len(restored) != 5:
+        print("RecordBlock pickle round-trip failed")
+        return False
+    try:
+        encode_records([('too big', 2 ** 64)])
+        print("A count over 64 bits was accepted")
+        return False
+    except ValueError:
+        pass
+    
+    # Block files: varint-framed blocks, read back one block at a time
+    pairs = sorted((f'wörd{i:05d}', i * 37) for i in range(1000))
+    for compress in (False, True):
+        stream = io.BytesIO()
+        write_blocks(stream, pairs, compress=compress, block_records=64)
+        data = stream.getvalue()
+        if list(read_blocks(io.BytesIO(data))) != pairs:
+            print(f"Block file round-trip failed, compress={compress}")
+            return False
+        # Cut inside the last block's body, inside a length varint, and at a block boundary
+        first_block_size, header_size = decode_varint(data)
+        for cut, truncated in ((len(data) - 1, True), (header_size + first_block_size + 1, True),
+                               (header_size + first_block_size, False)):
+            try:
+                read_pairs = list(read_blocks(io.BytesIO(data[:cut])))
+            except ValueError:
+                read_pairs = None
+            if truncated != (read_pairs is None) or (not truncated and read_pairs != pairs[:64]):
+                print(f"Truncation at byte {cut} of {len(data)} was not handled, compress={compress}")
+                return False
+        try:
+            check_block(encode_records(pairs, compress=compress)[:-3])
+            print(f"A truncated block passed check_block, compress={compress}")
+            return False
+        except ValueError:
+            pass
+    print(f"{len(cases)} block cases and {len(pairs)}-record block files round-tripped")
+    return True
+
+def test_heavy_hitters():
+    """Both HEAVY_HITTERS summaries find the exact top words of a Zipf corpus without underestimating them"""
+    print_section("TESTING HEAVY HITTERS")
+    from collections import Counter
+    from benchmark import generate_zipf_corpus
+    
+    k, capacity = 12, 1000
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'zipf.txt')
+        output_file = os.path.join(temp_dir, 'top.txt')
+        generate_zipf_corpus(input_file, size_in_mb=2, vocab_size=20000)
+        with open(input_file, 'r', encoding='utf-8') as f:
+            exact = Counter(f.read().split())
+        total = sum(exact.values())
+        expected_words = [word for word, _ in exact.most_common(k)]
+        for mode in ('space-saving', 'count-min'):
+            run_main(INPUT_FILE=input_file, OUTPUT_FILE=output_file, MAP_TASK_SIZE='262144', TOP_K=str(k),
+                     HEAVY_HITTERS=mode, HEAVY_HITTERS_CAPACITY=str(capacity))
+            with open(output_file, 'r', encoding='utf-8') as f:
+                estimates = [(word, int(count)) for word, count in (line.split() for line in f)]
+            errors = [count - exact[word] for word, count in estimates]
+            print(f"{mode}: top {k} errors {errors}")
+            if [word for word, _ in estimates] != expected_words:
+                print(f"{mode} reported {estimates}, expected {exact.most_common(k)}")
+                return False
+            # Estimates are upper bounds; Count-Min overestimates by at most e * total / width with high probability
+            if min(errors) < 0 or (mode == 'count-min' and max(errors) > 2.72 * total / (4 * capacity)):
+                print(f"{mode} estimates are out of bounds")
+                return False
+    
+    # Sketch rows must hash independently: words colliding in the first row must not collide in every row
+    from topk import CountMinSketch
+    sketch = CountMinSketch(2048, 4)
+    rng = random.Random(7)
+    first_row = {}
+    for word in {''.join(rng.choice('abcdefghij') for _ in range(6)) for _ in range(20000)}:
+        first_row.setdefault(sketch.positions(word)[0], []).append(sketch.positions(word))
+    full_collisions = sum(len(rows) - len(set(map(tuple, rows))) for rows in first_row.values())
+    print(f"Words colliding in all rows: {full_collisions}")
+    if full_collisions:
+        return False
+    return True
+
+def test_task_metrics():
+    """Per-task bytes_in adds up to the input size, also when the map function is wrapped"""
+    print_section("TESTING TASK METRICS")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'input.txt')
+        generate_vocabulary_file(input_file, num_words=30000)
+        file_size = os.path.getsize(input_file)
+        wrapped_modes = [{}, {'CACHE_DIR': os.path.join(temp_dir, 'cache')}, {'COUNT_TABLE': 'compact'},
+                         {'INTERMEDIATE_FORMAT': 'binary'}]
+        for mode in wrapped_modes:
+            metrics_file = os.path.join(temp_dir, 'metrics.json')
+            run_main(INPUT_FILE=input_file, OUTPUT_FILE=os.path.join(temp_dir, 'output.txt'), MAP_TASK_SIZE='16384',
+                     METRICS_FILE=metrics_file, **mode)
+            with open(metrics_file, 'r', encoding='utf-8') as f:
+                bytes_in = json.load(f)['map_tasks']['bytes_in_total']
+            print(f"{mode or 'plain'}: {bytes_in} of {file_size} bytes")
+            if bytes_in != file_size:
+                print("Map task bytes_in does not add up to the input size")
+                return False
+    return True
+
+def test_mixed_encoding():
+    """A single Latin-1 line among UTF-8 ones only changes its own words, for any split size and engine"""
+    print_section("TESTING MIXED ENCODING")
+    import subprocess
+    import sys
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'input.txt')
+        output_file = os.path.join(temp_dir, 'output.txt')
+        utf8_lines = ('café naïve\n' * 4000).encode('utf-8')
+        with open(input_file, 'wb') as f:
+            f.write(utf8_lines[:len(utf8_lines) // 2] + 'déjà vu\n'.encode('latin-1') + utf8_lines[len(utf8_lines) // 2:])
+        expected = {'café': 4000, 'naïve': 4000, 'déjà': 1, 'vu': 1}
+        for tokenizer in ('unicode', 'whitespace'):
+            for map_engine in ('text', 'bytes'):
+                for map_task_size in ('4096', '65536', '1048576'):
+                    run_main(INPUT_FILE=input_file, OUTPUT_FILE=output_file, TOKENIZER=tokenizer, MAP_ENGINE=map_engine,
+                             MAP_TASK_SIZE=map_task_size)
+                    counts = read_counts(output_file)
+                    if counts != expected:
+                        print(f"TOKENIZER={tokenizer} MAP_ENGINE={map_engine} MAP_TASK_SIZE={map_task_size}: {counts}")
+                        return False
+            # The streaming mapper decodes the tokens of its combining window, or each one without combining
+            for combine_buffer in ('0', '100000'):
+                with open(input_file, 'rb') as f:
+                    process = subprocess.run([sys.executable, 'hadoop_mapper.py'], stdin=f, capture_output=True,
+                                             env=dict(os.environ, WORDCOUNT_TOKENIZER=tokenizer, WORDCOUNT_COMBINE_BUFFER=combine_buffer))
+                counts = {}
+                for line in process.stdout.decode('utf-8').splitlines():
+                    word, count = line.split('\t')
+                    counts[word] = counts.get(word, 0) + int(count)
+                if counts != expected:
+                    print(f"Streaming mapper, WORDCOUNT_TOKENIZER={tokenizer} WORDCOUNT_COMBINE_BUFFER={combine_buffer}: {counts}")
+                    return False
+    print(f"Counts: {expected}")
+    return True
+
+def test_server():
+    """WordCountServer results against Counter, queue limits and stats, and one job over the Unix socket"""
+    print_section("TESTING WORD COUNT SERVER")
+    import threading
+    from collections import Counter
+    from server import WordCountServer, request
+    
+    max_jobs, max_queued = 2, 3
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'input.txt')
+        generate_vocabulary_file(input_file)
+        with open(input_file, 'r', encoding='utf-8') as f:
+            expected = Counter(f.read().split())
+        with WordCountServer(num_workers=2, max_jobs=max_jobs, max_queued=max_queued, split_size=65536) as server:
+            # Hold the job threads, so every accepted job stays queued until the gate opens
+            gate = threading.Event()
+            for _ in range(max_jobs):
+                server.executor.submit(gate.wait)
+            futures, rejected = [], 0
+            for job in range(max_jobs + max_queued + 2):
+                try:
+                    futures.append(server.submit(input_file, engine='bytes' if job % 2 else 'text'))
+                except RuntimeError:
+                    rejected += 1
+            queued_stats = dict(server.stats)
+            gate.set()
+            results = [future.result() for future in futures]
+            top = server.count(input_file, top_k_words=5)
+            try:
+                server.count(os.path.join(temp_dir, 'missing.txt'))
+            except FileNotFoundError:
+                pass
+            final_stats = dict(server.stats)
+            
+            # One job end-to-end through serve() and request()
+            socket_path = os.path.join(temp_dir, 'wordcount.sock')
+            with contextlib.redirect_stdout(io.StringIO()):
+                serve_thread = threading.Thread(target=server.serve, args=(socket_path,), daemon=True)
+                serve_thread.start()
+                for _ in range(100):
+                    if server.socket_server is not None and os.path.exists(socket_path):
+                        break
+                    time.sleep(0.05)
+                response = request({'input': input_file, 'engine': 'bytes'}, socket_path)
+                stats_response = request({'command': 'stats'}, socket_path)
+                server.socket_server.shutdown()
+                serve_thread.join()
+    print(f"Queued: {queued_stats}\nFinal: {final_stats}\nOver the socket: {stats_response}")
+    
+    if len(futures) != max_jobs + max_queued or rejected != 2:
+        print(f"Expected {max_jobs + max_queued} accepted and 2 rejected jobs, got {len(futures)} and {rejected}")
+        return False
+    if queued_stats != {'submitted': max_jobs + max_queued, 'completed': 0, 'failed': 0, 'rejected': 2, 'running': 0}:
+        print("Unexpected stats while the jobs were queued")
+        return False
+    if any(result['counts'] != expected or result['total_words'] != sum(expected.values()) for result in results):
+        print("Server counts differ from Counter")
+        return False
+    if [count for _, count in top['top']] != sorted(expected.values(), reverse=True)[:5] or any(expected[word] != count for word, count in top['top']):
+        print(f"Unexpected top words: {top['top']}")
+        return False
+    if final_stats != {'submitted': max_jobs + max_queued + 2, 'completed': max_jobs + max_queued + 1, 'failed': 1, 'rejected': 2, 'running': 0}:
+        print("Unexpected final stats")
+        return False
+    if not response['ok'] or response['counts'] != expected or not stats_response['ok'] or stats_response['stats']['completed'] != final_stats['completed'] + 1:
+        print(f"Unexpected socket responses: {response.get('error')}, {stats_response}")
+        return False
+    return True
+
+def partition_records(output):
+    # Record counts per reducer from the "Partition Records: [...]" line
+    match = re.search(r'Partition Records: \[([\d, ]+)\]', output)
+    return [int(records) for records in match.group(1).split(',')] if match else None
+
+def test_skew_partitioner():
+    """PARTITIONER=skew balances a Zipf corpus, salted words are merged exactly once, routing labels hit their partitions"""
+    print_section("TESTING SKEW-AWARE PARTITIONER")
+    from benchmark import generate_zipf_corpus
+    from partitioner import merge_salted
+    from routing import routing_labels, key_field_partition
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'input.txt')
+        expected_file = os.path.join(temp_dir, 'expected.txt')
+        output_file = os.path.join(temp_dir, 'output.txt')
+        output_dir = os.path.join(temp_dir, 'parts')
+        generate_zipf_corpus(input_file, 2, 20000)
+        run_main(INPUT_FILE=input_file, OUTPUT_FILE=expected_file)
+        expected = read_counts(expected_file)
+        env = dict(INPUT_FILE=input_file, NUM_REDUCERS='4', COMBINER='0', MAP_TASK_SIZE='262144')
+        hash_records = partition_records(run_main(OUTPUT_FILE=output_file, PARTITIONER='hash', **env))
+        output = run_main(OUTPUT_FILE=output_file, PARTITIONER='skew', **env)
+        skew_records = partition_records(output)
+        counts = read_counts(output_file)
+        salted = re.search(r'Salted Words: (\[.*\])', output).group(1)
+        print(f"Hash partition records: {hash_records}\nSkew partition records: {skew_records}\nSalted words: {salted}")
+        if counts != expected:
+            print("PARTITIONER=skew output differs from the single reducer output")
+            return False
+        if max(skew_records) > 1.1 * sum(skew_records) / 4 or max(skew_records) >= max(hash_records):
+            print("Skew-aware partitions are not balanced")
+            return False
+        if salted == '[]':
+            print("Expected the hottest word to be salted")
+            return False
+        
+        # Part files: every word, salted ones included, appears in exactly one of them
+        run_main(OUTPUT_DIR=output_dir, PARTITIONER='skew', **env)
+        part_words = []
+        for name in sorted(os.listdir(output_dir)):
+            with open(os.path.join(output_dir, name), 'r', encoding='utf-8') as f:
+                part_words.extend(line.split() for line in f)
+        if len(part_words) != len(expected) or {word: int(count) for word, count in part_words} != expected:
+            print("Part files do not hold every word exactly once with its total count")
+            return False
+    
+    # Streaming: salted words appear once per partition and are summed by the final merge
+    lines = ['the\t5\n', 'cat\t2\n', 'the\t7\n', 'a\t1\n', 'the\t3', 'a\t4\n']
+    merged = list(merge_salted(lines, {'the', 'a'}))
+    if merged != ['cat\t2\n', 'a\t5\n', 'the\t15\n']:
+        print(f"Unexpected merge of salted words: {merged}")
+        return False
+    
+    # Hadoop's KeyFieldBasedPartitioner sends each routing label to its own partition
+    for num_partitions in range(1, 65):
+        labels = routing_labels(num_partitions)
+        if [key_field_partition(label, num_partitions) for label in labels] != list(range(num_partitions)):
+            print(f"Routing labels for {num_partitions} partitions miss their partitions: {labels}")
+            return False
+    return True
+
+def test_vectorized_backend():
+    """The NumPy map and reduce steps count exactly like the Python backend, with and without the combiner"""
+    print_section("TESTING NUMPY BACKEND")
+    from vectorized import np
+    if np is None:
+        print("NumPy is not installed, skipping")
+        return True
+    from vectorized import vectorized_split_mapper, reduce_word_id_tables
+    from mapping import split_mapper, bytes_split_mapper
+    from shuffling import merge_counts
+    from split_new import plan_input_splits
+    from tokenizer import get_tokenizer
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'input.txt')
+        generate_vocabulary_file(input_file, num_words=30000)
+        # Case variants, punctuation and stopwords
+        with open(input_file, 'a', encoding='utf-8') as f:
+            f.write("The cat and THE Dog, the cat's bowl -- a Cat in a hat!\n" * 500)
+        splits = plan_input_splits([input_file], 16384)
+        for tokenizer in (get_tokenizer('ascii-alpha', True, 'english'), get_tokenizer('whitespace', True, 'english'),
+                          get_tokenizer('ascii-alpha', False, '')):
+            expected = merge_counts(split_mapper(split, True, tokenizer) for split in splits)
+            if dict(expected) != dict(merge_counts(bytes_split_mapper(split, tokenizer) for split in splits)):
+                print(f"Python text and bytes engines differ ({tokenizer.signature()})")
+                return False
+            for engine in ('text', 'bytes'):
+                for combine in (True, False):
+                    counts = reduce_word_id_tables([vectorized_split_mapper(split, engine, combine, tokenizer) for split in splits])
+                    if counts != dict(expected):
+                        print(f"NumPy backend differs ({tokenizer.signature()}, engine {engine}, combiner {'on' if combine else 'off'})")
+                        return False
+            print(f"{tokenizer.signature()}: {len(expected)} words, {sum(expected.values())} tokens")
+    return True
+
+def counted_tasks(num_tasks, pulled):
+    # Map task args, recording how many the pool's feeder thread has pulled so far
+    for task_number in range(num_tasks):
+        pulled.append(task_number)
+        yield (task_number,)
+
+def consume_pipeline(depth, num_tasks, fail_after, pulled, windows):
+    # Consume pipelined_map outputs slowly, raising after fail_after of them, inside a pool like main.main
+    from main import pipelined_map
+    with Pool(processes=2) as pool:
+        for consumed, _ in enumerate(pipelined_map(pool, abs, counted_tasks(num_tasks, pulled), depth)):
+            # `consumed` outputs have been released, so at most depth + consumed tasks may be pulled
+            windows.append(len(pulled) - consumed)
+            if consumed + 1 == fail_after:
+                raise RuntimeError("consumer failed")
+            time.sleep(0.01)
+
+def test_pipelined_map():
+    """PIPELINE_DEPTH bounds the tasks in flight, and a failing consumer does not leave the pool hanging"""
+    print_section("TESTING PIPELINED MAP")
+    import threading
+    
+    depth = 4
+    pulled, windows = [], []
+    consume_pipeline(depth, 200, None, pulled, windows)
+    print(f"Largest window: {max(windows)} tasks (depth {depth}), outputs: {len(windows)}")
+    if len(windows) != 200 or max(windows) != depth:
+        print("Expected every output and a window filled up to, but never beyond, the pipeline depth")
+        return False
+    
+    # The feeder thread is blocked on the window when the consumer raises; the pool must still shut down
+    pulled, windows, errors = [], [], []
+    def failing_consumer():
+        try:
+            consume_pipeline(depth, 10000, 3, pulled, windows)
+        except RuntimeError as e:
+            errors.append(e)
+    consumer = threading.Thread(target=failing_consumer, daemon=True)
+    consumer.start()
+    consumer.join(60)
+    print(f"Tasks pulled before the failure stopped the pipeline: {len(pulled)}")
+    if consumer.is_alive():
+        print("The pool hung after the consumer failed")
+        return False
+    if len(errors) != 1 or len(pulled) > depth + 3:
+        print("Expected the consumer's error and no tasks pulled past the window")
+        return False
+    return True
+
+def marked_task(marker_dir, index, fail_first=False, sleep_first=0):
+    # The first attempt of a task (tracked by a marker file) fails or is slow, later attempts are instant
+    marker = os.path.join(marker_dir, f'task-{index}')
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        if fail_first:
+            raise RuntimeError(f"Task {index} failed")
+        time.sleep(sleep_first)
+    return index * index
+
+def test_scheduler():
+    """Dynamic scheduling of a generator of tasks with a transient failure and a straggler"""
+    print_section("TESTING TASK SCHEDULER")
+    from scheduler import TaskScheduler
+    
+    with tempfile.TemporaryDirectory() as marker_dir, Pool(processes=2) as pool:
+        scheduler = TaskScheduler(pool, 2, max_retries=2, speculation_factor=2.0, min_speculation_seconds=0.2)
+        # Task 1 fails once and is retried; task 3 takes 5 seconds unless a speculative copy overtakes it
+        tasks = ((marker_dir, i, i == 1, 5 if i == 3 else 0) for i in range(8))
+        start_time = time.time()
+        outputs = scheduler.starmap(marked_task, tasks)
+        elapsed = time.time() - start_time
+    print(f"Outputs: {outputs}\nScheduler stats: {scheduler.stats}\nElapsed: {elapsed:.2f} seconds")
+    
+    if outputs != [i * i for i in range(8)]:
+        print("Scheduler outputs are wrong or out of order")
+        return False
+    if scheduler.stats['retried_tasks'] != 1:
+        print("The failed task was not retried exactly once")
+        return False
+    if scheduler.stats['speculative_wins'] != 1 or elapsed >= 5:
+        print("The straggler was not overtaken by a speculative copy")
+        return False
+    return True
+
+def shared_block_task(marker_dir, index, sleep_first=0):
+    # Like marked_task, but returns its output in a shared memory segment
+    from records import SharedRecordBlock
+    marked_task(marker_dir, index, sleep_first=sleep_first)
+    return SharedRecordBlock.encode({f'word{index}': index})
+
+def shared_memory_segments():
+    # Segments created by multiprocessing.shared_memory on Linux
+    return {name for name in os.listdir('/dev/shm') if name.startswith('psm_')}
+
+def test_shared_memory_release():
+    """INTERMEDIATE_FORMAT=shared-memory leaves no segments behind, even when a speculative copy wins"""
+    print_section("TESTING SHARED MEMORY RELEASE")
+    from records import shared_memory
+    if shared_memory is None or not os.path.isdir('/dev/shm'):
+        print("No multiprocessing.shared_memory or /dev/shm on this system, skipping")
+        return True
+    from records import released
+    from scheduler import TaskScheduler
+    
+    before = shared_memory_segments()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, 'input.txt')
+        generate_vocabulary_file(input_file, num_words=30000)
+        env = dict(INPUT_FILE=input_file, OUTPUT_FILE=os.path.join(temp_dir, 'output.txt'), MAP_TASK_SIZE='16384',
+                   INTERMEDIATE_FORMAT='shared-memory')
+        runs = {
+            'in-memory': {},
+            'partitioned': {'NUM_REDUCERS': '3'},
+            'partitioned OUTPUT_DIR': {'NUM_REDUCERS': '3', 'OUTPUT_DIR': os.path.join(temp_dir, 'parts')},
+            'spill': {'SHUFFLE_MEMORY_BUDGET': '4096'},
+        }
+        for name, run_env in runs.items():
+            output = run_main(**env, **run_env)
+            left = shared_memory_segments() - before
+            print(f"{name}: {len(left)} segments left")
+            if 'All stages completed successfully' not in output or left:
+                print(f"The {name} run failed or left shared memory segments behind")
+                return False
+        
+        # The straggler finishes after its speculative copy won and after the scheduler returned
+        marker_dir = os.path.join(temp_dir, 'markers')
+        os.makedirs(marker_dir)
+        with Pool(processes=2) as pool:
+            scheduler = TaskScheduler(pool, 2, speculation_factor=2.0, min_speculation_seconds=0.2)
+            outputs = scheduler.starmap(shared_block_task, [(marker_dir, i, 2 if i == 3 else 0) for i in range(4)])
+            words = [dict(block.items()) for block in released(outputs)]
+            pool.close()
+            pool.join()
+    left = shared_memory_segments() - before
+    print(f"speculation: {scheduler.stats}, {len(left)} segments left")
+    if words != [{f'word{i}': i} for i in range(4)] or scheduler.stats['speculative_wins'] != 1:
+        print("Speculative run returned wrong outputs or the copy did not win")
+        return False
+    if left:
+        print("The losing attempt's segment was not released")
+        return False
+    return True
+
+def run_component_tests():
+    """Run the component tests of the local engine"""
+    tests = [("Task scheduler", test_scheduler), ("Spilling shuffle", test_spilling_shuffle),
+             ("Result cache", test_result_cache), ("Count table", test_count_table),
+             ("Record blocks", test_record_blocks), ("Shared memory release", test_shared_memory_release),
+             ("Heavy hitters", test_heavy_hitters),
+             ("Task metrics", test_task_metrics), ("Mixed encoding", test_mixed_encoding),
+             ("Word count server", test_server), ("Skew-aware partitioner", test_skew_partitioner),
+             ("NumPy backend", test_vectorized_backend),
+             ("Pipelined map", test_pipelined_map)]
+    passed = 0
+    for name, test in tests:
+        if test():
+            print(f"\n[PASS] {name} test PASSED")
+            passed += 1
+        else:
+            print(f"\n[FAIL] {name} test FAILED")
+    print_section(f"TEST RESULTS: {passed}/{len(tests)} TESTS PASSED")
+
 if __name__ == "__main__":
     run_test()
+    run_component_tests()
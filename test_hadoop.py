@@ -2,6 +2,8 @@
 # filepath: d:\EDU\MapReduce-WordCount-Python-main\test_hadoop.py
 
 import os
+import sys
+import tempfile
 import subprocess
 
 def print_section(title):
@@ -10,6 +12,18 @@ def print_section(title):
     print(f" {title} ".center(80, "="))
     print("="*80 + "\n")
 
+def streaming_word_counts(input_path):
+    """Word counts from the single-process hadoop_mapper.py | sort | hadoop_reducer.py pipeline"""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        mapper_process = subprocess.run([sys.executable, "hadoop_mapper.py"], input=f.read(), text=True, capture_output=True)
+    reducer_process = subprocess.run([sys.executable, "hadoop_reducer.py"], input='\n'.join(sorted(mapper_process.stdout.strip().split('\n'))),
+                                     text=True, capture_output=True)
+    word_counts = {}
+    for line in reducer_process.stdout.strip().split('\n'):
+        word, count = line.split('\t')
+        word_counts[word] = int(count)
+    return word_counts
+
 def test_mapper():
     """Test the Hadoop mapper locally"""
     print_section("TESTING MAPPER")
@@ -48,6 +62,44 @@ def test_mapper():
     
     return True
 
+def test_mapper_combining():
+    """Test that in-mapper combining emits the same totals as per-token output"""
+    print_section("TESTING MAPPER COMBINING")
+    
+    test_input = """Hello world
+    This is a test
+    Hello again, world"""
+    
+    mapper_path = os.path.join(os.getcwd(), "hadoop_mapper.py")
+    if not os.path.exists(mapper_path):
+        print(f"Error: Mapper script not found at {mapper_path}")
+        return False
+    
+    totals = {}
+    for combine_buffer in ("0", "100000"):
+        process = subprocess.run(
+            [sys.executable, mapper_path],
+            input=test_input,
+            text=True,
+            capture_output=True,
+            env=dict(os.environ, WORDCOUNT_COMBINE_BUFFER=combine_buffer)
+        )
+        if process.returncode != 0:
+            print(f"Mapper failed: {process.stderr}")
+            return False
+        counts = {}
+        for line in process.stdout.strip().split('\n'):
+            word, count = line.split('\t')
+            counts[word] = counts.get(word, 0) + int(count)
+        totals[combine_buffer] = counts
+        print(f"WORDCOUNT_COMBINE_BUFFER={combine_buffer}: {len(process.stdout.strip().split(chr(10)))} records")
+    
+    if totals["0"] != totals["100000"] or totals["0"].get("hello") != 2:
+        print(f"Combined output differs: {totals}")
+        return False
+    
+    return True
+
 def test_reducer():
     """Test the Hadoop reducer locally"""
     print_section("TESTING REDUCER")
@@ -155,12 +207,122 @@ def test_full_pipeline():
     
     return True
 
+def test_streaming_runner():
+    """Run the streaming scripts through the local runner with parallel mappers and reducers"""
+    print_section("LOCAL STREAMING RUNNER TEST")
+    
+    input_path = os.path.join(os.getcwd(), "input_file.txt")
+    if not os.path.exists(input_path):
+        print(f"Error: Input file not found at {input_path}")
+        return False
+    
+    from streaming_runner import run_streaming_job
+    
+    with tempfile.TemporaryDirectory() as output_dir:
+        # Small splits and sort buffer so several map tasks spill several runs
+        part_files = run_streaming_job(input_path, output_dir, num_mappers=2, num_reducers=3,
+                                       split_size=4096, sort_buffer_bytes=1024)
+        runner_counts = {}
+        for part_file in part_files:
+            with open(part_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    word, count = line.rstrip('\n').split('\t')
+                    runner_counts[word] = int(count)
+    
+    print(f"Runner produced {len(runner_counts)} words in {len(part_files)} part files")
+    
+    # Compare with the single-process mapper | sort | reducer pipeline
+    if runner_counts != streaming_word_counts(input_path):
+        print("Runner output differs from the single-process pipeline")
+        return False
+    
+    return True
+
+def test_local_cluster():
+    """Run a coordinator and three worker agents on loopback and compare with the streaming scripts"""
+    print_section("LOCAL CLUSTER TEST")
+    
+    input_path = os.path.join(os.getcwd(), "input_file.txt")
+    if not os.path.exists(input_path):
+        print(f"Error: Input file not found at {input_path}")
+        return False
+    
+    from cluster import run_local_cluster
+    
+    # Small splits so every agent maps several tasks and pushes partitions to the others
+    coordinator, cluster_counts = run_local_cluster(input_path, num_agents=3, num_reducers=4, split_size=2048, timeout=60)
+    for agent in coordinator.agents:
+        print(f"Agent {agent['id']}: {agent['tasks']} map tasks")
+    print(f"Cluster produced {len(cluster_counts)} words from {len(coordinator.splits)} map tasks")
+    
+    if cluster_counts != streaming_word_counts(input_path):
+        print("Cluster output differs from the single-process pipeline")
+        return False
+    
+    return True
+
+def test_fused_jobs():
+    """Run a fused pass locally and through the streaming scripts and compare every job's table"""
+    print_section("FUSED JOBS TEST")
+    
+    input_path = os.path.join(os.getcwd(), "input_file.txt")
+    if not os.path.exists(input_path):
+        print(f"Error: Input file not found at {input_path}")
+        return False
+    
+    from jobs import parse_jobs, read_tagged_output, TOTALS
+    from fused import fused_split_mapper, reduce_tables
+    from split_new import plan_input_splits
+    from tokenizer import get_tokenizer
+    
+    jobs_spec = "unigram,bigram,docfreq,vocab"
+    aggregations = parse_jobs(jobs_spec)
+    tables = sorted({aggregation.table for aggregation in aggregations}) + [TOTALS]
+    # Small splits, one task per split, in-process
+    mapper_outputs = [fused_split_mapper(split, aggregations) for split in plan_input_splits([input_path], 2048)]
+    local_tables = reduce_tables(None, mapper_outputs, tables)
+    print(f"Local fused pass: {', '.join(f'{table} {len(counts)} keys' for table, counts in local_tables.items())}")
+    
+    with open(input_path, 'r', encoding='utf-8') as f:
+        mapper_process = subprocess.run([sys.executable, "hadoop_mapper.py"], input=f.read(), text=True, capture_output=True,
+                                        env=dict(os.environ, WORDCOUNT_JOBS=jobs_spec))
+    reducer_process = subprocess.run([sys.executable, "hadoop_reducer.py"], input='\n'.join(sorted(mapper_process.stdout.strip().split('\n'))),
+                                     text=True, capture_output=True)
+    streaming_tables = read_tagged_output(reducer_process.stdout.strip().split('\n'))
+    
+    if {table: dict(counts) for table, counts in local_tables.items()} != {table: dict(counts) for table, counts in streaming_tables.items()}:
+        print("Fused streaming output differs from the local fused pass")
+        return False
+    # The word table must match the plain word count
+    if dict(local_tables['1gram']) != streaming_word_counts(input_path):
+        print("Fused word counts differ from the single-job pipeline")
+        return False
+    
+    # Input that is not valid UTF-8 is decoded as Latin-1 on both paths
+    latin1_text = "Café naïve café\nnaïve déjà vu\n"
+    with tempfile.TemporaryDirectory() as temp_dir:
+        latin1_path = os.path.join(temp_dir, "latin1.txt")
+        with open(latin1_path, 'wb') as f:
+            f.write(latin1_text.encode('latin-1'))
+        local_tables = reduce_tables(None, [fused_split_mapper(split, aggregations, 1, get_tokenizer('unicode'))
+                                            for split in plan_input_splits([latin1_path], 2048)], tables)
+    mapper_process = subprocess.run([sys.executable, "hadoop_mapper.py"], input=latin1_text.encode('latin-1'), capture_output=True,
+                                    env=dict(os.environ, WORDCOUNT_JOBS=jobs_spec, WORDCOUNT_TOKENIZER='unicode'))
+    reducer_process = subprocess.run([sys.executable, "hadoop_reducer.py"], input=b'\n'.join(sorted(mapper_process.stdout.strip().split(b'\n'))),
+                                     capture_output=True)
+    streaming_tables = read_tagged_output(reducer_process.stdout.decode('utf-8').strip().split('\n'))
+    if dict(streaming_tables['1gram']) != dict(local_tables['1gram']):
+        print(f"Latin-1 fused output differs: {dict(streaming_tables['1gram'])} vs {dict(local_tables['1gram'])}")
+        return False
+    
+    return True
+
 def main():
     """Run all Hadoop tests"""
     print_section("HADOOP MAPREDUCE TESTING SUITE")
     
     passed = 0
-    total = 3
+    total = 7
     
     # Test 1: Mapper test
     if test_mapper():
@@ -169,20 +331,48 @@ def main():
     else:
         print("\n[FAIL] Mapper test FAILED")
     
-    # Test 2: Reducer test
+    # Test 2: Mapper combining test
+    if test_mapper_combining():
+        print("\n[PASS] Mapper combining test PASSED")
+        passed += 1
+    else:
+        print("\n[FAIL] Mapper combining test FAILED")
+    
+    # Test 3: Reducer test
     if test_reducer():
         print("\n[PASS] Reducer test PASSED")
         passed += 1
     else:
         print("\n[FAIL] Reducer test FAILED")
     
-    # Test 3: Full pipeline test
+    # Test 4: Full pipeline test
     if test_full_pipeline():
         print("\n[PASS] Full Hadoop pipeline test PASSED")
         passed += 1
     else:
         print("\n[FAIL] Full Hadoop pipeline test FAILED")
     
+    # Test 5: Local streaming runner test
+    if test_streaming_runner():
+        print("\n[PASS] Local streaming runner test PASSED")
+        passed += 1
+    else:
+        print("\n[FAIL] Local streaming runner test FAILED")
+    
+    # Test 6: Coordinator and worker agents on loopback
+    if test_local_cluster():
+        print("\n[PASS] Local cluster test PASSED")
+        passed += 1
+    else:
+        print("\n[FAIL] Local cluster test FAILED")
+    
+    # Test 7: Fused multi-job pass, local and streaming
+    if test_fused_jobs():
+        print("\n[PASS] Fused jobs test PASSED")
+        passed += 1
+    else:
+        print("\n[FAIL] Fused jobs test FAILED")
+    
     print_section(f"TEST RESULTS: {passed}/{total} TESTS PASSED")
     
     print("\nTo run on a real Hadoop cluster:")
@@ -0,0 +1,158 @@
+import os
+import re
+import zlib
+from functools import lru_cache
+from collections import Counter
+
+MODES = ('whitespace', 'ascii-alpha', 'unicode')
+# Precompiled patterns per mode; whitespace mode uses str.split/bytes.split instead
+TEXT_PATTERNS = {'ascii-alpha': re.compile(r'[A-Za-z]+'), 'unicode': re.compile(r'[^\W_]+')}
+BYTES_PATTERNS = {'ascii-alpha': re.compile(rb'[A-Za-z]+')}
+
+ENGLISH_STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her his i if in into is it its me my no not
+of on or our she so than that the their them then there these they this to was we were what when
+which who will with you your
+""".split())
+
+def load_stopwords(spec):
+    # 'english' for the built-in list, a path to a file of words, or a comma-separated list
+    if not spec:
+        return frozenset()
+    if spec == 'english':
+        return ENGLISH_STOPWORDS
+    if os.path.isfile(spec):
+        with open(spec, 'r', encoding='utf-8') as f:
+            return frozenset(f.read().split())
+    return frozenset(word.strip() for word in spec.split(',') if word.strip())
+
+class Tokenizer:
+    """
+    Word tokenizer shared by the local engine and hadoop_mapper.py.
+
+    Modes: 'whitespace' splits on whitespace and keeps punctuation,
+    'ascii-alpha' keeps runs of ASCII letters (the Hadoop mapper's rule) and
+    'unicode' keeps runs of Unicode letters and digits. Case folding and
+    stopword removal happen at map time. All methods work on whole batches of
+    text: the batch is normalized once and tokenized with one C-level call.
+    """
+
+    def __init__(self, mode='ascii-alpha', case_fold=True, stopwords=()):
+        if mode not in MODES:
+            raise ValueError(f"Unknown tokenizer mode '{mode}', expected one of {', '.join(MODES)}.")
+        self.mode = mode
+        self.case_fold = case_fold
+        self.pattern = TEXT_PATTERNS.get(mode)
+        self.bytes_pattern = BYTES_PATTERNS.get(mode)
+        self.stopwords = frozenset(self.normalize(word) for word in stopwords)
+        self.byte_stopwords = frozenset(word.encode('utf-8') for word in self.stopwords)
+
+    @property
+    def bytes_native(self):
+        # Unicode mode needs decoded text; the other modes can scan raw UTF-8/ASCII bytes
+        return self.mode != 'unicode'
+
+    def signature(self):
+        # Identifies the configuration, e.g. in cache keys
+        stopwords_hash = zlib.crc32('\n'.join(sorted(self.stopwords)).encode('utf-8'))
+        return f"{self.mode}:{int(self.case_fold)}:{stopwords_hash:08x}"
+
+    def normalize(self, text):
+        if not self.case_fold:
+            return text
+        return text.casefold() if self.mode == 'unicode' else text.lower()
+
+    def tokenize(self, text, filter_stopwords=True):
+        text = self.normalize(text)
+        tokens = self.pattern.findall(text) if self.pattern else text.split()
+        if filter_stopwords and self.stopwords:
+            tokens = [token for token in tokens if token not in self.stopwords]
+        return tokens
+
+    def tokenize_lines(self, text, filter_stopwords=True):
+        # Tokens of each line of text, one list per line; the text is normalized once
+        text = self.normalize(text)
+        find = self.pattern.findall if self.pattern else str.split
+        lines = [find(line) for line in text.split('\n')]
+        if filter_stopwords and self.stopwords:
+            lines = [[token for token in tokens if token not in self.stopwords] for tokens in lines]
+        return lines
+
+    def tokenize_bytes(self, data, filter_stopwords=True):
+        # Normalized UTF-8 byte tokens of a batch: the raw tokens are scanned, and each distinct
+        # one is decoded and normalized once (so case folding is not limited to ASCII)
+        if not self.bytes_native:
+            return [token.encode('utf-8') for token in self.tokenize(decode_text(data), filter_stopwords)]
+        raw_tokens = self.scan_bytes(data)
+        normalized = {token: self.normalize(word).encode('utf-8') for token, word in self.decode_tokens(set(raw_tokens)).items()}
+        tokens = [normalized[token] for token in raw_tokens]
+        if filter_stopwords and self.byte_stopwords:
+            tokens = [token for token in tokens if token not in self.byte_stopwords]
+        return tokens
+
+    def scan_bytes(self, buffer, start=0, end=None):
+        # Raw, not yet normalized byte tokens of buffer[start:end] (buffer may be an mmap)
+        end = len(buffer) if end is None else end
+        if self.bytes_pattern:
+            return self.bytes_pattern.findall(buffer, start, end)
+        return buffer[start:end].split()
+
+    def decode_tokens(self, raw_tokens):
+        # Distinct raw tokens -> text: UTF-8, with only the tokens that are not valid UTF-8 read as Latin-1
+        return {token: decode_token(token) for token in raw_tokens}
+
+    def normalize_raw_counts(self, raw_counts):
+        # Decode and normalize only the distinct raw tokens from scan_bytes, then drop stopwords
+        decoded = self.decode_tokens(raw_counts)
+        word_counts = Counter()
+        for token, count in raw_counts.items():
+            word_counts[self.normalize(decoded[token])] += count
+        return self.remove_stopwords(word_counts)
+
+    def remove_stopwords(self, word_counts):
+        # Applied to combined tables: one delete per stopword instead of a test per token
+        for word in self.stopwords:
+            word_counts.pop(word, None)
+        for word in self.byte_stopwords:
+            word_counts.pop(word, None)
+        return word_counts
+
+    def count(self, text):
+        return self.remove_stopwords(Counter(self.tokenize(text, filter_stopwords=False)))
+
+def decode_token(token):
+    try:
+        return token.decode('utf-8')
+    except UnicodeDecodeError:
+        return token.decode('latin-1')
+
+def decode_lines(data):
+    # Per-line fallback: only the lines that are not valid UTF-8 are read as Latin-1, so the
+    # decoding of a line does not depend on which split or batch it ended up in
+    return '\n'.join(decode_token(line) for line in data.split(b'\n'))
+
+def decode_text(data):
+    # UTF-8, falling back to Latin-1 for the lines that are not valid UTF-8 (like mapping.decode_split)
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return decode_lines(data)
+
+@lru_cache(maxsize=None)
+def get_tokenizer(mode='ascii-alpha', case_fold=True, stopwords_spec=''):
+    return Tokenizer(mode, case_fold, load_stopwords(stopwords_spec))
+
+def tokenizer_from_env(prefix=''):
+    """
+    Tokenizer configured by the TOKENIZER, CASE_FOLD and STOPWORDS environment
+    variables (hadoop_mapper.py uses the WORDCOUNT_ prefix). Built once per
+    process and configuration.
+    """
+    return get_tokenizer(os.environ.get(f'{prefix}TOKENIZER', 'ascii-alpha'),
+                         os.environ.get(f'{prefix}CASE_FOLD', '1') != '0',
+                         os.environ.get(f'{prefix}STOPWORDS', ''))
+
+if __name__ == '__main__':
+    text = "The quick brown Fox -- the lazy dog's café, 42 times!"
+    for mode in MODES:
+        print(mode, Tokenizer(mode, stopwords=ENGLISH_STOPWORDS).tokenize(text))
@@ -0,0 +1,98 @@
+import heapq
+import hashlib
+from array import array
+from collections import Counter
+
+def top_k(pairs, k):
+    # Streaming top-K over (word, count) pairs: only k entries are held at any time
+    return heapq.nlargest(k, pairs, key=lambda x: x[1])
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters summary with at most `capacity` counters.
+    Counts are upper bounds; `errors` holds how much each one may overestimate.
+    Summaries of separate map tasks are merged with `merge`.
+    """
+
+    def __init__(self, capacity, counts=None, errors=None):
+        self.capacity = capacity
+        self.counts = counts or {}
+        self.errors = errors or {}
+
+    @classmethod
+    def from_counts(cls, word_counts, capacity):
+        # Keep the heaviest `capacity` words of an exact table; they are exact (error 0)
+        kept = top_k(word_counts.items(), capacity)
+        return cls(capacity, dict(kept), {word: 0 for word, _ in kept})
+
+    def min_count(self):
+        # Any word not in a full summary occurred at most this many times
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def merge(self, other):
+        own_min, other_min = self.min_count(), other.min_count()
+        counts, errors = {}, {}
+        for word in self.counts.keys() | other.counts.keys():
+            counts[word] = self.counts.get(word, own_min) + other.counts.get(word, other_min)
+            errors[word] = self.errors.get(word, own_min) + other.errors.get(word, other_min)
+        kept = top_k(counts.items(), self.capacity)
+        return SpaceSaving(self.capacity, dict(kept), {word: errors[word] for word, _ in kept})
+
+    def top(self, k):
+        return top_k(self.counts.items(), k)
+
+class CountMinSketch:
+    """
+    Count-Min sketch: `depth` rows of `width` counters. Estimates never
+    underestimate and overestimate by at most total / width with high probability.
+    Sketches with the same shape are merged by adding their tables.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        if not 1 <= depth <= 8:
+            raise ValueError(f"Count-Min depth must be between 1 and 8, got {depth}.")
+        self.width = width
+        self.depth = depth
+        self.table = array('q', bytes(8 * width * depth))
+
+    def positions(self, word):
+        # One 8-byte slice of a BLAKE2 digest per row, so the rows hash independently (reseeding
+        # crc32 would only XOR every row with the same length-dependent constant)
+        digest = hashlib.blake2b(word.encode('utf-8'), digest_size=8 * self.depth).digest()
+        return [row * self.width + int.from_bytes(digest[8 * row:8 * row + 8], 'little') % self.width for row in range(self.depth)]
+
+    def add(self, word, count=1):
+        for position in self.positions(word):
+            self.table[position] += count
+
+    def estimate(self, word):
+        return min(self.table[position] for position in self.positions(word))
+
+    def merge(self, other):
+        merged = CountMinSketch(self.width, self.depth)
+        merged.table = array('q', (a + b for a, b in zip(self.table, other.table)))
+        return merged
+
+def count_min_summary(word_counts, candidates, width=None, depth=4):
+    # Sketch a whole map output and keep its heaviest words as heavy-hitter candidates. The width
+    # follows the candidate capacity (4 counters per candidate), so every task's sketch has the same shape
+    sketch = CountMinSketch(width or 4 * candidates, depth)
+    for word, count in word_counts.items():
+        sketch.add(word, count)
+    return sketch, [word for word, _ in top_k(word_counts.items(), candidates)]
+
+def merge_count_min_summaries(summaries, k):
+    sketch, candidates = None, set()
+    for task_sketch, task_candidates in summaries:
+        sketch = task_sketch if sketch is None else sketch.merge(task_sketch)
+        candidates.update(task_candidates)
+    if sketch is None:
+        return []
+    return top_k(((word, sketch.estimate(word)) for word in candidates), k)
+
+if __name__ == '__main__':
+    counts = Counter("a b a c a b d e a b f".split())
+    print(top_k(counts.items(), 2))
+    summary = SpaceSaving.from_counts(counts, 3).merge(SpaceSaving.from_counts(Counter("b b b g".split()), 3))
+    print(summary.top(2), summary.errors)
+    print(merge_count_min_summaries([count_min_summary(counts, 3)], 2))
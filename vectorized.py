@@ -0,0 +1,116 @@
+import mmap
+from itertools import count
+from mapping import read_compressed_batches, decode_split, read_split
+from split_new import detect_wide_encoding, is_compressed
+from tokenizer import tokenizer_from_env
+
+# NumPy is optional: only COUNT_BACKEND=numpy needs it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def require_numpy():
+    if np is None:
+        raise ImportError("COUNT_BACKEND=numpy requires NumPy, install it with 'pip install numpy'.")
+
+class WordIdTable:
+    """
+    Map output of the NumPy backend: a per-task vocabulary plus either one
+    word id per token (ids) or one count per vocabulary entry (counts).
+    """
+    __slots__ = ('vocab', 'ids', 'counts')
+
+    def __init__(self, vocab, ids=None, counts=None):
+        self.vocab = vocab
+        self.ids = ids
+        self.counts = counts
+
+    def totals(self):
+        if self.counts is None:
+            return np.bincount(self.ids, minlength=len(self.vocab))
+        return self.counts
+
+    def items(self):
+        return zip(self.vocab, self.totals().tolist())
+
+    def __len__(self):
+        # Records emitted by the map task: tokens without the combiner, distinct words with it
+        return len(self.ids) if self.counts is None else len(self.vocab)
+
+def split_tokens(split, engine, tokenizer):
+    # Tokens of one split before stopword removal; tokens scanned from raw bytes are normalized later
+    path, start, end = split
+    if engine == 'bytes' and tokenizer.bytes_native and not detect_wide_encoding(path):
+        if is_compressed(path):
+            for batch in read_compressed_batches(path):
+                yield from tokenizer.scan_bytes(batch)
+        elif end > start:
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield from tokenizer.scan_bytes(mm, start, end)
+    elif is_compressed(path):
+        for batch in read_compressed_batches(path):
+            yield from tokenizer.tokenize(decode_split(batch, split), filter_stopwords=False)
+    else:
+        yield from tokenizer.tokenize(read_split(split), filter_stopwords=False)
+
+def encode_tokens(tokens):
+    """
+    Per-task vocabulary: each distinct token gets the next id, in order of
+    first appearance. The only per-token Python work is one dict.setdefault
+    (recording the position of the first occurrence); the positions are then
+    turned into dense ids with a vectorized lookup.
+    """
+    vocab = {}
+    positions = np.fromiter(map(vocab.setdefault, tokens, count()), dtype=np.int64)
+    first_positions = np.fromiter(vocab.values(), dtype=np.int64, count=len(vocab))
+    lookup = np.empty(len(positions), dtype=np.int64)
+    lookup[first_positions] = np.arange(len(vocab))
+    return list(vocab), lookup[positions]
+
+def compact_counts(counts):
+    # Smallest unsigned dtype that holds the largest count, to keep the pickled result small
+    return counts.astype(np.min_scalar_type(int(counts.max()))) if len(counts) else counts
+
+def vectorized_split_mapper(split, engine='text', combine=True, tokenizer=None):
+    """
+    Map one split to word ids with a per-task vocabulary. With the combiner
+    the ids are counted in the worker with np.bincount, so only one small
+    integer per distinct word crosses the process boundary.
+    """
+    tokenizer = tokenizer or tokenizer_from_env()
+    vocab, ids = encode_tokens(split_tokens(split, engine, tokenizer))
+    if vocab and isinstance(vocab[0], bytes):
+        # Case variants stay separate ids here and are summed by the reducer
+        decoded = tokenizer.decode_tokens(vocab)
+        vocab = [tokenizer.normalize(decoded[token]) for token in vocab]
+    # Stopwords keep their vocabulary entries but count zero, and the reducer drops them
+    stopword_ids = [word_id for word_id, word in enumerate(vocab) if word in tokenizer.stopwords]
+    if combine:
+        counts = np.bincount(ids, minlength=len(vocab))
+        counts[stopword_ids] = 0
+        return WordIdTable(vocab, counts=compact_counts(counts))
+    if stopword_ids:
+        ids = ids[~np.isin(ids, stopword_ids)]
+    return WordIdTable(vocab, ids=compact_counts(ids))
+
+def reduce_word_id_tables(tables):
+    """
+    Shuffle and reduce NumPy map outputs in one step: the per-task
+    vocabularies are merged once into global ids, and all counts are then
+    summed with a single np.add.at over the concatenated arrays.
+    """
+    global_ids = {}
+    remaps = []
+    counts = []
+    for table in tables:
+        if not len(table.vocab):
+            continue
+        remaps.append(np.fromiter((global_ids.setdefault(word, len(global_ids)) for word in table.vocab), dtype=np.int64, count=len(table.vocab)))
+        counts.append(table.totals())
+    if not global_ids:
+        return {}
+    totals = np.zeros(len(global_ids), dtype=np.int64)
+    np.add.at(totals, np.concatenate(remaps), np.concatenate(counts))
+    return {word: total for word, total in zip(global_ids, totals.tolist()) if total}